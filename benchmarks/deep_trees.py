@@ -0,0 +1,128 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Benchmark the fused preprocessing of deeply nested behavior trees.
+
+Builds statements assigning a long chain of binary or concat operations and
+preprocesses them with the recursive transformation functions of
+:mod:`m2isar.metamodel.utils.fused_preprocessor`, with the recursion limit
+raised as far as needed, and with the non-recursive traversal hooks of
+:mod:`m2isar.metamodel.utils.fused_traversal`. Reports the time per node of
+both, and checks that both give the same results as the default path, which
+falls back to the traversal hooks for trees too deep for the recursion limit.
+"""
+
+import argparse
+import gc
+import sys
+import time
+
+from m2isar.metamodel import arch, behav
+from m2isar.metamodel.structural import StructuralHasher
+from m2isar.metamodel.utils import fused_preprocessor, fused_traversal
+
+_MEM = arch.Memory("X", arch.RangeSpec(31, 0), 32, {})
+
+def _reference(idx: int) -> behav.IndexedReference:
+	return behav.IndexedReference(_MEM, behav.IntLiteral(idx), None)
+
+def tree(depth: int, kind: str) -> behav.Operation:
+	"""Build an operation assigning a chain of `depth` operations of `kind`."""
+
+	node = _reference(1)
+	for idx in range(depth):
+		if kind == "binary":
+			node = behav.BinaryOperation(node, behav.Operator("^"), _reference(idx % 32))
+		else:
+			node = behav.ConcatOperation(node, _reference(idx % 32))
+
+	return behav.Operation([behav.Assignment(_reference(2), node)])
+
+def node_count(depth: int) -> int:
+	"""Number of nodes of a tree built by :func:`tree`."""
+
+	return 6 + 3 * depth
+
+def _recursive(operation):
+	return fused_preprocessor.preprocess(operation)
+
+def _traversal(operation):
+	stmt = fused_traversal.process(operation.statements[0], fused_preprocessor.FusedContext())
+	operation.statements = [stmt[0]]
+	return operation, stmt[1], operation, stmt[3]
+
+def _summary(result, limit: int) -> tuple:
+	# hashing recurses as well
+	old_limit = sys.getrecursionlimit()
+	sys.setrecursionlimit(max(old_limit, limit))
+	try:
+		return StructuralHasher().hash(result[0]), result[1], result[3]
+	finally:
+		sys.setrecursionlimit(old_limit)
+
+def check(depth: int, kind: str):
+	"""Check that recursion, the traversal hooks and the default path give the same results."""
+
+	limit = sys.getrecursionlimit()
+	deep_limit = max(limit, 4 * depth + 200)
+
+	default = _summary(_recursive(tree(depth, kind)), deep_limit)
+	traversal = _summary(_traversal(tree(depth, kind)), deep_limit)
+
+	sys.setrecursionlimit(deep_limit)
+	try:
+		recursive = _summary(_recursive(tree(depth, kind)), deep_limit)
+	finally:
+		sys.setrecursionlimit(limit)
+
+	assert default == recursive == traversal, f"results for {kind} depth {depth} differ"
+
+def measure(fn, depth: int, kind: str, runs: int) -> float:
+	"""Return the best time per node of `fn` in nanoseconds."""
+
+	nodes = node_count(depth)
+	reps = max(3, 200000 // nodes)
+	best = None
+
+	for _ in range(runs):
+		trees = [tree(depth, kind) for _ in range(reps)]
+		gc.collect()
+		start = time.perf_counter()
+		for operation in trees:
+			fn(operation)
+		duration = (time.perf_counter() - start) / reps
+		best = duration if best is None else min(best, duration)
+
+	return best / nodes * 1e9
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--depths", type=int, nargs="+", default=[50, 400, 2000, 10000], help="Chain lengths to measure.")
+	parser.add_argument("--runs", type=int, default=5, help="Number of timed runs per measurement.")
+	args = parser.parse_args()
+
+	limit = sys.getrecursionlimit()
+
+	for kind in ("binary", "concat"):
+		for depth in args.depths:
+			check(depth, kind)
+
+			sys.setrecursionlimit(max(limit, 4 * depth + 200))
+			try:
+				recursive = measure(_recursive, depth, kind, args.runs)
+			finally:
+				sys.setrecursionlimit(limit)
+
+			traversal = measure(_traversal, depth, kind, args.runs)
+			default = measure(_recursive, depth, kind, args.runs)
+
+			print(f"{kind:6s} depth {depth:6d}: recursive {recursive:5.0f} ns/node, traversal {traversal:5.0f} ns/node, "
+				f"default {default:5.0f} ns/node")
+
+if __name__ == "__main__":
+	main()
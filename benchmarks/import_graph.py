@@ -0,0 +1,74 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Benchmark import resolution of the CoreDSL 2 frontend on a synthetic import graph.
+
+The graph has `levels` levels of `width` files each. Every file imports all files of
+the next level, the top level file imports all files of the first level. Each file
+contains a small instruction set, so that parsing is cheap and the time is spent in
+resolving imports. Parse trees are read from a warm parse cache.
+"""
+
+import argparse
+import pathlib
+import tempfile
+import time
+
+from m2isar.frontends.coredsl2.importer import recursive_import
+from m2isar.frontends.coredsl2.parse_cache import ParseCache
+from m2isar.frontends.coredsl2.utils import parse_file
+
+
+def generate(path: pathlib.Path, levels: int, width: int) -> pathlib.Path:
+	"""Write the synthetic import graph to `path`, return the top level file."""
+
+	def imports(level):
+		if level >= levels:
+			return ""
+		return "".join(f'import "f_{level}_{idx}.core_desc"\n' for idx in range(width))
+
+	for level in range(levels):
+		for idx in range(width):
+			with open(path / f"f_{level}_{idx}.core_desc", "w", encoding="utf-8") as f:
+				f.write(imports(level + 1))
+				f.write(f"InstructionSet S_{level}_{idx} {{ architectural_state {{ unsigned int C_{level}_{idx} = 1; }} }}\n")
+
+	top_level = path / "top.core_desc"
+	with open(top_level, "w", encoding="utf-8") as f:
+		f.write(imports(0))
+		f.write("InstructionSet Top { architectural_state { unsigned int C = 1; } }\n")
+
+	return top_level
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--levels", type=int, default=30, help="Number of import levels.")
+	parser.add_argument("--width", type=int, default=30, help="Number of files per level.")
+	parser.add_argument("--runs", type=int, default=3, help="Number of timed runs.")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		tmp = pathlib.Path(tmp)
+		model_path = tmp / "model"
+		model_path.mkdir()
+		top_level = generate(model_path, args.levels, args.width)
+		cache = ParseCache(tmp / "cache")
+
+		# the first run fills the parse cache
+		for run in range(args.runs + 1):
+			tree = parse_file(top_level, cache)
+
+			start = time.perf_counter()
+			recursive_import(tree, model_path, cache)
+			duration = time.perf_counter() - start
+
+			if run > 0:
+				print(f"run {run}: {duration:.3f} s, {len(tree.imports)} import statements, {len(tree.definitions)} definitions")
+
+if __name__ == "__main__":
+	main()
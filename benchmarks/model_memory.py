@@ -0,0 +1,80 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Benchmark run time and peak memory of the CoreDSL 2 parser and the ETISS writer.
+
+Builds a model from the given CoreDSL 2 file, or from a generated core, and
+generates ETISS code from it. Both tools run in their own process, the peak
+resident set size of each is read from its resource usage.
+"""
+
+import argparse
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from .two_stage_parsing import generate as generate_instructions
+
+def generate(path: pathlib.Path, instructions: int) -> pathlib.Path:
+	"""Write a core with an instruction set of `instructions` instructions to `path`."""
+
+	filename = generate_instructions(path, instructions)
+
+	with open(filename, "a", encoding="utf-8") as f:
+		f.write("\nCore SyntheticCore provides Synthetic {\n}\n")
+
+	return filename
+
+def measure(args: "list[str]") -> "tuple[float, int]":
+	"""Run `python -m <args>`, return its run time in seconds and its peak RSS in KiB."""
+
+	start = time.perf_counter()
+	proc = subprocess.Popen([sys.executable, "-m"] + args + ["--log", "error"])
+	_, status, rusage = os.wait4(proc.pid, 0)
+	duration = time.perf_counter() - start
+	proc.returncode = os.waitstatus_to_exitcode(status)
+
+	if proc.returncode != 0:
+		raise subprocess.CalledProcessError(proc.returncode, args)
+
+	return duration, rusage.ru_maxrss
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("top_level", nargs="?", help="CoreDSL 2 file to build, instead of a generated core.")
+	parser.add_argument("--instructions", type=int, default=2000, help="Number of instructions of the generated core.")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		tmp = pathlib.Path(tmp)
+
+		if args.top_level is None:
+			top_level = generate(tmp, args.instructions)
+		else:
+			# copy the whole directory, to keep imports and existing outputs apart
+			top_level = pathlib.Path(args.top_level)
+			shutil.copytree(top_level.parent, tmp / "src")
+			top_level = tmp / "src" / top_level.name
+
+		model_path = top_level.parent / "gen_model" / f"{top_level.stem}.m2isarmodel"
+
+		for name, tool_args in (
+			("parser", ["m2isar.frontends.coredsl2.parser", str(top_level), "--no-cache", "--force"]),
+			("etiss writer", ["m2isar.backends.etiss.writer", str(model_path), "--no-cache"]),
+		):
+			duration, max_rss = measure(tool_args)
+			print(f"{name}: {duration:.2f} s, peak RSS {max_rss / 1024:.1f} MiB")
+
+		print(f"model file: {model_path.stat().st_size / 1024:.1f} KiB")
+
+if __name__ == "__main__":
+	main()
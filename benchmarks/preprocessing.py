@@ -0,0 +1,96 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Benchmark the fused behavior preprocessing against the sequential passes.
+
+Preprocesses the functions and instructions of the given model files, or of a
+model built from a generated core, once with the fused preprocessor and once
+with the separate simplification and analysis passes. Before timing, the
+results of both are checked to be identical.
+"""
+
+import argparse
+import gc
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+from m2isar.metamodel.model_file import load_model
+from m2isar.metamodel.structural import StructuralHasher
+from m2isar.metamodel.utils.expr_preprocessor import (process_functions,
+                                                      process_instructions)
+
+from .model_memory import generate
+
+def _load(path: pathlib.Path):
+	"""Load all cores of `path` and decode their behavior, so that decoding is not timed."""
+
+	models = load_model(path)
+	for core in models.values():
+		for instr_def in core.instructions.values():
+			instr_def.operation # pylint: disable=pointless-statement
+		for fn_def in core.functions.values():
+			fn_def.operation # pylint: disable=pointless-statement
+
+	return models
+
+def run(path: pathlib.Path, fused: bool) -> "tuple[dict, float]":
+	"""Preprocess all cores of `path`, return a comparable summary of the results
+	and the time taken.
+	"""
+
+	models = _load(path)
+	gc.collect()
+
+	start = time.perf_counter()
+	for core in models.values():
+		process_functions(core, fused)
+		process_instructions(core, fused)
+	duration = time.perf_counter() - start
+
+	hasher = StructuralHasher()
+	results = {}
+	for core_name, core in models.items():
+		functions = {name: (fn_def.throws, fn_def.static, hasher.hash(fn_def.operation))
+			for name, fn_def in core.functions.items()}
+		instructions = {name: (instr_def.throws, hasher.hash(instr_def.operation))
+			for name, instr_def in core.instructions.items()}
+		results[core_name] = (functions, instructions)
+
+	return results, duration
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("models", nargs="*", type=pathlib.Path, help="Model files to preprocess, instead of a generated core.")
+	parser.add_argument("--instructions", type=int, default=2000, help="Number of instructions of the generated core.")
+	parser.add_argument("--runs", type=int, default=5, help="Number of timed runs per mode.")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		models = args.models
+		if not models:
+			top_level = generate(pathlib.Path(tmp), args.instructions)
+			subprocess.run([sys.executable, "-m", "m2isar.frontends.coredsl2.parser", str(top_level), "--no-cache", "--log", "error"], check=True)
+			models = [top_level.parent / "gen_model" / f"{top_level.stem}.m2isarmodel"]
+
+		for path in models:
+			sequential, _ = run(path, False)
+			fused, _ = run(path, True)
+			assert sequential == fused, f"fused preprocessing of {path} differs from the sequential passes"
+
+			times = {"sequential": [], "fused": []}
+			for _ in range(args.runs):
+				times["sequential"].append(run(path, False)[1])
+				times["fused"].append(run(path, True)[1])
+
+			print(f"{path.name}: " + ", ".join(f"{mode} {min(t):.3f}-{max(t):.3f} s" for mode, t in times.items()))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,126 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Benchmark two-stage SLL/LL parsing of the CoreDSL 2 frontend against plain LL parsing.
+
+Parses the given CoreDSL 2 files, or a generated instruction set, in both modes.
+Each measurement runs in a fresh process, as the ANTLR runtime caches prediction
+results per process. Before timing, the parse trees of both modes are checked to
+be identical, including the fallback from the SLL to the LL stage.
+"""
+
+import argparse
+import multiprocessing
+import pathlib
+import tempfile
+import time
+
+from antlr4.error.Errors import ParseCancellationException
+
+from m2isar import M2SyntaxError
+from m2isar.frontends.coredsl2.parser_gen import CoreDSL2Parser
+from m2isar.frontends.coredsl2.utils import (make_parser, parse_description,
+                                             set_ll_mode)
+
+_BEHAVIORS = (
+	"if (rd != 0) X[rd] = X[rs1] + X[rs2];",
+	"if ((rd % RFS) != 0) X[rd % RFS] = (unsigned<XLEN>)((signed<XLEN>)X[rs1 % RFS] >> (X[rs2 % RFS] & (XLEN - 1)));",
+	"{ signed<XLEN> res = X[rs1] < X[rs2] ? 1 : 0; if (rd != 0) X[rd] = res; else if (rs1 == 0) PC = PC + 4; else { X[1] = res[7:0] :: res[15:8]; } }",
+	"{ unsigned<33> tmp = X[rs1] + (signed<XLEN>)X[rs2]; switch (tmp[1:0]) { case 0: X[rd] = MEM[tmp]; break; default: X[rd] = 0; } }",
+)
+
+def generate(path: pathlib.Path, instructions: int) -> pathlib.Path:
+	"""Write an instruction set with `instructions` instructions to `path`."""
+
+	# the encodings are unique for up to 2**14 instructions
+	assert instructions <= 1 << 14, "too many instructions"
+
+	filename = path / "synthetic.core_desc"
+
+	with open(filename, "w", encoding="utf-8") as f:
+		f.write("InstructionSet Synthetic {\n\tarchitectural_state {\n\t\tunsigned int XLEN = 32;\n\t\tunsigned int RFS = 32;\n")
+		f.write("\t\tregister unsigned<XLEN> X[RFS] [[is_main_reg]];\n\t\tregister unsigned<XLEN> PC [[is_pc]];\n\t\textern char MEM[1 << XLEN];\n\t}\n\n")
+		f.write("\tinstructions {\n")
+		for idx in range(instructions):
+			f.write(f"\t\tI{idx} {{\n\t\t\tencoding: 7'd{idx >> 7} :: rs2[4:0] :: rs1[4:0] :: 3'd0 :: rd[4:0] :: 7'd{idx & 127};\n")
+			f.write(f"\t\t\tassembly: \"{{name(rd)}}, {{name(rs1)}}, {{name(rs2)}}\";\n")
+			f.write(f"\t\t\tbehavior: {_BEHAVIORS[idx % len(_BEHAVIORS)]}\n\t\t}}\n")
+		f.write("\t}\n}\n")
+
+	return filename
+
+def _tree_text(tree) -> str:
+	return tree.toStringTree(ruleNames=CoreDSL2Parser.ruleNames)
+
+def _parse_error(filename, two_stage: bool) -> str:
+	try:
+		parse_description(filename, two_stage)
+	except M2SyntaxError as e:
+		return str(e)
+	return None
+
+def check(filenames: "list[pathlib.Path]", tmp: pathlib.Path):
+	"""Check that two-stage parsing gives the same results as plain LL parsing."""
+
+	for filename in filenames:
+		assert _tree_text(parse_description(filename, True)) == _tree_text(parse_description(filename, False)), \
+			f"two-stage parse tree of {filename} differs"
+
+		# Cancel the SLL stage on valid input and fall back like parse_description does. SLL
+		# prediction does not fail on any valid description for the current grammar, the
+		# first stage is therefore cancelled by starting with a rule which can not match
+		# the start of a description.
+		parser = make_parser(filename, sll=True)
+		try:
+			parser.block()
+			raise AssertionError(f"SLL stage of {filename} was not cancelled")
+		except ParseCancellationException:
+			set_ll_mode(parser, filename)
+
+		assert _tree_text(parser.description_content()) == _tree_text(parse_description(filename, False)), \
+			f"parse tree of {filename} after fallback to LL differs"
+
+	# on a syntax error the SLL stage fails, the LL stage has to report the same error
+	broken = tmp / "broken.core_desc"
+	broken.write_text("InstructionSet Broken { instructions { I { encoding: 0b0; behavior: X[rd] = X[rd] +; } } }\n", encoding="utf-8")
+
+	error = _parse_error(broken, False)
+	assert error is not None and _parse_error(broken, True) == error, "two-stage parsing reports a different syntax error"
+
+def _timed_parse(filename, two_stage: bool) -> float:
+	start = time.perf_counter()
+	parse_description(filename, two_stage)
+	return time.perf_counter() - start
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("files", nargs="*", type=pathlib.Path, help="CoreDSL 2 files to parse, a generated instruction set if none are given.")
+	parser.add_argument("--instructions", type=int, default=300, help="Number of instructions of the generated instruction set.")
+	parser.add_argument("--runs", type=int, default=3, help="Number of timed runs per mode.")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		tmp = pathlib.Path(tmp)
+		filenames = args.files or [generate(tmp, args.instructions)]
+
+		check(filenames, tmp)
+		print("parse trees of two-stage and LL parsing are identical")
+
+		ctx = multiprocessing.get_context("spawn")
+
+		for filename in filenames:
+			for name, two_stage in (("LL", False), ("two-stage", True)):
+				times = []
+				for _ in range(args.runs):
+					with ctx.Pool(1) as pool:
+						times.append(pool.apply(_timed_parse, (filename, two_stage)))
+
+				print(f"{filename.name} {name:9s}: {min(times):.3f} - {max(times):.3f} s")
+
+if __name__ == "__main__":
+	main()
@@ -13,11 +13,11 @@ actively maintained, might break or otherwise not work as expected.
 import argparse
 import logging
 import pathlib
-import pickle
 from collections import defaultdict
 from io import SEEK_CUR
 
 from ...metamodel import arch
+from ...metamodel.model_file import load_model
 
 logger = logging.getLogger("viewer")
 
@@ -92,8 +92,7 @@ def main():
 
 	logger.info("loading models")
 
-	with open(model_fname, 'rb') as f:
-		models: "dict[str, arch.CoreDef]" = pickle.load(f)
+	models: "dict[str, arch.CoreDef]" = load_model(model_fname, [args.core_name])
 
 	core = models[args.core_name]
 	readlen = max(core.instr_classes) // 8
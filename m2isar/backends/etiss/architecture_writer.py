@@ -11,14 +11,13 @@
 import logging
 import pathlib
 
-from mako.template import Template
-
 from ... import M2TypeError
 from ...metamodel import arch, behav
 from . import BlockEndType
 from .instruction_generator import (generate_fields,
                                     generate_instruction_callback)
-from .templates import template_dir
+from .instruction_writer import instruction_shard_files
+from .templates import get_template
 
 logger = logging.getLogger("arch_writer")
 
@@ -46,7 +45,7 @@ def write_child_reg_def(reg: arch.Memory, regs: "list[str]"):
 		regs.append(f"etiss_uint{reg.actual_size} {reg.name}{array_txt}")
 
 def write_arch_struct(core: arch.CoreDef, start_time: str, output_path: pathlib.Path):
-	arch_struct_template = Template(filename=str(template_dir/'etiss_arch_struct.mako'))
+	arch_struct_template = get_template('etiss_arch_struct.mako')
 	regs = []
 
 	logger.info("writing architecture struct")
@@ -64,7 +63,7 @@ def write_arch_struct(core: arch.CoreDef, start_time: str, output_path: pathlib.
 		f.write(txt)
 
 def write_arch_header(core: arch.CoreDef, start_time: str, output_path: pathlib.Path):
-	arch_header_template = Template(filename=str(template_dir/'etiss_arch_h.mako'))
+	arch_header_template = get_template('etiss_arch_h.mako')
 
 	logger.info("writing architecture class header")
 
@@ -105,7 +104,7 @@ def build_reg_hierarchy(reg: arch.Memory, ptr_regs: "list[arch.Memory]", actual_
 def write_arch_cpp(core: arch.CoreDef, start_time: str, output_path: pathlib.Path, aliased_regnames: bool=True):
 	"""Generate {CoreName}Arch.cpp file. Contains mainly register initialization code."""
 
-	arch_header_template = Template(filename=str(template_dir/'etiss_arch_cpp.mako'))
+	arch_header_template = get_template('etiss_arch_cpp.mako')
 
 	ptr_regs = []
 	actual_regs = []
@@ -144,7 +143,7 @@ def write_arch_cpp(core: arch.CoreDef, start_time: str, output_path: pathlib.Pat
 		f.write(txt)
 
 def write_arch_lib(core: arch.CoreDef, start_time: str, output_path: pathlib.Path):
-	arch_header_template = Template(filename=str(template_dir/'etiss_arch_lib.mako'))
+	arch_header_template = get_template('etiss_arch_lib.mako')
 
 	logger.info("writing architecture lib")
 
@@ -157,7 +156,7 @@ def write_arch_lib(core: arch.CoreDef, start_time: str, output_path: pathlib.Pat
 		f.write(txt)
 
 def write_arch_specific_header(core: arch.CoreDef, start_time: str, output_path: pathlib.Path):
-	arch_header_template = Template(filename=str(template_dir/'etiss_arch_specific_h.mako'))
+	arch_header_template = get_template('etiss_arch_specific_h.mako')
 
 	logger.info("writing architecture specific header")
 
@@ -171,7 +170,7 @@ def write_arch_specific_header(core: arch.CoreDef, start_time: str, output_path:
 		f.write(txt)
 
 def write_arch_specific_cpp(core: arch.CoreDef, start_time: str, output_path: pathlib.Path):
-	arch_header_template = Template(filename=str(template_dir/'etiss_arch_specific_cpp.mako'))
+	arch_header_template = get_template('etiss_arch_specific_cpp.mako')
 
 	error_fn = None
 
@@ -227,7 +226,7 @@ def write_arch_specific_cpp(core: arch.CoreDef, start_time: str, output_path: pa
 		f.write(txt)
 
 def write_arch_gdbcore(core: arch.CoreDef, start_time: str, output_path: pathlib.Path):
-	arch_header_template = Template(filename=str(template_dir/'etiss_arch_gdbcore.mako'))
+	arch_header_template = get_template('etiss_arch_gdbcore.mako')
 
 	logger.info("writing gdbcore")
 
@@ -240,16 +239,20 @@ def write_arch_gdbcore(core: arch.CoreDef, start_time: str, output_path: pathlib
 	with open(output_path / f"{core.name}GDBCore.h", "w", encoding="utf-8") as f:
 		f.write(txt)
 
-def write_arch_cmake(core: arch.CoreDef, start_time: str, output_path: pathlib.Path, separate: bool):
-	arch_header_template = Template(filename=str(template_dir/'etiss_arch_cmake.mako'))
+def write_arch_cmake(core: arch.CoreDef, start_time: str, output_path: pathlib.Path, separate: bool, shards: int=0):
+	arch_header_template = get_template('etiss_arch_cmake.mako')
 
 	logger.info("writing CMakeLists")
 
 	arch_files = [f'{core.name}Instr.cpp']
 
+	# sharded instruction models replace both the default and the per extension files
+	if shards > 0:
+		arch_files = instruction_shard_files(core.name, shards)
+
 	# if generation of one instr.cpp per extension is desired, only generate extensions which actually
 	# contain instructions
-	if separate:
+	elif separate:
 		arch_files += [f'{core.name}_{ext_name}Instr.cpp' for ext_name in core.contributing_types if len(core.instructions_by_ext[ext_name]) > 0]
 
 	txt = arch_header_template.render(
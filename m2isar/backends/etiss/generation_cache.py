@@ -0,0 +1,142 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Persistent cache for generated function and instruction code.
+
+Each entry holds the code generated for one function or instruction, stored
+in a file named after its key. Keys are calculated from structural hashes, see
+:class:`~m2isar.metamodel.structural.StructuralHasher`, of
+
+* the preprocessed behavior, fields, encoding and attributes of the function or
+  instruction,
+* the environment of the core, i.e. its name, constants, memories, intrinsics
+  and the signatures of all functions,
+* the writer options influencing the generated code,
+* a digest of the m2isar version and the sources of the metamodel and of this
+  backend, including the templates.
+
+A cache hit therefore returns the same code as generating it again, without
+running :mod:`.instruction_transform`.
+"""
+
+import hashlib
+import logging
+import os
+import pathlib
+
+from ...metamodel import arch
+from ...metamodel.structural import StructuralHasher
+from .templates import _package_version
+
+logger = logging.getLogger("generation_cache")
+
+CACHE_FORMAT_VERSION = 1
+"""Increment this when the layout of cache entries changes."""
+
+_TOOL_SOURCES = ("__init__.py", "metamodel", "backends/etiss")
+"""Parts of the m2isar package which influence the generated code."""
+
+def default_cache_dir() -> pathlib.Path:
+	"""Return the default cache directory, honoring $XDG_CACHE_HOME."""
+
+	base = os.environ.get("XDG_CACHE_HOME")
+	base = pathlib.Path(base) if base else pathlib.Path.home() / ".cache"
+	return base / "m2isar" / "etiss"
+
+def tool_digest() -> str:
+	"""Return a digest of the m2isar version and the sources of the metamodel and
+	this backend, so that entries are invalidated by every change to the tool.
+	"""
+
+	root = pathlib.Path(__file__).parents[2]
+
+	h = hashlib.sha256()
+	h.update(str(CACHE_FORMAT_VERSION).encode())
+	h.update(_package_version("m2isar").encode())
+	h.update(_package_version("mako").encode())
+
+	for source in _TOOL_SOURCES:
+		path = root / source
+		files = sorted([*path.rglob("*.py"), *path.rglob("*.mako")]) if path.is_dir() else [path]
+		for file in files:
+			h.update(str(file.relative_to(root)).encode() + b"\0")
+			h.update(file.read_bytes())
+
+	return h.hexdigest()
+
+class GenerationCache:
+	"""On-disk cache of generated function and instruction code."""
+
+	def __init__(self, cache_dir: pathlib.Path) -> None:
+		self.cache_dir = pathlib.Path(cache_dir)
+		self.hits = 0
+		self.misses = 0
+		self._salt = tool_digest()
+
+	def core_keys(self, core: arch.CoreDef, options: dict) -> "tuple[dict[tuple[str, bool], str], dict[tuple[int, int], str]]":
+		"""Calculate the keys of all functions and instructions of `core`, generated
+		with the writer `options`. Returns a dict of (function name, declaration only) to
+		key and a dict of instruction (code, mask) to key.
+
+		Keys must be calculated before any code of `core` is generated, as code generation
+		modifies the behavior trees.
+		"""
+
+		hasher = StructuralHasher()
+
+		fn_signatures = [(fn_def.name, fn_def.size, fn_def.data_type, fn_def.extern, fn_def.static, fn_def.throws,
+			fn_def.attributes, fn_def.args) for fn_def in core.functions.values()]
+
+		env = hasher.hexdigest((self._salt, core.name, core.constants, core.memories, core.memory_aliases, core.intrinsics,
+			fn_signatures, sorted(options.items())))
+
+		fn_keys = {(fn_name, decls_only): hasher.hexdigest((env, "function", fn_name, decls_only, fn_def.operation))
+			for fn_name, fn_def in core.functions.items() for decls_only in (True, False)}
+
+		instr_keys = {(code, mask): hasher.hexdigest((env, "instruction", code, mask, instr_def.name, instr_def.ext_name,
+			instr_def.encoding, instr_def.fields, instr_def.attributes, instr_def.throws, instr_def.operation))
+			for (code, mask), instr_def in core.instructions.items()}
+
+		return fn_keys, instr_keys
+
+	def _path(self, key: str) -> pathlib.Path:
+		return self.cache_dir / key[:2] / f"{key}.txt"
+
+	def load(self, key: str) -> "str | None":
+		"""Return the cached code for `key` or None, if there is no usable entry."""
+
+		try:
+			with open(self._path(key), "r", encoding="utf-8", newline="") as f:
+				code = f.read()
+		except FileNotFoundError:
+			self.misses += 1
+			return None
+		except (OSError, UnicodeDecodeError) as e:
+			logger.warning("discarding unreadable cache entry %s: %s", key, e)
+			self.misses += 1
+			return None
+
+		self.hits += 1
+		return code
+
+	def store(self, key: str, code: str):
+		"""Store the generated `code` for `key`. Failing to store an entry is not an
+		error, it only costs performance on the next run.
+		"""
+
+		path = self._path(key)
+		tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+
+		try:
+			path.parent.mkdir(parents=True, exist_ok=True)
+			with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+				f.write(code)
+			os.replace(tmp_path, path)
+		except OSError as e:
+			logger.warning("could not write cache entry %s: %s", key, e)
+			tmp_path.unlink(missing_ok=True)
@@ -8,83 +8,175 @@
 
 """Functions for generating function and instruction behavior."""
 
+import gc
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from typing import TYPE_CHECKING
 
-from mako.template import Template
-
-from ...metamodel import arch, behav, patch_model
+from ...metamodel import arch, behav
+from ...metamodel.passes import get_pass
 from . import BlockEndType, instruction_transform, instruction_utils
-from .templates import template_dir
+from .templates import get_template
 
 if TYPE_CHECKING:
+	from .generation_cache import GenerationCache
 	from .instruction_utils import CodePartsContainer
 
 logger = logging.getLogger("instruction_generator")
 
+_pool_state = None
+"""Core and options of the current parallel generation, inherited by forked workers."""
+
+def parallel_map(worker, state: tuple, items: list, jobs: int):
+	"""Apply `worker` to all `items` in `jobs` forked worker processes, yield the
+	results in the order of `items` as soon as they are available. Workers inherit
+	`state` through the module variable :data:`_pool_state`. Without the fork start
+	method, all items are processed in this process.
+	"""
+
+	global _pool_state # pylint: disable=global-statement
+
+	if len(items) < 2:
+		yield from _local_map(worker, state, items)
+		return
+
+	if "fork" not in multiprocessing.get_all_start_methods():
+		logger.warning("parallel code generation needs the fork start method, generating sequentially")
+		yield from _local_map(worker, state, items)
+		return
+
+	_pool_state = state
+
+	logger.debug("generating %d items in %d processes", len(items), jobs)
+
+	# keep the garbage collector of the workers away from the inherited objects,
+	# which would otherwise be copied into each worker when touched
+	gc.freeze()
+	try:
+		with ProcessPoolExecutor(jobs, multiprocessing.get_context("fork")) as pool:
+			yield from pool.map(worker, items, chunksize=max(1, len(items) // (jobs * 4)))
+	finally:
+		gc.unfreeze()
+		_pool_state = None
+
+def cached_map(worker, state: tuple, items: list, jobs: int, cache: "GenerationCache", keys: dict, cached_result):
+	"""Apply `worker` to all `items` like :func:`parallel_map`, or in this process if
+	`jobs` is 1. The last element of each result tuple is the generated code. If
+	`cache` is given, the code for items with an entry for their key in `keys` is
+	loaded from it instead and turned into a result by `cached_result(item, code)`,
+	generated code is stored.
+	"""
+
+	if cache is None:
+		cached = [None] * len(items)
+	else:
+		cached = [cache.load(keys[item]) for item in items]
+
+	missing = [item for item, code in zip(items, cached) if code is None]
+
+	if jobs > 1:
+		generated = parallel_map(worker, state, missing, jobs)
+	else:
+		generated = _local_map(worker, state, missing)
+
+	for item, code in zip(items, cached):
+		if code is not None:
+			yield cached_result(item, code)
+			continue
+
+		result = next(generated)
+		if cache is not None:
+			cache.store(keys[item], result[-1])
+		yield result
+
+def _local_map(worker, state: tuple, items: list):
+	global _pool_state # pylint: disable=global-statement
+
+	_pool_state = state
+	try:
+		yield from map(worker, items)
+	finally:
+		_pool_state = None
+
 def generate_arg_str(arg: arch.FnParam):
 	arg_name = f" {arg.name}" if arg.name is not None else ""
 	return f'{instruction_utils.data_type_map[arg.data_type]}{arg.actual_size}{arg_name}'
 
-def generate_functions(core: arch.CoreDef, static_scalars: bool, decls_only: bool):
+def generate_functions(core: arch.CoreDef, static_scalars: bool, decls_only: bool, jobs: int=1,
+	cache: "GenerationCache"=None, keys: dict=None):
 	"""Return a generator object to generate function behavior code. Uses function
-	definitions in the core object.
+	definitions in the core object. With `jobs` > 1, the code is generated in a pool
+	of worker processes, see :func:`parallel_map`. With a `cache` and the `keys` of
+	:meth:`GenerationCache.core_keys`, cached code is reused, see :func:`cached_map`.
+	"""
+
+	fn_names = [fn_name for fn_name, fn_def in core.functions.items() if decls_only or not fn_def.extern]
+
+	yield from cached_map(_function_worker, (core, static_scalars, decls_only), fn_names, jobs, cache,
+		keys and {fn_name: keys[(fn_name, decls_only)] for fn_name in fn_names}, lambda fn_name, code: (fn_name, code))
+
+def _function_worker(fn_name):
+	core, static_scalars, decls_only = _pool_state
+	return generate_function(core, fn_name, static_scalars, decls_only)
+
+def generate_function(core: arch.CoreDef, fn_name: str, static_scalars: bool, decls_only: bool):
+	"""Generate the code of function `fn_name` of `core`, return a tuple of the
+	function name and the code.
 	"""
 
 	# load the instruction_transform generators
-	patch_model(instruction_transform)
+	transformer = get_pass(instruction_transform)
 
-	fn_template = Template(filename=str(template_dir/'etiss_function.mako'))
+	fn_template = get_template('etiss_function.mako')
 
 	core_default_width = core.constants['XLEN'].value
 	core_name = core.name
 
-	for fn_name, fn_def in core.functions.items():
-		logger.debug("setting up function generator for %s", fn_name)
+	fn_def = core.functions[fn_name]
 
-		if fn_def.extern and not decls_only:
-			continue
+	logger.debug("setting up function generator for %s", fn_name)
 
-		return_type = instruction_utils.data_type_map[fn_def.data_type]
-		if fn_def.size:
-			return_type += f'{fn_def.actual_size}'
+	return_type = instruction_utils.data_type_map[fn_def.data_type]
+	if fn_def.size:
+		return_type += f'{fn_def.actual_size}'
 
-		# set up a transformer context and generate code
-		context = instruction_utils.TransformerContext(core.constants, core.memories, core.memory_aliases, fn_def.args, fn_def.attributes,
-			core.functions, 0, core_default_width, core_name, static_scalars, core.intrinsics, True)
+	# set up a transformer context and generate code
+	context = instruction_utils.TransformerContext(core.constants, core.memories, core.memory_aliases, fn_def.args, fn_def.attributes,
+		core.functions, 0, core_default_width, core_name, static_scalars, core.intrinsics, True)
 
-		logger.debug("generating code for %s", fn_name)
+	logger.debug("generating code for %s", fn_name)
 
-		out_code = instruction_utils.CodePartsContainer()
+	out_code = instruction_utils.CodePartsContainer()
 
-		if not decls_only:
-			out_code = fn_def.operation.generate(context)
-			out_code.format(ARCH_NAME=core_name)
+	if not decls_only:
+		out_code = transformer.run(fn_def.operation, context)
+		out_code.format(ARCH_NAME=core_name)
 
-		#fn_def.static = not context.used_arch_data
+	#fn_def.static = not context.used_arch_data
 
-		logger.debug("generating header for %s", fn_name)
+	logger.debug("generating header for %s", fn_name)
 
-		args_list = [generate_arg_str(arg) for arg in fn_def.args.values()]
+	args_list = [generate_arg_str(arg) for arg in fn_def.args.values()]
 
-		# if function needs access to ETISS architecture data, add these as arguments to the function
-		if arch.FunctionAttribute.ETISS_NEEDS_ARCH in fn_def.attributes or (not fn_def.extern and not fn_def.static):
-			args_list = ['ETISS_CPU * const cpu', 'ETISS_System * const system', 'void * const * const plugin_pointers'] + args_list
+	# if function needs access to ETISS architecture data, add these as arguments to the function
+	if arch.FunctionAttribute.ETISS_NEEDS_ARCH in fn_def.attributes or (not fn_def.extern and not fn_def.static):
+		args_list = ['ETISS_CPU * const cpu', 'ETISS_System * const system', 'void * const * const plugin_pointers'] + args_list
 
-		fn_args = ', '.join(args_list)
+	fn_args = ', '.join(args_list)
 
-		logger.debug("rendering template for %s", fn_name)
+	logger.debug("rendering template for %s", fn_name)
 
-		templ_str = fn_template.render(
-			return_type=return_type,
-			fn_name=fn_name,
-			args_list=fn_args,
-			static=fn_def.static,
-			extern=fn_def.extern,
-			operation=out_code.initial_required
-		)
+	templ_str = fn_template.render(
+		return_type=return_type,
+		fn_name=fn_name,
+		args_list=fn_args,
+		static=fn_def.static,
+		extern=fn_def.extern,
+		operation=out_code.initial_required
+	)
 
-		yield (fn_name, templ_str)
+	return (fn_name, templ_str)
 
 def generate_fields(core_default_width, instr_def: arch.Instruction):
 	"""Generate the extraction code for all fields of an instr_def"""
@@ -143,7 +235,7 @@ def generate_fields(core_default_width, instr_def: arch.Instruction):
 	return (fields_code, asm_printer_code, seen_fields, enc_idx)
 
 def generate_instruction_callback(core: arch.CoreDef, instr_def: arch.Instruction, fields, static_scalars: bool, block_end_on: BlockEndType):
-	patch_model(instruction_transform)
+	transformer = get_pass(instruction_transform)
 
 	instr_name = instr_def.name
 	core_name = core.name
@@ -151,7 +243,7 @@ def generate_instruction_callback(core: arch.CoreDef, instr_def: arch.Instructio
 	core_default_width = core.constants['XLEN'].value
 	fields_code, _, _, enc_idx = fields
 
-	callback_template = Template(filename=str(template_dir/'etiss_instruction_callback.mako'))
+	callback_template = get_template('etiss_instruction_callback.mako')
 
 	context = instruction_utils.TransformerContext(core.constants, core.memories, core.memory_aliases, instr_def.fields, instr_def.attributes,
 		core.functions, enc_idx, core_default_width, core_name, static_scalars, core.intrinsics)
@@ -165,7 +257,7 @@ def generate_instruction_callback(core: arch.CoreDef, instr_def: arch.Instructio
 	# generate instruction behavior code
 	logger.debug("generating behavior code for %s", instr_def.name)
 
-	out_code = instr_def.operation.generate(context)
+	out_code = transformer.run(instr_def.operation, context)
 	out_code.format(ARCH_NAME=core_name)
 
 	logger.debug("rendering template for %s", instr_def.name)
@@ -182,63 +274,84 @@ def generate_instruction_callback(core: arch.CoreDef, instr_def: arch.Instructio
 
 	return callback_str
 
-def generate_instructions(core: arch.CoreDef, static_scalars: bool, block_end_on: BlockEndType):
+def generate_instructions(core: arch.CoreDef, static_scalars: bool, block_end_on: BlockEndType, jobs: int=1,
+	cache: "GenerationCache"=None, keys: dict=None):
 	"""Return a generator object to generate instruction behavior code. Uses instruction
-	definitions in the core object.
+	definitions in the core object. With `jobs` > 1, the code is generated in a pool
+	of worker processes, see :func:`parallel_map`. With a `cache` and the `keys` of
+	:meth:`GenerationCache.core_keys`, cached code is reused, see :func:`cached_map`.
 	"""
 
-	instr_template = Template(filename=str(template_dir/'etiss_instruction.mako'))
+	def cached_result(key, code):
+		instr_def = core.instructions[key]
+		return (instr_def.name, key, instr_def.ext_name, code)
+
+	yield from cached_map(_instruction_worker, (core, static_scalars, block_end_on), list(core.instructions), jobs, cache,
+		keys, cached_result)
+
+def _instruction_worker(key):
+	core, static_scalars, block_end_on = _pool_state
+	return generate_instruction(core, key, static_scalars, block_end_on)
+
+def generate_instruction(core: arch.CoreDef, key: "tuple[int, int]", static_scalars: bool, block_end_on: BlockEndType):
+	"""Generate the code of the instruction with (code, mask) `key` in `core`, return
+	a tuple of the instruction name, `key`, the extension name and the code.
+	"""
 
-	error_fn = None
-	for fn in core.functions.values():
-		if arch.FunctionAttribute.ETISS_TRAP_TRANSLATE_FN in fn.attributes:
-			error_fn = fn
-			break
+	instr_template = get_template('etiss_instruction.mako')
 
 	core_name = core.name
 
-	for (code, mask), instr_def in core.instructions.items():
-		logger.debug("setting up instruction generator for %s", instr_def.name)
-
-		instr_name = instr_def.name
-
-		if instr_def.attributes is None:
-			instr_def.attributes = []
-
-		# generate instruction parameter extraction code
-		fields = generate_fields(core.constants['XLEN'].value, instr_def)
-		fields_code, asm_printer_code, seen_fields, enc_idx = fields
-
-		code_string = f'{code:#0{int(enc_idx/4)}x}'
-		mask_string = f'{mask:#0{int(enc_idx/4)}x}'
-
-		if arch.InstrAttribute.ENABLE in instr_def.attributes:
-			cond = instr_def.attributes[arch.InstrAttribute.ENABLE]
-			new_op = behav.Operation([
-				behav.Conditional(
-					[cond[0]],
-					[
-						instr_def.operation.statements,
-						behav.ProcedureCall(error_fn, [behav.IntLiteral(-11)])
-					]
-				)
-			])
-			instr_def.operation = new_op
-			instr_def.throws = True
-
-		callback_str = generate_instruction_callback(core, instr_def, fields, static_scalars, block_end_on)
-
-		# render code for whole instruction
-		templ_str = instr_template.render(
-			instr_name=instr_name,
-			seen_fields=seen_fields,
-			enc_idx=enc_idx,
-			core_name=core_name,
-			code_string=code_string,
-			mask_string=mask_string,
-			fields_code=fields_code,
-			asm_printer_code=asm_printer_code,
-			callback_code=callback_str
-		)
-
-		yield (instr_name, (code, mask), instr_def.ext_name, templ_str)
+	code, mask = key
+	instr_def = core.instructions[key]
+
+	logger.debug("setting up instruction generator for %s", instr_def.name)
+
+	instr_name = instr_def.name
+
+	if instr_def.attributes is None:
+		instr_def.attributes = []
+
+	# generate instruction parameter extraction code
+	fields = generate_fields(core.constants['XLEN'].value, instr_def)
+	fields_code, asm_printer_code, seen_fields, enc_idx = fields
+
+	code_string = f'{code:#0{int(enc_idx/4)}x}'
+	mask_string = f'{mask:#0{int(enc_idx/4)}x}'
+
+	if arch.InstrAttribute.ENABLE in instr_def.attributes:
+		error_fn = None
+		for fn in core.functions.values():
+			if arch.FunctionAttribute.ETISS_TRAP_TRANSLATE_FN in fn.attributes:
+				error_fn = fn
+				break
+
+		cond = instr_def.attributes[arch.InstrAttribute.ENABLE]
+		new_op = behav.Operation([
+			behav.Conditional(
+				[cond[0]],
+				[
+					instr_def.operation.statements,
+					behav.ProcedureCall(error_fn, [behav.IntLiteral(-11)])
+				]
+			)
+		])
+		instr_def.operation = new_op
+		instr_def.throws = True
+
+	callback_str = generate_instruction_callback(core, instr_def, fields, static_scalars, block_end_on)
+
+	# render code for whole instruction
+	templ_str = instr_template.render(
+		instr_name=instr_name,
+		seen_fields=seen_fields,
+		enc_idx=enc_idx,
+		core_name=core_name,
+		code_string=code_string,
+		mask_string=mask_string,
+		fields_code=fields_code,
+		asm_printer_code=asm_printer_code,
+		callback_code=callback_str
+	)
+
+	return (instr_name, (code, mask), instr_def.ext_name, templ_str)
@@ -11,22 +11,27 @@
 import logging
 import pathlib
 from contextlib import ExitStack
-
-from mako.template import Template
+from typing import TYPE_CHECKING
 
 from ...metamodel import arch
 from . import BlockEndType
 from .instruction_generator import generate_functions, generate_instructions
-from .templates import template_dir
+from .templates import get_template
+
+if TYPE_CHECKING:
+	from .generation_cache import GenerationCache
 
 logger = logging.getLogger("instruction_writer")
 
-def write_functions(core: arch.CoreDef, start_time: str, output_path: pathlib.Path, static_scalars: bool):
-	"""Generate and write the {CoreName}Funcs.h file for ETISS."""
+def write_functions(core: arch.CoreDef, start_time: str, output_path: pathlib.Path, static_scalars: bool, jobs: int=1,
+	cache: "GenerationCache"=None, keys: dict=None):
+	"""Generate and write the {CoreName}Funcs.h file for ETISS, using `jobs` worker processes
+	and reusing code from `cache`, see :func:`.generate_functions`.
+	"""
 
-	fn_set_header_template = Template(filename=str(template_dir/'etiss_function_set_header.mako'))
-	fn_set_footer_template = Template(filename=str(template_dir/'etiss_function_set_footer.mako'))
-	fn_impl_template = Template(filename=str(template_dir/"etiss_functions_c.mako"))
+	fn_set_header_template = get_template('etiss_function_set_header.mako')
+	fn_set_footer_template = get_template('etiss_function_set_footer.mako')
+	fn_impl_template = get_template('etiss_functions_c.mako')
 
 	core_name = core.name
 
@@ -42,7 +47,7 @@ def write_functions(core: arch.CoreDef, start_time: str, output_path: pathlib.Pa
 		funcs_f.write(fn_set_str)
 
 		# generate and write function declarations
-		for fn_name, templ_str in generate_functions(core, static_scalars, True):
+		for fn_name, templ_str in generate_functions(core, static_scalars, True, jobs, cache, keys):
 			logger.debug("writing function decl %s", fn_name)
 			funcs_f.write(templ_str)
 
@@ -59,15 +64,47 @@ def write_functions(core: arch.CoreDef, start_time: str, output_path: pathlib.Pa
 		funcs_f.write(fn_impl_str)
 
 		# generate and write function definitions
-		for fn_name, templ_str in generate_functions(core, static_scalars, False):
+		for fn_name, templ_str in generate_functions(core, static_scalars, False, jobs, cache, keys):
 			logger.debug("writing function def %s", fn_name)
 			funcs_f.write(templ_str)
 
+def instruction_shard_files(core_name: str, shards: int) -> "list[str]":
+	"""Return the names of the C++ files of an instruction model split into `shards` parts."""
+
+	return [f'{core_name}Instr_{idx}.cpp' for idx in range(shards)]
+
+def balance_shards(sizes: "list[int]", shards: int) -> "list[int]":
+	"""Split a sequence of items with estimated `sizes` into `shards` contiguous parts of
+	about equal total size, return the part index of each item. Each item goes to the part
+	its midpoint falls into, so that adding or changing a single item only moves items
+	across the neighbouring part boundaries.
+	"""
+
+	total = sum(sizes)
+	if total == 0:
+		return [0] * len(sizes)
+
+	indices = []
+	start = 0
+	for size in sizes:
+		indices.append(min(shards - 1, (2 * start + size) * shards // (2 * total)))
+		start += size
+
+	return indices
+
 def write_instructions(core: arch.CoreDef, start_time: str, output_path: pathlib.Path, separate: bool, static_scalars: bool,
-	block_end_on: BlockEndType):
-	"""Generate and write the instruction model C++ files for ETISS."""
+	block_end_on: BlockEndType, jobs: int=1, cache: "GenerationCache"=None, keys: dict=None, shards: int=0):
+	"""Generate and write the instruction model C++ files for ETISS, using `jobs` worker processes
+	and reusing code from `cache`, see :func:`.generate_instructions`. If `shards` is given, the
+	instructions are split into this many files of about equal generated code size instead, see
+	:func:`balance_shards`.
+	"""
+
+	if shards > 0:
+		write_instruction_shards(core, start_time, output_path, static_scalars, block_end_on, jobs, cache, keys, shards)
+		return
 
-	instr_set_template = Template(filename=str(template_dir/'etiss_instruction_set.mako'))
+	instr_set_template = get_template('etiss_instruction_set.mako')
 
 	outfiles = {}
 	core_name = core.name
@@ -96,6 +133,44 @@ def write_instructions(core: arch.CoreDef, start_time: str, output_path: pathlib
 			out_f.write(instr_set_str)
 
 		# generate instruction behavior models
-		for instr_name, _, ext_name, templ_str in generate_instructions(core, static_scalars, block_end_on):
+		for instr_name, _, ext_name, templ_str in generate_instructions(core, static_scalars, block_end_on, jobs, cache, keys):
 			logger.debug("writing instruction %s", instr_name)
 			outfiles.get(ext_name, outfiles['default']).write(templ_str)
+
+def write_instruction_shards(core: arch.CoreDef, start_time: str, output_path: pathlib.Path, static_scalars: bool,
+	block_end_on: BlockEndType, jobs: int, cache: "GenerationCache", keys: dict, shards: int):
+	"""Generate the instruction models and write them into `shards` C++ files, named as
+	returned by :func:`instruction_shard_files`. The size of the generated code is used
+	as estimate for the compile time of each instruction.
+	"""
+
+	instr_set_template = get_template('etiss_instruction_set.mako')
+
+	core_name = core.name
+
+	logger.info("writing instructions into %d files", shards)
+
+	# all code is needed to balance the files, collect it first
+	instrs = [(instr_name, templ_str) for instr_name, _, _, templ_str
+		in generate_instructions(core, static_scalars, block_end_on, jobs, cache, keys)]
+
+	shard_indices = balance_shards([len(templ_str) for _, templ_str in instrs], shards)
+
+	for shard_idx, fname in enumerate(instruction_shard_files(core_name, shards)):
+		with open(output_path / fname, 'w', encoding="utf-8") as out_f:
+			instr_set_str = instr_set_template.render(
+				start_time=start_time,
+				extension_name=f"{core_name} (part {shard_idx + 1} of {shards})",
+				core_name=core_name
+			)
+
+			out_f.write(instr_set_str)
+
+			size = 0
+			for (instr_name, templ_str), instr_shard_idx in zip(instrs, shard_indices):
+				if instr_shard_idx == shard_idx:
+					logger.debug("writing instruction %s", instr_name)
+					out_f.write(templ_str)
+					size += len(templ_str)
+
+			logger.debug("%s: %d bytes of instruction code", fname, size)
@@ -0,0 +1,119 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Write-if-changed updates of output directories.
+
+Files are first generated into a staging directory, :func:`sync_directory`
+then moves only new and changed files into the output directory and removes
+files which were not generated again. Unchanged files keep their modification
+times, so that build systems do not rebuild them.
+
+Generated files contain their generation time, files which only differ in
+the `Generated on` line are therefore considered unchanged.
+
+Output directories of cores which are no longer part of the model are removed
+by :func:`remove_stale_dirs`.
+"""
+
+import logging
+import os
+import pathlib
+import re
+import shutil
+import tempfile
+
+logger = logging.getLogger("output_sync")
+
+_TIMESTAMP = re.compile(rb"Generated on [^\n]*")
+
+def _same_content(new: pathlib.Path, old: pathlib.Path) -> bool:
+	try:
+		if new.stat().st_size != old.stat().st_size:
+			# timestamps always have the same length
+			return False
+		old_data = old.read_bytes()
+	except OSError:
+		return False
+
+	new_data = new.read_bytes()
+	if new_data == old_data:
+		return True
+
+	return _TIMESTAMP.sub(b"", new_data, count=1) == _TIMESTAMP.sub(b"", old_data, count=1)
+
+def make_staging_dir(output_path: pathlib.Path) -> pathlib.Path:
+	"""Create a staging directory for `output_path`, on the same file system so
+	that files can be moved into place atomically.
+	"""
+
+	output_path.parent.mkdir(parents=True, exist_ok=True)
+	return pathlib.Path(tempfile.mkdtemp(prefix=f".{output_path.name}.", dir=output_path.parent))
+
+def sync_directory(staging_path: pathlib.Path, output_path: pathlib.Path) -> "tuple[int, int, int]":
+	"""Update `output_path` to the contents of `staging_path` and remove `staging_path`.
+	Returns the numbers of written, unchanged and removed files.
+	"""
+
+	written = unchanged = removed = 0
+	staged = set()
+
+	for new in sorted(staging_path.rglob("*")):
+		if new.is_dir():
+			continue
+
+		rel = new.relative_to(staging_path)
+		staged.add(rel)
+		old = output_path / rel
+
+		if old.is_file() and _same_content(new, old):
+			logger.debug("keeping unchanged file %s", rel)
+			unchanged += 1
+			continue
+
+		logger.debug("writing file %s", rel)
+		old.parent.mkdir(parents=True, exist_ok=True)
+		if old.is_dir():
+			shutil.rmtree(old)
+		os.replace(new, old)
+		written += 1
+
+	# remove stale files, deepest paths first so that emptied directories can be removed as well
+	for old in sorted(output_path.rglob("*"), reverse=True):
+		rel = old.relative_to(output_path)
+		if old.is_dir() and not old.is_symlink():
+			if not any(old.iterdir()):
+				old.rmdir()
+		elif rel not in staged:
+			logger.debug("removing stale file %s", rel)
+			old.unlink()
+			removed += 1
+
+	shutil.rmtree(staging_path)
+
+	return written, unchanged, removed
+
+def remove_stale_dirs(output_path: pathlib.Path, keep: "set[str]") -> "list[str]":
+	"""Remove all directories in `output_path` whose name is not in `keep`. Hidden
+	directories, like staging directories of other runs, are kept. Returns the names
+	of the removed directories.
+	"""
+
+	removed = []
+
+	if not output_path.is_dir():
+		return removed
+
+	for old in sorted(output_path.iterdir()):
+		if old.name in keep or old.name.startswith(".") or not old.is_dir() or old.is_symlink():
+			continue
+
+		logger.debug("removing stale directory %s", old)
+		shutil.rmtree(old)
+		removed.append(old.name)
+
+	return removed
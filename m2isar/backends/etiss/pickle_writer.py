@@ -15,7 +15,7 @@ from .writer import setup
 
 
 def main():
-	models, logger, output_base_path, spec_name, _, args = setup()
+	models, logger, output_base_path, spec_name, _, args, _ = setup()
 	functions = {}
 	instructions = {}
 
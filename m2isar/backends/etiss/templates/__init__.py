@@ -9,8 +9,83 @@
 """This module only contains mako templates for generating ETISS plugin C++
 code, and a variable :data:`template_dir` to keep track of the directory
 where the templates are stored.
+
+Templates should be loaded by :func:`get_template`, which compiles each
+template once per process. The compiled modules are stored in an on-disk
+module directory, named after a hash of the templates and the M2-ISA-R and
+mako versions, so that later processes load them from bytecode.
 """
 
+import hashlib
+import logging
+import os
 import pathlib
+import threading
+from importlib import metadata
+
+import mako
+from mako.lookup import TemplateLookup
+from mako.template import Template
 
 template_dir = pathlib.Path(__file__).parent.resolve()
+
+logger = logging.getLogger("templates")
+
+_lookup: TemplateLookup = None
+_lookup_lock = threading.Lock()
+
+def _package_version(name):
+	try:
+		return metadata.version(name)
+	except metadata.PackageNotFoundError:
+		return "unknown"
+
+def default_module_dir() -> pathlib.Path:
+	"""Return the default directory for compiled templates, honoring $XDG_CACHE_HOME."""
+
+	base = os.environ.get("XDG_CACHE_HOME")
+	base = pathlib.Path(base) if base else pathlib.Path.home() / ".cache"
+
+	h = hashlib.sha256()
+	h.update(_package_version("m2isar").encode())
+	h.update(mako.__version__.encode())
+	for path in sorted(template_dir.glob("*.mako")):
+		h.update(path.name.encode() + b"\0")
+		h.update(path.read_bytes())
+
+	return base / "m2isar" / "etiss_templates" / h.hexdigest()[:16]
+
+def configure(module_dir: pathlib.Path = None, cache: bool = True):
+	"""Set up the template lookup used by :func:`get_template`. Compiled templates are
+	stored in `module_dir`, or in :func:`default_module_dir` if it is None. If
+	`cache` is not set or the directory is not writable, templates are compiled in
+	memory only.
+	"""
+
+	global _lookup # pylint: disable=global-statement
+
+	module_directory = None
+	if cache:
+		module_dir = pathlib.Path(module_dir) if module_dir is not None else default_module_dir()
+		try:
+			module_dir.mkdir(parents=True, exist_ok=True)
+		except OSError as e:
+			logger.warning("can not create template module directory %s: %s", module_dir, e)
+		else:
+			if os.access(module_dir, os.W_OK):
+				module_directory = str(module_dir)
+			else:
+				logger.warning("template module directory %s is not writable", module_dir)
+
+	logger.debug("using template module directory %s", module_directory)
+	_lookup = TemplateLookup(directories=[str(template_dir)], module_directory=module_directory, filesystem_checks=False)
+
+def get_template(name: str) -> Template:
+	"""Return the compiled template `name` from :data:`template_dir`."""
+
+	if _lookup is None:
+		with _lookup_lock:
+			if _lookup is None:
+				configure()
+
+	return _lookup.get_template(name)
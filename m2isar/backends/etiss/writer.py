@@ -11,22 +11,26 @@
 import argparse
 import logging
 import pathlib
-import pickle
 import shutil
 import time
 
 from m2isar.metamodel.arch import CoreDef
 
+from ... import M2NameError, M2ValueError
+from ...metamodel.model_file import load_model
 from ...metamodel.utils.expr_preprocessor import (process_attributes,
                                                   process_functions,
                                                   process_instructions)
-from . import BlockEndType
+from . import BlockEndType, templates
 from .architecture_writer import (write_arch_cmake, write_arch_cpp,
                                   write_arch_gdbcore, write_arch_header,
                                   write_arch_lib, write_arch_specific_cpp,
                                   write_arch_specific_header,
                                   write_arch_struct)
+from .generation_cache import GenerationCache, default_cache_dir
 from .instruction_writer import write_functions, write_instructions
+from .output_sync import (make_staging_dir, remove_stale_dirs,
+                          sync_directory)
 
 
 class BooleanOptionalAction(argparse.Action):
@@ -71,9 +75,20 @@ class BooleanOptionalAction(argparse.Action):
 	def format_usage(self):
 		return ' | '.join(self.option_strings)
 
+def non_negative_int(value: str) -> int:
+	"""An argparse type for integers of at least 0."""
+
+	try:
+		ret = int(value)
+	except ValueError as e:
+		raise argparse.ArgumentTypeError(f"invalid int value: {value!r}") from e
+
+	if ret < 0:
+		raise argparse.ArgumentTypeError(f"must be at least 0, got {ret}")
+	return ret
 
 def setup():
-	"""Setup a M2-ISA-R metamodel consumer. Create an argument parser, unpickle the model
+	"""Setup a M2-ISA-R metamodel consumer. Create an argument parser, load the model
 	and generate output file structure.
 	"""
 
@@ -81,9 +96,17 @@ def setup():
 	parser = argparse.ArgumentParser()
 	parser.add_argument('top_level', help="A .m2isarmodel file containing the models to generate.")
 	parser.add_argument('--separate', action=BooleanOptionalAction, default=True, help="Generate separate .cpp files for each instruction set.")
+	parser.add_argument("--instr-shards", type=non_negative_int, default=0, metavar="N", help="Split the instruction models into N .cpp files of about equal size, for parallel compilation. Replaces --separate.")
 	parser.add_argument("--static-scalars", action=BooleanOptionalAction, default=True, help="Enable static detection for scalars.")
 	parser.add_argument("--block-end-on", default="none", choices=[x.name.lower() for x in BlockEndType],
 		help="Force end translation blocks on no instructions, uncoditional jumps or all jumps.")
+	parser.add_argument("--core", action="append", help="Only generate the given core, can be given multiple times. Only the needed parts of a sharded model are loaded.")
+	parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes to use for generating function and instruction code.")
+	parser.add_argument("--cache-dir", type=pathlib.Path, default=default_cache_dir(), help="Directory for the persistent cache of generated code.")
+	parser.add_argument("--no-cache", action="store_true", help="Do not read or write the cache of generated code.")
+	parser.add_argument("--write-if-changed", action="store_true", help="Only replace output files whose content changed and remove stale files, instead of regenerating the whole output directory.")
+	parser.add_argument("--template-cache-dir", type=pathlib.Path, help="Directory for compiled templates, defaults to a directory in $XDG_CACHE_HOME.")
+	parser.add_argument("--no-template-cache", action="store_true", help="Do not read or write compiled templates.")
 	parser.add_argument("--log", default="info", choices=["critical", "error", "warning", "info", "debug"])
 	args = parser.parse_args()
 
@@ -91,6 +114,8 @@ def setup():
 	logging.basicConfig(level=getattr(logging, args.log.upper()))
 	logger = logging.getLogger("etiss_writer")
 
+	templates.configure(args.template_cache_dir, not args.no_template_cache)
+
 	# resolve model paths
 	top_level = pathlib.Path(args.top_level)
 	abs_top_level = top_level.resolve()
@@ -113,18 +138,23 @@ def setup():
 
 	logger.info("loading models")
 
-	with open(model_fname, 'rb') as f:
-		models: "dict[str, CoreDef]" = pickle.load(f)
+	try:
+		models: "dict[str, CoreDef]" = load_model(model_fname, args.core)
+	except (M2NameError, M2ValueError) as e:
+		parser.error(str(e))
+
+	# all cores of the model, their output directories are kept when only some are generated
+	core_names = list(models) if args.core is None else list(load_model(model_fname))
 
 	start_time = time.strftime("%a, %d %b %Y %H:%M:%S %z", time.localtime())
 
-	return (models, logger, output_base_path, spec_name, start_time, args)
+	return (models, logger, output_base_path, spec_name, start_time, args, core_names)
 
 def main():
 	"""etiss_writer main entrypoint function."""
 
 	# setup etiss writer
-	models, logger, output_base_path, spec_name, start_time, args = setup()
+	models, logger, output_base_path, spec_name, start_time, args, core_names = setup()
 
 	# preprocess all models
 	for core_name, core in models.items():
@@ -145,29 +175,57 @@ def main():
 
 		core.functions = renamed_fns
 
+	cache = None if args.no_cache else GenerationCache(args.cache_dir)
+	block_end_on = BlockEndType[args.block_end_on.upper()]
+
 	# generate each core in the model
 	for core_name, core in models.items():
 		logger.info("processing model %s", core_name)
 
-		# create output files path
-		output_path = output_base_path / spec_name / core_name
-		try:
-			output_path.mkdir(parents=True)
-		except FileExistsError:
-			shutil.rmtree(output_path)
-			output_path.mkdir(parents=True)
+		# cache keys depend on the unmodified behavior, calculate them before generating any code
+		fn_keys, instr_keys = None, None
+		if cache is not None:
+			fn_keys, instr_keys = cache.core_keys(core, {"static_scalars": args.static_scalars, "block_end_on": block_end_on})
+
+		# create output files path, with write-if-changed generate into a staging directory first
+		output_path = target_path = output_base_path / spec_name / core_name
+		if args.write_if_changed:
+			output_path = make_staging_dir(target_path)
+		else:
+			try:
+				output_path.mkdir(parents=True)
+			except FileExistsError:
+				shutil.rmtree(output_path)
+				output_path.mkdir(parents=True)
 
 		# generate and write files
-		write_arch_struct(core, start_time, output_path)
-		write_arch_header(core, start_time, output_path)
-		write_arch_cpp(core, start_time, output_path, False)
-		write_arch_specific_header(core, start_time, output_path)
-		write_arch_specific_cpp(core, start_time, output_path)
-		write_arch_lib(core, start_time, output_path)
-		write_arch_cmake(core, start_time, output_path, args.separate)
-		write_arch_gdbcore(core, start_time, output_path)
-		write_functions(core, start_time, output_path, args.static_scalars)
-		write_instructions(core, start_time, output_path, args.separate, args.static_scalars, BlockEndType[args.block_end_on.upper()])
+		try:
+			write_arch_struct(core, start_time, output_path)
+			write_arch_header(core, start_time, output_path)
+			write_arch_cpp(core, start_time, output_path, False)
+			write_arch_specific_header(core, start_time, output_path)
+			write_arch_specific_cpp(core, start_time, output_path)
+			write_arch_lib(core, start_time, output_path)
+			write_arch_cmake(core, start_time, output_path, args.separate, args.instr_shards)
+			write_arch_gdbcore(core, start_time, output_path)
+			write_functions(core, start_time, output_path, args.static_scalars, args.jobs, cache, fn_keys)
+			write_instructions(core, start_time, output_path, args.separate, args.static_scalars, block_end_on, args.jobs, cache, instr_keys,
+				args.instr_shards)
+		except BaseException:
+			if args.write_if_changed:
+				shutil.rmtree(output_path, ignore_errors=True)
+			raise
+
+		if args.write_if_changed:
+			written, unchanged, removed = sync_directory(output_path, target_path)
+			logger.info("%d files written, %d unchanged, %d stale files removed", written, unchanged, removed)
+
+	# remove the output of cores which were removed from the model
+	for stale_name in remove_stale_dirs(output_base_path / spec_name, set(core_names)):
+		logger.info("removed output of core %s, which is not in the model anymore", stale_name)
+
+	if cache is not None:
+		logger.info("generation cache: %d hits, %d misses", cache.hits, cache.misses)
 
 if __name__ == "__main__":
 	main()
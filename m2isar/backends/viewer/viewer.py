@@ -11,14 +11,16 @@
 import argparse
 import logging
 import pathlib
-import pickle
 import tkinter as tk
 from collections import defaultdict
 from tkinter import ttk
 
 from m2isar.backends.viewer.utils import TreeGenContext
 
-from ...metamodel import arch, patch_model
+from ... import M2NameError, M2ValueError
+from ...metamodel import arch
+from ...metamodel.passes import get_pass
+from ...metamodel.model_file import load_model
 from ...metamodel.utils.expr_preprocessor import (process_attributes,
                                                   process_functions,
                                                   process_instructions)
@@ -40,6 +42,7 @@ def main():
 	parser = argparse.ArgumentParser()
 	parser.add_argument('top_level', help="A .m2isarmodel file containing the models to generate.")
 	parser.add_argument('-s', '--separate', action='store_true', help="Generate separate .cpp files for each instruction set.")
+	parser.add_argument("--core", action="append", help="Only show the given core, can be given multiple times.")
 	parser.add_argument("--log", default="info", choices=["critical", "error", "warning", "info", "debug"])
 	args = parser.parse_args()
 
@@ -67,8 +70,10 @@ def main():
 	logger.info("loading models")
 
 	# load models
-	with open(model_fname, 'rb') as f:
-		models: "dict[str, arch.CoreDef]" = pickle.load(f)
+	try:
+		models: "dict[str, arch.CoreDef]" = load_model(model_fname, args.core)
+	except (M2NameError, M2ValueError) as e:
+		parser.error(str(e))
 
 	# preprocess model
 	for core_name, core in models.items():
@@ -78,7 +83,7 @@ def main():
 		process_attributes(core)
 
 	# load Ttk TreeView transformer functions
-	patch_model(treegen)
+	tree_generator = get_pass(treegen)
 
 	# create main Tk window
 	root = tk.Tk()
@@ -136,7 +141,7 @@ def main():
 				attr_id = tree.insert(attrs_id, tk.END, text=attr)
 				for op in ops:
 					context = TreeGenContext(tree, attr_id)
-					op.generate(context)
+					tree_generator.run(op, context)
 
 			# generate and add parameters
 			params_id = tree.insert(fn_id, tk.END, text="Parameters")
@@ -146,7 +151,7 @@ def main():
 
 			# generate and add function behavior
 			context = TreeGenContext(tree, fn_id)
-			fn_def.operation.generate(context)
+			tree_generator.run(fn_def.operation, context)
 
 		# group instructions by size
 		instrs_by_size = defaultdict(dict)
@@ -188,11 +193,11 @@ def main():
 					attr_id = tree.insert(attrs_id, tk.END, text=attr.name)
 					for op in ops:
 						context = TreeGenContext(tree, attr_id)
-						op.generate(context)
+						tree_generator.run(op, context)
 
 				# generate behavior
 				context = TreeGenContext(tree, instr_id)
-				instr_def.operation.generate(context)
+				tree_generator.run(instr_def.operation, context)
 
 	#tree.tag_configure("mono", font=font.nametofont("TkFixedFont"))
 
@@ -6,18 +6,47 @@
 # Chair of Electrical Design Automation
 # Technical University of Munich
 
+import gc
+import io
 import itertools
 import logging
+import pickle
 from typing import Union
 
+from antlr4 import ParserRuleContext
+
 from ... import M2DuplicateError, M2NameError, M2TypeError, M2ValueError, flatten
 from ...metamodel import arch, behav, intrinsics
 from .parser_gen import CoreDSL2Parser, CoreDSL2Visitor
-from .utils import RADIX, SHORTHANDS, SIGNEDNESS
+from .utils import RADIX, SHORTHANDS, SIGNEDNESS, LazyBehavior
 
 logger = logging.getLogger("arch_builder")
 
 
+class _SnapshotPickler(pickle.Pickler):
+	"""Pickler which stores parse tree references out-of-band, so that snapshots
+	of the builder state share the (immutable) parse trees instead of copying them.
+	"""
+
+	def __init__(self, file, external: list):
+		super().__init__(file, pickle.HIGHEST_PROTOCOL)
+		self.external = external
+
+	def persistent_id(self, obj):
+		if isinstance(obj, (ParserRuleContext, LazyBehavior)):
+			self.external.append(obj)
+			return len(self.external) - 1
+		return None
+
+class _SnapshotUnpickler(pickle.Unpickler):
+	def __init__(self, file, external: list):
+		super().__init__(file)
+		self.external = external
+
+	def persistent_load(self, pid):
+		return self.external[pid]
+
+
 class ArchitectureModelBuilder(CoreDSL2Visitor):
 	"""ANTLR visitor to build an M2-ISA-R architecture model of a CoreDSL 2 specification."""
 
@@ -33,8 +62,18 @@ class ArchitectureModelBuilder(CoreDSL2Visitor):
 	_instr_classes: "set[int]"
 	_main_reg_file: Union[arch.Memory, None]
 
-	def __init__(self):
+	_STATE = ("_constants", "_instructions", "_functions", "_always_blocks", "_instruction_sets",
+		"_read_types", "_memories", "_memory_aliases", "_overwritten_instrs", "_instr_classes", "_main_reg_file")
+	"""Attributes making up the builder state between two instruction sets."""
+
+	def __init__(self, instruction_set_cache: "dict[tuple, tuple[bytes, list]]"=None):
+		"""Create a new builder. If an `instruction_set_cache` dict is given, the state
+		after building the instruction sets of a core is stored in it and reused
+		by all builders sharing this dict, for cores with the same instruction sets.
+		"""
+
 		super().__init__()
+		self._instruction_set_cache = instruction_set_cache
 		self._constants = {}
 		self._instructions = {}
 		self._functions = {}
@@ -48,6 +87,61 @@ class ArchitectureModelBuilder(CoreDSL2Visitor):
 		self._instr_classes = set()
 		self._main_reg_file = None
 
+	def _snapshot(self, results: list):
+		"""Serialize the builder state and the given results."""
+
+		external = []
+		f = io.BytesIO()
+		_SnapshotPickler(f, external).dump(({attr: getattr(self, attr) for attr in self._STATE}, results))
+		return f.getvalue(), external
+
+	def _restore(self, snapshot) -> list:
+		"""Replace the builder state with a fresh copy of a snapshot, return the
+		copied results.
+		"""
+
+		data, external = snapshot
+
+		# unpickling only creates new objects, running the garbage collector
+		# meanwhile would needlessly traverse the (huge) parse trees repeatedly
+		gc_enabled = gc.isenabled()
+		gc.disable()
+		try:
+			state, results = _SnapshotUnpickler(io.BytesIO(data), external).load()
+		finally:
+			if gc_enabled:
+				gc.enable()
+
+		for attr, val in state.items():
+			setattr(self, attr, val)
+		return results
+
+	def visitCoreContainer(self, ctx):
+		"""Build all instruction sets of a core, then the core definition itself.
+
+		All instruction sets of a core only depend on each other and are always
+		built starting from an empty state. The built objects for a given sequence
+		of instruction sets are therefore identical for all cores and can be taken
+		from the cache, the core definition is built on a private copy of them.
+		"""
+
+		*ins_sets, core_def = ctx.children
+		key = tuple(ins_sets)
+
+		snapshot = None
+		if self._instruction_set_cache is not None:
+			snapshot = self._instruction_set_cache.get(key)
+
+		if snapshot is not None:
+			logger.debug("reusing instruction sets of core %s", ctx.name)
+			results = self._restore(snapshot)
+		else:
+			results = [self.visit(obj) for obj in ins_sets]
+			if self._instruction_set_cache is not None:
+				self._instruction_set_cache[key] = self._snapshot(results)
+
+		return results + [self.visit(core_def)]
+
 	def visitBit_field(self, ctx: CoreDSL2Parser.Bit_fieldContext):
 		"""Generate a bit field (instruction parameter in encoding)."""
 
@@ -0,0 +1,263 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Sharing of built behavior models between cores.
+
+Cores built from the same instruction sets share the parse trees of all their
+instructions, functions and always blocks. A behavior tree is built the same
+way for two cores if every name it resolves outside of its local scalars
+refers to an equivalent object in both cores: constants with the same value,
+memories with the same dimensions and initial values, functions with the same
+signature. In that case the behavior model built for the first core is copied
+and relinked to the objects of the second core instead of being built again.
+"""
+
+import gc
+import io
+import logging
+import multiprocessing
+import pickle
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from ...metamodel import arch, intrinsics
+from .behavior_model_builder import BehaviorModelBuilder
+
+logger = logging.getLogger("behav_cache")
+
+_EXTERNAL_TYPES = (arch.Constant, arch.Memory, arch.Function, arch.BitFieldDescr, arch.FnParam, arch.Intrinsic)
+
+class _Unshareable(Exception):
+	"""Raised if a behavior model references an object that can not be looked up by name."""
+
+class _Environment:
+	"""The named objects a behavior tree can reference."""
+
+	def __init__(self, constants, memories, memory_aliases, fields, functions):
+		self.lookup = {
+			"field": fields,
+			"const": constants,
+			"alias": memory_aliases,
+			"mem": memories,
+			"intrinsic": intrinsics,
+			"fn": functions
+		}
+
+	def resolve(self, name):
+		"""Resolve a name in the same order as :meth:`BehaviorModelBuilder.visitReference_expression`,
+		return the kind of the resolved object and the object itself.
+		"""
+
+		for kind in ("field", "const", "alias", "mem", "intrinsic"):
+			obj = self.lookup[kind].get(name)
+			if obj:
+				return kind, obj
+
+		return None, None
+
+	def fingerprint(self, names, fn_names):
+		"""Describe everything about the referenced names a behavior model can depend on."""
+
+		ret = []
+
+		for name in names:
+			kind, obj = self.resolve(name)
+			ret.append((name, kind, _describe(obj)))
+
+		for name in fn_names:
+			ret.append((name, "fn", _describe(self.lookup["fn"].get(name))))
+
+		return tuple(ret)
+
+def _describe(obj):
+	if isinstance(obj, arch.Constant):
+		return (obj.value, obj.size, obj.signed)
+
+	if isinstance(obj, arch.Memory):
+		return (obj.size, obj.range.lower, obj.range.upper, tuple(obj._initval.items()), tuple(obj.attributes))
+
+	if isinstance(obj, arch.Function):
+		return (obj.size, obj.data_type, tuple(obj.attributes), obj.extern)
+
+	if isinstance(obj, arch.FnParam):
+		return (obj.size, obj.data_type, obj.width)
+
+	if isinstance(obj, arch.BitFieldDescr):
+		return (obj.size, obj.data_type)
+
+	# intrinsics are global objects, missing names fail the same way everywhere
+	return None
+
+class _RelinkPickler(pickle.Pickler):
+	"""Pickler which replaces references to named architecture objects by their
+	kind and name.
+	"""
+
+	def __init__(self, file, env: _Environment):
+		super().__init__(file, pickle.HIGHEST_PROTOCOL)
+		self.env = env
+
+	def persistent_id(self, obj):
+		if not isinstance(obj, _EXTERNAL_TYPES):
+			return None
+
+		if isinstance(obj, arch.Function):
+			if self.env.lookup["fn"].get(obj.name) is obj:
+				return ("fn", obj.name)
+		else:
+			kind, resolved = self.env.resolve(obj.name)
+			if resolved is obj:
+				return (kind, obj.name)
+
+		raise _Unshareable(obj.name)
+
+class _RelinkUnpickler(pickle.Unpickler):
+	def __init__(self, file, env: _Environment):
+		super().__init__(file)
+		self.env = env
+
+	def persistent_load(self, pid):
+		kind, name = pid
+		return self.env.lookup[kind][name]
+
+def _build_shareable(ctx, fields, env: _Environment, warned_fns: "set[str]"=None):
+	"""Build the behavior model of `ctx`, return it together with its scalars,
+	the referenced names and its serialized, relinkable form. The serialized
+	form is None if the model can not be shared.
+	"""
+
+	behav_builder = BehaviorModelBuilder(env.lookup["const"], env.lookup["mem"], env.lookup["alias"],
+		fields, env.lookup["fn"], warned_fns)
+	op = behav_builder.visit(ctx)
+	scalars = behav_builder._scalars
+
+	names = tuple(sorted(behav_builder.referenced_names))
+	fn_names = tuple(sorted(behav_builder.referenced_functions))
+
+	f = io.BytesIO()
+	try:
+		_RelinkPickler(f, env).dump((op, scalars))
+	except _Unshareable as e:
+		logger.debug("behavior model references unnamed object %s, not sharing it", e)
+		return op, scalars, names, fn_names, None
+
+	return op, scalars, names, fn_names, f.getvalue()
+
+_prefetch_state = None
+"""Work items and environment of the current prefetch, inherited by forked workers."""
+
+def _prefetch_worker(idx):
+	items, constants, memories, memory_aliases, functions = _prefetch_state
+	ctx, fields = items[idx]
+
+	try:
+		_, _, names, fn_names, data = _build_shareable(ctx, fields, _Environment(constants, memories, memory_aliases, fields, functions))
+	except Exception: # pylint: disable=broad-except
+		# errors are reported when the model is built again in order
+		return None
+
+	if data is None:
+		return None
+	return names, fn_names, data
+
+class BehaviorCache:
+	"""Builds behavior models through :class:`BehaviorModelBuilder`, reusing
+	models already built for equivalent environments.
+	"""
+
+	def __init__(self):
+		self._entries = defaultdict(list)
+		self._prefetched = set()
+		self.hits = 0
+		self.misses = 0
+
+	def _lookup(self, ctx, env: _Environment):
+		for names, fn_names, fingerprint, data in self._entries[ctx]:
+			if env.fingerprint(names, fn_names) == fingerprint:
+				return data
+		return None
+
+	def prefetch(self, items: "list[tuple]", constants: "dict[str, arch.Constant]", memories: "dict[str, arch.Memory]",
+		memory_aliases: "dict[str, arch.Memory]", functions: "dict[str, arch.Function]", jobs: int):
+		"""Build the behavior models of `items`, a list of (ctx, fields) tuples, in
+		`jobs` worker processes and store them for the following :meth:`build` calls.
+
+		Workers are forked and inherit the current model. Models which fail to
+		build are skipped here, so that :meth:`build` raises their errors in the
+		original order.
+		"""
+
+		global _prefetch_state # pylint: disable=global-statement
+
+		if "fork" not in multiprocessing.get_all_start_methods():
+			logger.warning("parallel behavior building needs the fork start method, building sequentially")
+			return
+
+		items = [(ctx, fields) for ctx, fields in items if self._lookup(ctx, _Environment(constants, memories, memory_aliases, fields, functions)) is None]
+		if len(items) < 2:
+			return
+
+		logger.debug("building %d behavior models in %d processes", len(items), jobs)
+
+		_prefetch_state = (items, constants, memories, memory_aliases, functions)
+
+		# keep the garbage collector of the workers away from the inherited objects,
+		# which would otherwise be copied into each worker when touched
+		gc.freeze()
+		try:
+			with ProcessPoolExecutor(jobs, multiprocessing.get_context("fork")) as pool:
+				results = list(pool.map(_prefetch_worker, range(len(items)), chunksize=max(1, len(items) // (jobs * 4))))
+		finally:
+			gc.unfreeze()
+			_prefetch_state = None
+
+		for (ctx, fields), result in zip(items, results):
+			if result is None:
+				continue
+
+			names, fn_names, data = result
+			env = _Environment(constants, memories, memory_aliases, fields, functions)
+			self._entries[ctx].append((names, fn_names, env.fingerprint(names, fn_names), data))
+			self._prefetched.add(ctx)
+			self.misses += 1
+
+	def build(self, ctx, constants: "dict[str, arch.Constant]", memories: "dict[str, arch.Memory]",
+		memory_aliases: "dict[str, arch.Memory]", fields: "dict[str, arch.SizedRefOrConst]",
+		functions: "dict[str, arch.Function]", warned_fns: "set[str]"):
+		"""Build the behavior model of `ctx`. Returns the model and a dict of the
+		scalars defined in it. Errors are raised exactly as with a fresh builder.
+		"""
+
+		env = _Environment(constants, memories, memory_aliases, fields, functions)
+
+		data = self._lookup(ctx, env)
+		if data is not None:
+			if ctx in self._prefetched:
+				self._prefetched.discard(ctx)
+			else:
+				self.hits += 1
+			return self._load(data, env)
+
+		self.misses += 1
+
+		op, scalars, names, fn_names, data = _build_shareable(ctx, fields, env, warned_fns)
+		if data is not None:
+			self._entries[ctx].append((names, fn_names, env.fingerprint(names, fn_names), data))
+
+		return op, scalars
+
+	@staticmethod
+	def _load(data, env):
+		# see ArchitectureModelBuilder._restore
+		gc_enabled = gc.isenabled()
+		gc.disable()
+		try:
+			return _RelinkUnpickler(io.BytesIO(data), env).load()
+		finally:
+			if gc_enabled:
+				gc.enable()
@@ -34,6 +34,11 @@ class BehaviorModelBuilder(CoreDSL2Visitor):
 		self._functions = functions
 		self.warned_fns = warned_fns if warned_fns is not None else set()
 
+		self.referenced_names: "set[str]" = set()
+		"""Names resolved outside of the local scalars, i.e. in the core or instruction context."""
+		self.referenced_functions: "set[str]" = set()
+		"""Names of all called functions and procedures."""
+
 	def visitChildren(self, node):
 		"""Helper method to return flatter results on tree visits."""
 
@@ -59,6 +64,7 @@ class BehaviorModelBuilder(CoreDSL2Visitor):
 		# extract name and reference to procedure object to be called
 		name = ctx.ref.text
 		ref = self._functions.get(name, None)
+		self.referenced_functions.add(name)
 
 		# error out if method is unknown
 		if ref is None:
@@ -75,6 +81,7 @@ class BehaviorModelBuilder(CoreDSL2Visitor):
 		# extract name and reference to function object to be called
 		name = ctx.ref.text
 		ref = self._functions.get(name, None)
+		self.referenced_functions.add(name)
 
 		# error out if method is unknown
 		if ref is None:
@@ -300,12 +307,15 @@ class BehaviorModelBuilder(CoreDSL2Visitor):
 
 		name = ctx.ref.text
 
-		var = self._scalars.get(name) or \
-			self._fields.get(name) or \
-			self._constants.get(name) or \
-			self._memory_aliases.get(name) or \
-			self._memories.get(name) or \
-			intrinsics.get(name)
+		var = self._scalars.get(name)
+
+		if var is None:
+			self.referenced_names.add(name)
+			var = self._fields.get(name) or \
+				self._constants.get(name) or \
+				self._memory_aliases.get(name) or \
+				self._memories.get(name) or \
+				intrinsics.get(name)
 
 		if var is None:
 			raise M2NameError(f"Named reference \"{name}\" does not exist!")
@@ -0,0 +1,125 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Build stamps for generated models.
+
+Next to each generated model, a stamp file records the hashes of all CoreDSL
+files read to build it, the relevant command line options and a digest of
+the tool itself. A model whose stamp still matches is up to date and does not
+need to be built again. The set of imported files is determined by the file
+contents, checking the hashes of the files read last time is therefore enough
+to detect every change without parsing anything.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+
+from .parse_cache import _package_version
+
+logger = logging.getLogger("build_stamp")
+
+STAMP_FORMAT_VERSION = 2
+"""Increment this when the layout of stamp files changes."""
+
+_TOOL_SOURCES = ("__init__.py", "metamodel", "frontends/coredsl2")
+"""Parts of the m2isar package which influence the generated model."""
+
+def _hash_file(path) -> str:
+	h = hashlib.sha256()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(1 << 20), b""):
+			h.update(chunk)
+	return h.hexdigest()
+
+def tool_digest() -> str:
+	"""Return a digest of the m2isar version and the sources of the model builder,
+	so that stamps are invalidated by every change to the tool, released or not.
+	"""
+
+	root = pathlib.Path(__file__).parents[2]
+
+	h = hashlib.sha256()
+	h.update(str(STAMP_FORMAT_VERSION).encode())
+	h.update(_package_version("m2isar").encode())
+
+	for source in _TOOL_SOURCES:
+		path = root / source
+		files = sorted(path.rglob("*.py")) if path.is_dir() else [path]
+		for file in files:
+			h.update(str(file.relative_to(root)).encode() + b"\0")
+			h.update(file.read_bytes())
+
+	return h.hexdigest()
+
+class BuildStamp:
+	"""The stamp file of one generated model."""
+
+	def __init__(self, model_path: pathlib.Path, options: dict) -> None:
+		self.model_path = pathlib.Path(model_path)
+		self.path = self.model_path.with_name(self.model_path.name + ".stamp")
+		self.options = {key: str(val) for key, val in options.items()}
+
+	def up_to_date(self) -> bool:
+		"""Check whether the model exists and was built by this tool, with the same
+		options, from unchanged input files.
+		"""
+
+		try:
+			with open(self.path, "r", encoding="utf-8") as f:
+				stamp = json.load(f)
+
+			if stamp.get("format") != STAMP_FORMAT_VERSION:
+				return False
+
+			if stamp["tool"] != tool_digest() or stamp["options"] != self.options:
+				return False
+
+			for filename, digest in stamp["outputs"].items():
+				if _hash_file(filename) != digest:
+					logger.debug("output file %s changed", filename)
+					return False
+
+			for filename, digest in stamp["files"].items():
+				if _hash_file(filename) != digest:
+					logger.debug("input file %s changed", filename)
+					return False
+
+		except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+			logger.debug("no usable build stamp: %s", e)
+			return False
+
+		return True
+
+	def write(self, input_files: "list[str]", output_files: "list[str]"=None):
+		"""Record the current state of the model and its input files. Must be called
+		after the model was written. `output_files` lists all files the model consists
+		of, by default only the model file itself.
+		"""
+
+		if output_files is None:
+			output_files = [self.model_path]
+
+		stamp = {
+			"format": STAMP_FORMAT_VERSION,
+			"tool": tool_digest(),
+			"options": self.options,
+			"files": {str(filename): _hash_file(filename) for filename in sorted(input_files)},
+			"outputs": {str(filename): _hash_file(filename) for filename in output_files}
+		}
+
+		tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+		try:
+			with open(tmp_path, "w", encoding="utf-8") as f:
+				json.dump(stamp, f, indent=1)
+			os.replace(tmp_path, self.path)
+		except OSError as e:
+			logger.warning("could not write build stamp %s: %s", self.path, e)
+			tmp_path.unlink(missing_ok=True)
@@ -10,6 +10,7 @@
 
 from ... import M2ValueError
 from ...metamodel import arch, behav
+from ...metamodel.utils import const_eval
 
 
 def group(self: behav.Group, context):
@@ -30,8 +31,9 @@ def indexed_reference(self: behav.IndexedReference, context):
 def binary_operation(self: behav.BinaryOperation, context):
 	left = self.left.generate(context)
 	right = self.right.generate(context)
-	return int(eval(f"{left}{self.op.value}{right}"))
+	# plain values have no type, evaluate them with unbounded width
+	return const_eval.binary(self.op.value, left, None, left < 0, right, None, right < 0)[0]
 
 def unary_operation(self: behav.UnaryOperation, context):
 	right = self.right.generate(context)
-	return int(eval(f"{self.op.value}{right}"))
+	return const_eval.unary(self.op.value, right, None, right < 0)[0]
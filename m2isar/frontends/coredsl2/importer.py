@@ -10,9 +10,21 @@
 
 import logging
 import pathlib
+import pickle
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-from .parser_gen import CoreDSL2Listener, CoreDSL2Parser, CoreDSL2Visitor
-from .utils import make_parser
+import antlr4
+
+from ... import M2SyntaxError
+from .parse_cache import detach_tree
+from .parser_gen import (CoreDSL2Lexer, CoreDSL2Listener, CoreDSL2Parser,
+                         CoreDSL2Visitor)
+from .utils import make_parser, parse_file
+
+logger = logging.getLogger("importer")
+
+IMPORT_TOKEN = CoreDSL2Lexer.literalNames.index("'import'")
 
 
 class Importer(CoreDSL2Listener):
@@ -47,27 +59,113 @@ class Importer(CoreDSL2Listener):
 			self.new_defs.extend(tree.definitions)
 		pass
 
-def recursive_import(tree, search_path):
+def scan_imports(filename) -> "list[str]":
+	"""Cheaply extract the import URIs of a CoreDSL 2 file. Only runs the lexer
+	over the leading import statements, the file is not parsed.
+	"""
+
+	lexer = CoreDSL2Lexer(antlr4.FileStream(filename))
+	lexer.removeErrorListeners()
+
+	uris = []
+	token = lexer.nextToken()
+
+	while token.type == IMPORT_TOKEN:
+		token = lexer.nextToken()
+		if token.type != CoreDSL2Lexer.STRING:
+			# malformed import, leave error reporting to the actual parser
+			break
+
+		uris.append(token.text.replace('"', ''))
+		token = lexer.nextToken()
+
+	return uris
+
+def _parse_worker(filename, cache, two_stage, lazy):
+	"""Process pool entry point, parses one file into a picklable tree. Returns
+	the tree and the numbers of cache hits and misses in this worker, as the
+	worker only updates its own copy of `cache`.
+	"""
+
+	hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+
+	tree = parse_file(filename, cache, two_stage, lazy)
+	detach_tree(tree)
+
+	if cache is None:
+		return tree, 0, 0
+	return tree, cache.hits - hits, cache.misses - misses
+
+def parse_imports(tree, jobs: int, cache=None, two_stage=False, lazy=False):
+	"""Discover all files transitively imported by `tree` by scanning their import
+	statements, and parse them concurrently in a pool of `jobs` worker processes.
+	Import paths of `tree` must already be resolved by :class:`ImportPathExtender`.
+
+	Returns a dict of parse trees, keyed by resolved filename. Files whose trees
+	can not be transferred back from a worker are left out and must be parsed
+	by the caller.
+	"""
+
+	queue = deque(pathlib.Path(i.uri.text.replace('"', '')).resolve() for i in tree.imports)
+	futures = {}
+
+	with ProcessPoolExecutor(max_workers=jobs) as pool:
+		while queue:
+			file_path = queue.popleft()
+			filename = str(file_path)
+
+			if filename in futures:
+				continue
+
+			futures[filename] = pool.submit(_parse_worker, filename, cache, two_stage, lazy)
+			queue.extend((file_path.parent / uri).resolve() for uri in scan_imports(file_path))
+
+		trees = {}
+
+		for filename, future in futures.items():
+			try:
+				trees[filename], hits, misses = future.result()
+			except M2SyntaxError:
+				raise
+			except (RecursionError, pickle.PicklingError) as e:
+				logger.debug("could not transfer parse tree of %s, parsing locally: %s", filename, e)
+				continue
+
+			if cache is not None:
+				cache.hits += hits
+				cache.misses += misses
+
+	return trees
+
+def recursive_import(tree, search_path, cache=None, jobs=1, two_stage=False, lazy=False):
 	"""Helper method to recursively process all import statements of a given
 	parse tree. The search path should be set to the directory of the root document.
+	If a :class:`.parse_cache.ParseCache` is passed, imported files are read through it.
+	With `jobs` > 1, all imported files are parsed up front in a process pool.
+	For `two_stage` and `lazy`, see :func:`.utils.parse_description`.
+
+	Imports are resolved in a single breadth-first pass over the deduplicated import
+	graph, every file is read and visited exactly once. The contents of all imported
+	files are then merged into `tree`, deepest import level first.
+
+	Returns the resolved filenames of all imported files.
 	"""
 
 	path_extender = ImportPathExtender(search_path)
 	path_extender.visit(tree)
 
-	importer = VisitImporter(search_path)
+	trees = parse_imports(tree, jobs, cache, two_stage, lazy) if jobs > 1 else {}
 
-	while importer.got_new:
-		importer.new_imports.clear()
-		importer.new_defs.clear()
-		importer.new_children.clear()
-		importer.got_new = False
+	importer = VisitImporter(search_path, cache, trees, two_stage, lazy)
+	imported = importer.import_all(tree)
 
-		importer.visit(tree)
+	tree.imports = [i for t in imported for i in t.imports] + tree.imports
+	tree.definitions = [d for t in imported for d in t.definitions] + tree.definitions
+	tree.children = [c for t in imported + [tree] for c in t.children if not isinstance(c, CoreDSL2Parser.Import_fileContext)]
 
-		tree.imports = importer.new_imports + tree.imports
-		tree.definitions = importer.new_defs + tree.definitions
-		tree.children = importer.new_children + [x for x in tree.children if not isinstance(x, CoreDSL2Parser.Import_fileContext)]
+	logger.debug("resolved %d import statements to %d files", len(tree.imports), len(imported))
+
+	return sorted(importer.imported)
 
 
 class VisitImporter(CoreDSL2Visitor):
@@ -75,16 +173,36 @@ class VisitImporter(CoreDSL2Visitor):
 	to the import statements and stops traversion after that.
 	"""
 
-	def __init__(self, search_path) -> None:
+	def __init__(self, search_path, cache=None, trees=None, two_stage=False, lazy=False) -> None:
 		super().__init__()
 		self.imported = set()
-		self.new_children = []
-		self.new_imports = []
-		self.new_defs = []
-		self.got_new = True
+		self.new_trees = []
 		self.search_path = search_path
+		self.cache = cache
+		self.trees = trees if trees is not None else {}
+		self.two_stage = two_stage
+		self.lazy = lazy
 		self.logger = logging.getLogger("visit_importer")
 
+	def import_all(self, tree):
+		"""Import all files reachable from `tree`, one level of the import graph
+		at a time. Returns the imported trees, deepest level first, in discovery
+		order within each level.
+		"""
+
+		levels = []
+		current = [tree]
+
+		while current:
+			self.new_trees = []
+			for t in current:
+				self.visit(t)
+
+			current = self.new_trees
+			levels.append(current)
+
+		return [t for level in reversed(levels) for t in level]
+
 	def visitDescription_content(self, ctx: CoreDSL2Parser.Description_contentContext):
 		for i in ctx.imports:
 			self.visit(i)
@@ -101,25 +219,23 @@ class VisitImporter(CoreDSL2Visitor):
 		if filename not in self.imported:
 			self.logger.info("importing file %s", filename)
 
-			# keep track that we imported something
-			self.got_new = True
 			self.imported.add(filename)
 
 			# extract file path and search path
 			file_path = pathlib.Path(filename)
 			file_dir = file_path.parent
 
-			parser = make_parser(file_path)
+			# use a tree parsed in advance if available
+			tree = self.trees.pop(filename, None)
+			if tree is None:
+				tree = parse_file(file_path, self.cache, self.two_stage, self.lazy)
 
 			# run ImportPathExtender on the new tree
-			tree = parser.description_content()
 			path_extender = ImportPathExtender(file_dir)
 			path_extender.visit(tree)
 
-			# keep track of the new children
-			self.new_children.extend(tree.children)
-			self.new_imports.extend(tree.imports)
-			self.new_defs.extend(tree.definitions)
+			# keep track of the new tree, its imports are visited on the next level
+			self.new_trees.append(tree)
 
 
 class ImportPathExtender(CoreDSL2Visitor):
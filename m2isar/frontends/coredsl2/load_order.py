@@ -8,18 +8,27 @@
 
 from antlr4 import ParserRuleContext
 
-from ... import M2DuplicateError, M2NameError
+from ... import M2DuplicateError, M2NameError, M2ValueError
 from .parser_gen import CoreDSL2Parser, CoreDSL2Visitor
 
 
 class CoreContainerContext(ParserRuleContext):
-	pass
+	"""Container for the load-ordered instruction set contexts of a core,
+	followed by the core definition context itself.
+	"""
+
+	def accept(self, visitor):
+		if hasattr(visitor, "visitCoreContainer"):
+			return visitor.visitCoreContainer(self)
+		return visitor.visitChildren(self)
 
 class LoadOrder(CoreDSL2Visitor):
 	def __init__(self) -> None:
 		super().__init__()
 		self.instruction_sets: "dict[str, CoreDSL2Parser.Instruction_setContext]" = {}
 		self.core_defs = {}
+		self._linearized: "dict[str, list[str]]" = {}
+		self._expanding: "list[str]" = []
 
 	def visitInstruction_set(self, ctx: CoreDSL2Parser.Instruction_setContext):
 		name = ctx.name.text
@@ -29,18 +38,42 @@ class LoadOrder(CoreDSL2Visitor):
 
 		self.instruction_sets[name] = ctx
 
-	def extend_ins_set(self, ins_set_name):
+	def extend_ins_set(self, ins_set_name) -> "list[str]":
+		"""Return the load order of an instruction set and all instruction sets it
+		(transitively) extends, without duplicates. The extensions of a set are loaded
+		before the set itself, later extensions before earlier ones.
+
+		Results are memoized per instruction set, so each set of an extension graph
+		is only linearized once, regardless of how many sets and cores depend on it.
+		"""
+
+		ret = self._linearized.get(ins_set_name)
+		if ret is not None:
+			return ret
+
 		if ins_set_name not in self.instruction_sets:
 			raise M2NameError(f"instruction set {ins_set_name} is unknown")
 
-		extensions = [e.text for e in self.instruction_sets[ins_set_name].extension]
-		if extensions:
-			ret = [ins_set_name]
-			for extension in extensions:
-				ret = self.extend_ins_set(extension) + ret
-			return ret
-		else:
-			return [ins_set_name]
+		if ins_set_name in self._expanding:
+			cycle = self._expanding[self._expanding.index(ins_set_name):] + [ins_set_name]
+			raise M2ValueError(f"cyclic instruction set extension: {' -> '.join(cycle)}")
+
+		ret = []
+		seen = set()
+
+		self._expanding.append(ins_set_name)
+		try:
+			for extension in reversed([e.text for e in self.instruction_sets[ins_set_name].extension]):
+				for name in self.extend_ins_set(extension):
+					if name not in seen:
+						seen.add(name)
+						ret.append(name)
+		finally:
+			self._expanding.pop()
+
+		ret.append(ins_set_name)
+		self._linearized[ins_set_name] = ret
+		return ret
 
 	def visitCore_def(self, ctx: CoreDSL2Parser.Core_defContext):
 		name = ctx.name.text
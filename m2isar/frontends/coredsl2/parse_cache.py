@@ -0,0 +1,137 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Persistent, content-addressed cache for CoreDSL 2 parse trees.
+
+Parsing with the ANTLR Python runtime is by far the most expensive step of
+reading a CoreDSL 2 model. This module stores the raw `description_content`
+parse tree of each file on disk, keyed by a hash of the file contents, the
+generated grammar and the tool versions. Unchanged files are then loaded
+from the cache instead of being lexed and parsed again.
+"""
+
+import hashlib
+import logging
+import os
+import pathlib
+import pickle
+from importlib import metadata
+
+from antlr4 import ParserRuleContext
+from antlr4.Token import CommonToken
+from antlr4.tree.Tree import TerminalNode
+
+from .parser_gen.CoreDSL2Lexer import serializedATN as lexer_atn
+from .parser_gen.CoreDSL2Parser import serializedATN as parser_atn
+
+logger = logging.getLogger("parse_cache")
+
+CACHE_FORMAT_VERSION = 1
+"""Increment this when the layout of cached trees changes."""
+
+def _package_version(name):
+	try:
+		return metadata.version(name)
+	except metadata.PackageNotFoundError:
+		return "unknown"
+
+def default_cache_dir() -> pathlib.Path:
+	"""Return the default cache directory, honoring $XDG_CACHE_HOME."""
+
+	base = os.environ.get("XDG_CACHE_HOME")
+	base = pathlib.Path(base) if base else pathlib.Path.home() / ".cache"
+	return base / "m2isar" / "coredsl2"
+
+def detach_tree(tree: ParserRuleContext):
+	"""Remove all references to the parser, lexer and input stream from a parse tree,
+	so that it can be pickled. Token texts are materialized before the token source
+	is removed.
+	"""
+
+	stack = [tree]
+
+	while stack:
+		node = stack.pop()
+
+		if isinstance(node, TerminalNode):
+			tokens = [node.symbol]
+		else:
+			node.parser = None
+			tokens = [node.start, node.stop]
+			if node.children:
+				stack.extend(node.children)
+
+		for token in tokens:
+			if token is not None and token.source is not CommonToken.EMPTY_SOURCE:
+				token.text = token.text
+				token.source = CommonToken.EMPTY_SOURCE
+
+class ParseCache:
+	"""On-disk parse tree cache. Each entry is a pickled, detached parse tree,
+	stored in a file named after the hash of its key.
+	"""
+
+	def __init__(self, cache_dir: pathlib.Path) -> None:
+		self.cache_dir = pathlib.Path(cache_dir)
+		self.hits = 0
+		self.misses = 0
+
+		salt = hashlib.sha256()
+		salt.update(str(CACHE_FORMAT_VERSION).encode())
+		salt.update(_package_version("m2isar").encode())
+		salt.update(_package_version("antlr4-python3-runtime").encode())
+		salt.update(repr(lexer_atn()).encode())
+		salt.update(repr(parser_atn()).encode())
+		self._salt = salt.digest()
+
+	def key(self, content: bytes, variant: str = "") -> str:
+		"""Calculate the cache key for a file with the given content. Different
+		`variant` s of parse trees for the same content get different keys.
+		"""
+
+		return hashlib.sha256(self._salt + variant.encode() + b"\0" + content).hexdigest()
+
+	def _path(self, key: str) -> pathlib.Path:
+		return self.cache_dir / key[:2] / f"{key}.pickle"
+
+	def load(self, key: str):
+		"""Return the cached parse tree for `key` or None, if there is no usable entry."""
+
+		try:
+			with open(self._path(key), "rb") as f:
+				tree = pickle.load(f)
+		except FileNotFoundError:
+			self.misses += 1
+			return None
+		except Exception as e: # pylint: disable=broad-except
+			logger.warning("discarding unreadable cache entry %s: %s", key, e)
+			self.misses += 1
+			return None
+
+		self.hits += 1
+		return tree
+
+	def store(self, key: str, tree: ParserRuleContext):
+		"""Store a parse tree for `key`. The tree is detached from its parser in the
+		process. Failing to store an entry is not an error, it only costs performance
+		on the next run.
+		"""
+
+		detach_tree(tree)
+
+		path = self._path(key)
+		tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+
+		try:
+			path.parent.mkdir(parents=True, exist_ok=True)
+			with open(tmp_path, "wb") as f:
+				pickle.dump(tree, f, pickle.HIGHEST_PROTOCOL)
+			os.replace(tmp_path, path)
+		except (OSError, RecursionError, pickle.PicklingError) as e:
+			logger.warning("could not write cache entry %s: %s", key, e)
+			tmp_path.unlink(missing_ok=True)
@@ -10,23 +10,34 @@ import argparse
 import itertools
 import logging
 import pathlib
-import pickle
 import sys
 
 from ... import M2Error, M2SyntaxError
 from ...metamodel import arch, behav, patch_model
+from ...metamodel.model_file import SHARD_MODES, write_model
+from ...metamodel.structural import Interner
 from . import expr_interpreter
 from .architecture_model_builder import ArchitectureModelBuilder
-from .behavior_model_builder import BehaviorModelBuilder
+from .behavior_cache import BehaviorCache
+from .build_stamp import BuildStamp
 from .importer import recursive_import
 from .load_order import LoadOrder
-from .utils import make_parser
+from .parse_cache import ParseCache, default_cache_dir
+from .utils import parse_file
 
 
 def main():
 	parser = argparse.ArgumentParser()
 	parser.add_argument("top_level", help="The top-level CoreDSL file.")
 	parser.add_argument("--log", default="info", choices=["critical", "error", "warning", "info", "debug"])
+	parser.add_argument("--cache-dir", type=pathlib.Path, default=default_cache_dir(), help="Directory for the persistent parse tree cache.")
+	parser.add_argument("--no-cache", action="store_true", help="Do not read or write the parse tree cache.")
+	parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes to use for parsing and building behavior models.")
+	parser.add_argument("--two-stage", action="store_true", help="Parse with fast SLL prediction first, use full LL prediction only on failure.")
+	parser.add_argument("--lazy-behavior", action="store_true", help="Parse behavior blocks only when their behavior model is built.")
+	parser.add_argument("--force", action="store_true", help="Build the model even if its inputs did not change since the last build.")
+	parser.add_argument("--share-nodes", action="store_true", help="Share identical leaf nodes between behavior trees. Saves some memory in large models, at the cost of build time.")
+	parser.add_argument("--shard", choices=SHARD_MODES, help="Split the model into one file per core or per instruction set of each core, listed in a manifest.")
 
 	args = parser.parse_args()
 
@@ -39,17 +50,30 @@ def main():
 	abs_top_level = top_level.resolve()
 	search_path = abs_top_level.parent
 
-	parser = make_parser(abs_top_level)
+	model_path = search_path.joinpath('gen_model')
+	model_file = model_path / (abs_top_level.stem + '.m2isarmodel')
+
+	# all options not listed here only affect how the model is built, not the model itself
+	stamp = BuildStamp(model_file, {"top_level": abs_top_level, "shard": args.shard, "share_nodes": args.share_nodes})
+
+	if not args.force and stamp.up_to_date():
+		logger.info("model %s is up to date", model_file)
+		return
+
+	cache = None if args.no_cache else ParseCache(args.cache_dir)
 
 	try:
 		logger.info("parsing top level")
-		tree = parser.description_content()
+		tree = parse_file(abs_top_level, cache, args.two_stage, args.lazy_behavior)
 
-		recursive_import(tree, search_path)
+		imported_files = recursive_import(tree, search_path, cache, args.jobs, args.two_stage, args.lazy_behavior)
 	except M2SyntaxError as e:
 		logger.critical("Error during parsing: %s", e)
 		sys.exit(1)
 
+	if cache is not None:
+		logger.info("parse cache: %d hits, %d misses", cache.hits, cache.misses)
+
 	logger.info("reading instruction load order")
 	lo = LoadOrder()
 	try:
@@ -58,7 +82,6 @@ def main():
 		logger.critical("Error during load order building: %s", e)
 		sys.exit(1)
 
-	model_path = search_path.joinpath('gen_model')
 	model_path.mkdir(exist_ok=True)
 
 	temp_save = {}
@@ -66,10 +89,12 @@ def main():
 
 	patch_model(expr_interpreter)
 
+	instruction_set_cache = {}
+
 	for core_name, core_def in cores.items():
 		logger.info(f'building architecture model for core {core_name}')
 		try:
-			arch_builder = ArchitectureModelBuilder()
+			arch_builder = ArchitectureModelBuilder(instruction_set_cache)
 			c = arch_builder.visit(core_def)
 		except M2Error as e:
 			logger.critical("Error building architecture model of core %s: %s", core_name, e)
@@ -80,6 +105,9 @@ def main():
 		temp_save[core_name] = (c, arch_builder)
 		models[core_name] = c[-1]
 
+	behav_cache = BehaviorCache()
+	interner = Interner() if args.share_nodes else None
+
 	for core_name, core_def in models.items():
 		logger.info('building behavior model for core %s', core_name)
 
@@ -97,21 +125,15 @@ def main():
 
 		logger.debug("evaluating core parameters")
 
-		for const_def in core_def.constants.values():
-			const_def._value = const_def.value
+		core_def.freeze()
 
 		for mem_def in itertools.chain(core_def.memories.values(), core_def.memory_aliases.values()):
-			mem_def._size = mem_def.size
-			mem_def.range._lower_base = mem_def.range.lower_base
-			mem_def.range._upper_base = mem_def.range.upper_base
-
 			for attr_name, attr_ops in mem_def.attributes.items():
 				ops = []
 				for attr_op in attr_ops:
 					try:
-						behav_builder = BehaviorModelBuilder(core_def.constants, core_def.memories, core_def.memory_aliases,
+						op, _ = behav_cache.build(attr_op, core_def.constants, core_def.memories, core_def.memory_aliases,
 							{}, core_def.functions, warned_fns)
-						op = behav_builder.visit(attr_op)
 						ops.append(op)
 					except M2Error as e:
 						logger.critical("error processing attribute \"%s\" of memory \"%s\": %s", attr_name, fn_def.name, e)
@@ -123,11 +145,6 @@ def main():
 			if isinstance(fn_def.operation, behav.Operation) and not fn_def.extern:
 				raise M2SyntaxError(f"non-extern function {fn_def.name} has no body")
 
-			fn_def._size = fn_def.size
-			for fn_arg in fn_def.args.values():
-				fn_arg._size = fn_arg.size
-				fn_arg._width = fn_arg.width
-
 		logger.debug("generating function behavior")
 
 		for fn_name, fn_def in core_def.functions.items():
@@ -138,9 +155,8 @@ def main():
 				ops = []
 				for attr_op in attr_ops:
 					try:
-						behav_builder = BehaviorModelBuilder(core_def.constants, core_def.memories, core_def.memory_aliases,
+						op, _ = behav_cache.build(attr_op, core_def.constants, core_def.memories, core_def.memory_aliases,
 							fn_def.args, core_def.functions, warned_fns)
-						op = behav_builder.visit(attr_op)
 						ops.append(op)
 					except M2Error as e:
 						logger.critical("error processing attribute \"%s\" of function \"%s\": %s", attr_name, fn_def.name, e)
@@ -148,23 +164,24 @@ def main():
 
 				fn_def.attributes[attr_name] = ops
 
-			behav_builder = BehaviorModelBuilder(core_def.constants, core_def.memories, core_def.memory_aliases,
-				fn_def.args, core_def.functions, warned_fns)
-
 			if not isinstance(fn_def.operation, behav.Operation):
 				try:
-					op = behav_builder.visit(fn_def.operation)
+					op, scalars = behav_cache.build(fn_def.operation, core_def.constants, core_def.memories, core_def.memory_aliases,
+						fn_def.args, core_def.functions, warned_fns)
 				except M2Error as e:
 					logger.critical("Error building behavior for function %s: %s", fn_name, e)
 					sys.exit()
 
-				fn_def.scalars = behav_builder._scalars
+				fn_def.scalars = scalars
 
 				if isinstance(op, list):
 					fn_def.operation = behav.Operation(op)
 				else:
 					fn_def.operation = behav.Operation([op])
 
+				if interner is not None:
+					interner.intern(fn_def.operation)
+
 		logger.debug("generating always blocks")
 
 		always_block_statements = []
@@ -178,9 +195,8 @@ def main():
 				ops = []
 				for attr_op in attr_ops:
 					try:
-						behav_builder = BehaviorModelBuilder(core_def.constants, core_def.memories, core_def.memory_aliases,
+						op, _ = behav_cache.build(attr_op, core_def.constants, core_def.memories, core_def.memory_aliases,
 							{}, core_def.functions, warned_fns)
-						op = behav_builder.visit(attr_op)
 						ops.append(op)
 					except M2Error as e:
 						logger.critical("error processing attribute \"%s\" of instruction \"%s\": %s", attr_name, block_def.name, e)
@@ -188,19 +204,24 @@ def main():
 
 				block_def.attributes[attr_name] = ops
 
-			behav_builder = BehaviorModelBuilder(core_def.constants, core_def.memories, core_def.memory_aliases,
-				{}, core_def.functions, warned_fns)
-
 			try:
-				op = behav_builder.visit(block_def.operation)
+				op, _ = behav_cache.build(block_def.operation, core_def.constants, core_def.memories, core_def.memory_aliases,
+					{}, core_def.functions, warned_fns)
 			except M2Error as e:
 				logger.critical("error building behavior for always block %s: %s", block_def.name, e)
 				sys.exit(1)
 
+			if interner is not None:
+				op = interner.intern(op)
+
 			always_block_statements.append(op)
 
 		logger.debug("generating instruction behavior")
 
+		if args.jobs > 1:
+			behav_cache.prefetch([(instr_def.operation, instr_def.fields) for instr_def in core_def.instructions.values()],
+				core_def.constants, core_def.memories, core_def.memory_aliases, core_def.functions, args.jobs)
+
 		for instr_def in core_def.instructions.values():
 			logger.debug("generating instruction %s", instr_def.name)
 			logger.debug("generating attributes")
@@ -209,9 +230,8 @@ def main():
 				ops = []
 				for attr_op in attr_ops:
 					try:
-						behav_builder = BehaviorModelBuilder(core_def.constants, core_def.memories, core_def.memory_aliases,
+						op, _ = behav_cache.build(attr_op, core_def.constants, core_def.memories, core_def.memory_aliases,
 							instr_def.fields, core_def.functions, warned_fns)
-						op = behav_builder.visit(attr_op)
 						ops.append(op)
 					except M2Error as e:
 						logger.critical("error processing attribute \"%s\" of instruction \"%s\": %s", attr_name, instr_def.name, e)
@@ -219,16 +239,14 @@ def main():
 
 				instr_def.attributes[attr_name] = ops
 
-			behav_builder = BehaviorModelBuilder(core_def.constants, core_def.memories, core_def.memory_aliases,
-				instr_def.fields, core_def.functions, warned_fns)
-
 			try:
-				op = behav_builder.visit(instr_def.operation)
+				op, scalars = behav_cache.build(instr_def.operation, core_def.constants, core_def.memories, core_def.memory_aliases,
+					instr_def.fields, core_def.functions, warned_fns)
 			except M2Error as e:
 				logger.critical("error building behavior for instruction %s::%s: %s", instr_def.ext_name, instr_def.name, e)
 				sys.exit(1)
 
-			instr_def.scalars = behav_builder._scalars
+			instr_def.scalars = scalars
 
 			if isinstance(op, list):
 				op = behav.Operation(op)
@@ -244,13 +262,25 @@ def main():
 				)
 			)
 
+			# share identical leaf nodes between all behavior trees
+			if interner is not None:
+				interner.intern(op)
+
 			#op.statements.insert(0, pc_inc)
 			op.statements = always_block_statements + op.statements
 			instr_def.operation = op
 
+		# resolve the scalars created while building behavior
+		core_def.freeze()
+
+	logger.info("behavior models: %d built, %d shared between cores", behav_cache.misses, behav_cache.hits)
+	if interner is not None:
+		logger.info("behavior nodes: %d shared", interner.shared)
+
 	logger.info("dumping model")
-	with open(model_path / (abs_top_level.stem + '.m2isarmodel'), 'wb') as f:
-		pickle.dump(models, f)
+	model_files = write_model(model_file, models, args.shard)
+
+	stamp.write([str(abs_top_level)] + imported_files, model_files)
 
 if __name__ == '__main__':
 	main()
@@ -6,12 +6,21 @@
 # Chair of Electrical Design Automation
 # Technical University of Munich
 
+import logging
+
 import antlr4
 import antlr4.error.ErrorListener
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.Errors import ParseCancellationException
+from antlr4.error.ErrorStrategy import BailErrorStrategy, DefaultErrorStrategy
+from antlr4.ListTokenSource import ListTokenSource
+from antlr4.Token import CommonToken, Token
 
 from ... import M2SyntaxError
 from .parser_gen import CoreDSL2Lexer, CoreDSL2Parser
 
+logger = logging.getLogger("coredsl2_utils")
+
 RADIX = {
 	'b': 2,
 	'h': 16,
@@ -44,13 +53,243 @@ class MyErrorListener(antlr4.error.ErrorListener.ErrorListener):
 	def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
 		raise M2SyntaxError(f"Syntax error in file {self.filename}, line {line}, column {column}: {msg}")
 
+_LITERAL_TOKENS = {name: CoreDSL2Lexer.literalNames.index(f"'{name}'") for name in ("behavior", ":", "{", "}", "functions", "always")}
+
+class LazyBehavior:
+	"""An unparsed behavior body of an instruction, function or always block, stored
+	as its token range. Stands in for the behavior parse tree and parses it only when
+	it is visited, the tree is not kept afterwards.
+	"""
+
+	def __init__(self, tokens: "list[CommonToken]", rule: str, filename) -> None:
+		self.tokens = tokens
+		self.rule = rule
+		self.filename = filename
+
+	def parse(self):
+		"""Parse the stored tokens and return the resulting parse tree. Syntax errors,
+		including tokens left over after the behavior, raise :exc:`M2SyntaxError` with their
+		position in the original file, like in eager parsing.
+		"""
+
+		stream = antlr4.CommonTokenStream(ListTokenSource(self.tokens))
+		parser = CoreDSL2Parser(stream)
+		parser.removeErrorListeners()
+		parser.addErrorListener(MyErrorListener(self.filename))
+		tree = getattr(parser, self.rule)()
+
+		# an instruction behavior is a single statement, the eager parser expects the
+		# closing brace of the instruction after it
+		token = parser.getCurrentToken()
+		if token.type != Token.EOF:
+			parser.notifyErrorListeners(f"missing '}}' at {parser.getTokenErrorDisplay(token)}", token, None)
+
+		return tree
+
+	def accept(self, visitor):
+		return visitor.visit(self.parse())
+
+def _detached(tokens: "list[CommonToken]"):
+	"""Materialize the texts of `tokens` and drop their reference to lexer and input stream."""
+
+	for token in tokens:
+		token.text = token.text
+		token.source = CommonToken.EMPTY_SOURCE
+	return tokens
+
+def _placeholder(template: CommonToken, name: str):
+	token = template.clone()
+	token.type = _LITERAL_TOKENS[name]
+	token.text = name
+	return token
+
+def _block_end(tokens: "list[CommonToken]", idx: int, depth: int = 0):
+	"""Return the index of the first closing brace after `idx` which lowers the brace
+	nesting depth below `depth`, or None.
+	"""
+
+	for i in range(idx, len(tokens)):
+		if tokens[i].type == _LITERAL_TOKENS["{"]:
+			depth += 1
+		elif tokens[i].type == _LITERAL_TOKENS["}"]:
+			depth -= 1
+			if depth < 0:
+				return i
+	return None
+
+def capture_behaviors(tokens: "list[CommonToken]"):
+	"""Cut all behavior bodies out of a token list. Instruction behaviors are replaced
+	by an empty block statement, function and always block bodies by an empty block.
+
+	Returns the reduced token list and a dict mapping each placeholder's opening brace
+	token to its original tokens and parser rule. If the token list is malformed, it is
+	returned unchanged, leaving error reporting to the actual parser.
+	"""
+
+	lbrace, rbrace = _LITERAL_TOKENS["{"], _LITERAL_TOKENS["}"]
+	out = []
+	captured = {}
+	depth = 0
+	section_depth = None
+	section_pending = False
+	i = 0
+
+	while i < len(tokens):
+		token = tokens[i]
+		end, rule = None, None
+
+		# instruction behavior: a statement, ends before the brace closing the instruction
+		if token.type == _LITERAL_TOKENS["behavior"] and i + 1 < len(tokens) and tokens[i+1].type == _LITERAL_TOKENS[":"]:
+			out.extend(tokens[i:i+2])
+			i += 2
+			end = _block_end(tokens, i)
+			if end is None or end == i:
+				return tokens, {}
+			end -= 1
+			rule = "statement"
+
+		# function or always block body: a block directly inside the section
+		elif token.type == lbrace and section_depth is not None and depth == section_depth:
+			end = _block_end(tokens, i + 1)
+			if end is None:
+				return tokens, {}
+			rule = "block"
+
+		if rule is not None:
+			placeholder = _placeholder(tokens[i], "{")
+			out.extend((placeholder, _placeholder(tokens[end], "}")))
+			captured[placeholder] = (_detached(tokens[i:end+1]), rule)
+			i = end + 1
+			continue
+
+		if token.type in (_LITERAL_TOKENS["functions"], _LITERAL_TOKENS["always"]):
+			section_pending = True
+		elif token.type == lbrace:
+			depth += 1
+			if section_pending:
+				section_depth = depth
+				section_pending = False
+		elif token.type == rbrace:
+			depth -= 1
+			if section_depth is not None and depth < section_depth:
+				section_depth = None
+
+		out.append(token)
+		i += 1
+
+	return out, captured
+
+def attach_behaviors(tree: CoreDSL2Parser.Description_contentContext, captured, filename):
+	"""Replace the placeholder behaviors in `tree` by :class:`LazyBehavior` objects."""
+
+	for isa in tree.definitions:
+		for section in isa.sections:
+			if isinstance(section, CoreDSL2Parser.Section_instructionsContext):
+				items = section.instructions
+			elif isinstance(section, CoreDSL2Parser.Section_functionsContext):
+				items = section.functions
+			elif isinstance(section, CoreDSL2Parser.Section_alwaysContext):
+				items = section.always_blocks
+			else:
+				continue
+
+			for item in items:
+				if item.behavior is not None and item.behavior.start in captured:
+					item.behavior = LazyBehavior(*captured[item.behavior.start], filename)
+
+
+def make_parser(filename, sll=False, lazy=False):
+	"""Construct a parser for the given file. If `sll` is set, the parser uses
+	the faster SLL prediction mode and cancels parsing on the first error by raising
+	:exc:`ParseCancellationException`, without reporting it. Use :func:`set_ll_mode`
+	to switch such a parser back to full LL prediction.
+
+	If `lazy` is set, behavior bodies are cut out of the token stream before parsing,
+	see :func:`capture_behaviors`. The captured bodies are stored in the parser's
+	`lazy_behaviors` attribute, use :func:`attach_behaviors` after parsing.
+	"""
 
-def make_parser(filename):
 	input_stream = antlr4.FileStream(filename)
 	lexer = CoreDSL2Lexer(input_stream)
 	stream = antlr4.CommonTokenStream(lexer)
+	captured = {}
+
+	if lazy:
+		stream.fill()
+		tokens, captured = capture_behaviors(stream.tokens)
+		stream = antlr4.CommonTokenStream(ListTokenSource(tokens))
+
 	parser = CoreDSL2Parser(stream)
-	error_handler = MyErrorListener(filename)
+	parser.lazy_behaviors = captured
 	parser.removeErrorListeners()
-	parser.addErrorListener(error_handler)
+
+	if sll:
+		parser._interp.predictionMode = PredictionMode.SLL # pylint: disable=protected-access
+		parser._errHandler = BailErrorStrategy() # pylint: disable=protected-access
+	else:
+		error_handler = MyErrorListener(filename)
+		parser.addErrorListener(error_handler)
+
 	return parser
+
+def set_ll_mode(parser, filename):
+	"""Reset a parser created by :func:`make_parser` with `sll=True` to the start of its
+	input and switch it to full LL prediction with normal error reporting.
+	"""
+
+	parser.reset()
+	parser._interp.predictionMode = PredictionMode.LL # pylint: disable=protected-access
+	parser._errHandler = DefaultErrorStrategy() # pylint: disable=protected-access
+	parser.removeErrorListeners()
+	parser.addErrorListener(MyErrorListener(filename))
+
+def parse_description(filename, two_stage=False, lazy=False):
+	"""Parse a CoreDSL 2 file and return its `description_content` parse tree.
+
+	With `two_stage` set, the file is first parsed with SLL prediction, which is
+	considerably faster. Only if that fails, the file is parsed again with full
+	LL prediction. Successful SLL parses yield the same tree as LL parses, syntax
+	errors are always reported by the LL stage.
+
+	With `lazy` set, the behavior of instructions, functions and always blocks is
+	not parsed. The `behavior` attributes of their contexts are :class:`LazyBehavior`
+	objects instead, which are parsed when visited.
+	"""
+
+	parser = make_parser(filename, two_stage, lazy)
+
+	if not two_stage:
+		tree = parser.description_content()
+	else:
+		try:
+			tree = parser.description_content()
+		except ParseCancellationException:
+			logger.debug("SLL parsing of %s failed, retrying with full LL prediction", filename)
+			set_ll_mode(parser, filename)
+			tree = parser.description_content()
+
+	if lazy:
+		attach_behaviors(tree, parser.lazy_behaviors, filename)
+
+	return tree
+
+def parse_file(filename, cache=None, two_stage=False, lazy=False):
+	"""Parse a CoreDSL 2 file and return its `description_content` parse tree.
+	If a :class:`.parse_cache.ParseCache` is passed, the tree is looked up in the
+	cache first and stored there after parsing. For `two_stage` and `lazy`, see
+	:func:`parse_description`.
+	"""
+
+	if cache is None:
+		return parse_description(filename, two_stage, lazy)
+
+	with open(filename, "rb") as f:
+		key = cache.key(f.read(), "lazy" if lazy else "")
+
+	tree = cache.load(key)
+
+	if tree is None:
+		tree = parse_description(filename, two_stage, lazy)
+		cache.store(key, tree)
+
+	return tree
@@ -13,12 +13,13 @@ description.
 Also included are preprocessing functions, mostly to simplify a model and to extract information
 about scalar and function staticness as well as exceptions.
 
-Any model traversal should use the :func:`patch_model` function and a module including the needed
-transformations. :func:`patch_model` monkey patches transformation functions into the classes of the
-behavior model, therefore separating model code from transformation code. For examples on how
-these transformation functions look like, see either the modules in :mod:`m2isar.metamodel.utils`
-or the main code generation module :mod:`m2isar.backends.etiss.instruction_transform`. For a description
-of the monkey patching, see :func:`patch_model`.
+Any model traversal should use a :class:`~m2isar.metamodel.passes.Pass` created from a module including
+the needed transformations by :func:`~m2isar.metamodel.passes.get_pass`. Passes dispatch calls to
+`generate` to the transformation functions for the classes of the behavior model, therefore separating
+model code from transformation code. For examples on how these transformation functions look like,
+see either the modules in :mod:`m2isar.metamodel.utils` or the main code generation module
+:mod:`m2isar.backends.etiss.instruction_transform`. For a description of the function signature,
+see :func:`patch_model`, which installs transformation functions globally.
 
 Usually a M2-ISA-R behavioral model is traversed from top to bottom. Necessary contextual
 information is passed to lower levels by a user-defined `context` object. Each object should then
@@ -28,13 +29,11 @@ uses complex objects in lower levels of translation and switches to strings for
 the hierarchy.
 """
 
-import inspect
-import logging
-from . import behav, arch
+from . import behav, arch, passes
 
 def patch_model(module):
-	"""Monkey patch transformation functions inside `module`
-	into :mod:`m2isar.metamodel.behav` classes
+	"""Install transformation functions inside `module` for
+	:mod:`m2isar.metamodel.behav` classes in all threads without an active pass
 
 	Transformation functions must have a specific signature for this to work:
 
@@ -43,22 +42,11 @@ def patch_model(module):
 	where `<behav Class>` is the class in :mod:`m2isar.metamodel.behav` which this
 	transformation is associated with. Context can be any user-defined object to keep track
 	of additional contextual information, if needed.
-	"""
-
-	logger = logging.getLogger("patch_model")
 
-	for _, fn in inspect.getmembers(module, inspect.isfunction):
-		sig = inspect.signature(fn)
-		param = sig.parameters.get("self")
-		if not param:
-			continue
-		if not param.annotation:
-			raise ValueError(f"self parameter not annotated correctly for {fn}")
-		if not issubclass(param.annotation, behav.BaseNode):
-			raise TypeError(f"self parameter for {fn} has wrong subclass")
+	Prefer a :class:`~m2isar.metamodel.passes.Pass`, which does not affect other threads.
+	"""
 
-		logger.debug("patching %s with fn %s", param.annotation, fn)
-		param.annotation.generate = fn
+	passes.set_default(module)
 
 intrinsic_defs = [
 	arch.Intrinsic("__encoding_size", 16, arch.DataType.U)
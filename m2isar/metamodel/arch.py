@@ -9,6 +9,11 @@
 """This module contains classes for modeling the architectural part
 of an M2-ISA-R model. The architectural part is anything but the functional
 behavior of functions and instructions.
+
+Classes of which a model holds many instances, like bit fields, scalars and
+ranges, use `__slots__` to save memory. The containers :class:`Instruction`, :class:`Function`,
+:class:`AlwaysBlock`, :class:`InstructionSet` and :class:`CoreDef` exist only a
+few times per model and keep a `__dict__`.
 """
 
 import dataclasses
@@ -17,11 +22,15 @@ from collections import defaultdict
 from enum import Enum, IntEnum, auto
 from typing import Any, Union
 
-from .. import M2TypeError
+from .. import M2TypeError, M2ValueError
 from .behav import BaseNode, Operation
 
 
 def get_const_or_val(arg) -> int:
+	# all values of frozen models are plain ints
+	if type(arg) is int: # pylint: disable=unidiomatic-typecheck
+		return arg
+
 	if isinstance(arg, Constant):
 		return arg.value
 
@@ -30,9 +39,19 @@ def get_const_or_val(arg) -> int:
 
 	return arg
 
+def _resolve(arg, obj, what: str) -> Union[int, None]:
+	"""Resolve `arg` through :func:`get_const_or_val`, make sure the result is an int or None."""
+
+	ret = get_const_or_val(arg)
+	if ret is not None and not isinstance(ret, int):
+		raise M2ValueError(f"{what} of {obj} does not resolve to an integer")
+	return ret
+
 class Named:
 	"""A simple base class for a named object."""
 
+	__slots__ = ("name",)
+
 	name: str
 	"""The name of the object."""
 
@@ -53,6 +72,8 @@ class SizedRefOrConst(Named):
 	expression, expressed by a BaseNode.
 	"""
 
+	__slots__ = ("_size",)
+
 	_size: Union[int, "Constant", "BaseNode"]
 	"""The size of the object"""
 
@@ -66,6 +87,11 @@ class SizedRefOrConst(Named):
 
 		return get_const_or_val(self._size)
 
+	def freeze(self):
+		"""Resolve the size to a plain int."""
+
+		self._size = _resolve(self._size, self, "size")
+
 	@property
 	def actual_size(self):
 		"""Returns the bits needed in multiples of eight to represent the
@@ -86,6 +112,8 @@ class Constant(SizedRefOrConst):
 	and signedness information.
 	"""
 
+	__slots__ = ("_value", "attributes", "signed")
+
 	_value: Union[int, "Constant", "BaseNode"]
 	"""The value this object holds. Can be an int, another constant or a statically resolvable BaseNode."""
 
@@ -110,6 +138,12 @@ class Constant(SizedRefOrConst):
 	def value(self, value):
 		self._value = value
 
+	def freeze(self):
+		"""Resolve size and value to plain ints."""
+
+		super().freeze()
+		self._value = _resolve(self._value, self, "value")
+
 	def __str__(self) -> str:
 		return f'{super().__str__()}, value={self.value}'
 
@@ -119,6 +153,8 @@ class Constant(SizedRefOrConst):
 class RangeSpec:
 	"""A class holding a range to denote a range of indices or width of a memory bank."""
 
+	__slots__ = ("_upper_base", "_lower_base", "_upper_power", "_lower_power", "_frozen")
+
 	_upper_base: Union[int, "Constant", "BaseNode"]
 	"""The upper bound of the range. Can be an int, a constant or a statically resolvable BaseNode."""
 	_lower_base: Union[int, "Constant", "BaseNode"]
@@ -127,6 +163,8 @@ class RangeSpec:
 	"""Obsolete, do not use"""
 	_lower_power: Union[int, "Constant", "BaseNode"]
 	"""Obsolete, do not use"""
+	_frozen: Union["tuple[int, int, int]", None]
+	"""The resolved upper bound, lower bound and length of a frozen range."""
 
 	def __init__(self, upper_base: ValOrConst, lower_base: ValOrConst=None, upper_power: ValOrConst=1, lower_power: ValOrConst=1):
 		self._upper_base = upper_base
@@ -135,6 +173,22 @@ class RangeSpec:
 		self._upper_power = upper_power
 		self._lower_power = lower_power
 
+		self._frozen = None
+
+	def freeze(self):
+		"""Resolve all bounds to plain ints and store the resulting upper and lower
+		bound and length. A frozen range must not be modified anymore.
+		"""
+
+		self._frozen = None
+
+		self._upper_base = _resolve(self._upper_base, self, "upper bound")
+		self._lower_base = _resolve(self._lower_base, self, "lower bound")
+		self._upper_power = _resolve(self._upper_power, self, "upper power")
+		self._lower_power = _resolve(self._lower_power, self, "lower power")
+
+		self._frozen = (self.upper, self.lower, self.length)
+
 	@property
 	def upper_power(self):
 		"""Returns the resolved upper bound power."""
@@ -158,6 +212,8 @@ class RangeSpec:
 	@property
 	def upper(self) -> Union[int, None]:
 		"""Returns the resolved upper power."""
+		if self._frozen is not None:
+			return self._frozen[0]
 		if self.upper_base is None or self.upper_power is None:
 			return None
 		ret = self.upper_base ** self.upper_power
@@ -168,6 +224,8 @@ class RangeSpec:
 	@property
 	def lower(self) -> int:
 		"""Returns the resolved lower power."""
+		if self._frozen is not None:
+			return self._frozen[1]
 		if self.lower_base is None or self.lower_power is None:
 			return 0
 		return self.lower_base ** self.lower_power
@@ -180,6 +238,9 @@ class RangeSpec:
 		else return self.upper - self.lower + 1
 		"""
 
+		if self._frozen is not None:
+			return self._frozen[2]
+
 		if self.upper is None:
 			return None
 
@@ -236,6 +297,8 @@ class DataType(Enum):
 class DataType2:
 	"""A datatype base class, only holds information on whether it is a pointer."""
 
+	__slots__ = ("ptr",)
+
 	ptr: Any
 
 	def __init__(self, ptr) -> None:
@@ -244,9 +307,13 @@ class DataType2:
 class VoidType(DataType2):
 	"""A void datatype, automatically assumes native size."""
 
+	__slots__ = ()
+
 class IntegerType(DataType2):
 	"""An integer datatype with width and sign information."""
 
+	__slots__ = ("_width", "signed")
+
 	_width: Union[int, "Constant", "BaseNode"]
 	signed: bool
 
@@ -275,6 +342,8 @@ class IntegerType(DataType2):
 class FnParam(SizedRefOrConst):
 	"""A function parameter."""
 
+	__slots__ = ("data_type", "_width")
+
 	data_type: DataType
 	_width: Union[int, "Constant", "BaseNode"]
 	"""The array width of this parameter."""
@@ -290,12 +359,20 @@ class FnParam(SizedRefOrConst):
 
 		return get_const_or_val(self._width)
 
+	def freeze(self):
+		"""Resolve size and array width to plain ints."""
+
+		super().freeze()
+		self._width = _resolve(self._width, self, "width")
+
 	def __str__(self) -> str:
 		return f'{super().__str__()}, data_type={self.data_type}'
 
 class Scalar(SizedRefOrConst):
 	"""A scalar variable object, used mainly in behavior descriptions."""
 
+	__slots__ = ("value", "static", "data_type")
+
 	value: int
 	static: bool
 	data_type: DataType
@@ -307,6 +384,7 @@ class Scalar(SizedRefOrConst):
 		super().__init__(name, size)
 
 class Intrinsic(SizedRefOrConst):
+	__slots__ = ("data_type", "value")
 
 	value: int
 	data_type: DataType
@@ -322,6 +400,8 @@ class Memory(SizedRefOrConst):
 	scalar and array registers and/or memories.
 	"""
 
+	__slots__ = ("attributes", "range", "children", "parent", "_initval")
+
 	attributes: "dict[MemoryAttribute, list[BaseNode]]"
 	range: RangeSpec
 	children: "list[Memory]"
@@ -341,6 +421,13 @@ class Memory(SizedRefOrConst):
 
 		return get_const_or_val(self._initval[idx])
 
+	def freeze(self):
+		"""Resolve size, range and initial values to plain ints."""
+
+		super().freeze()
+		self.range.freeze()
+		self._initval = {idx: _resolve(val, self, "initial value") for idx, val in self._initval.items()}
+
 	@property
 	def data_range(self):
 		"""Returns a RangeSpec object with upper=range.upper-range.lower, lower=0."""
@@ -366,6 +453,8 @@ class BitVal:
 	Modeled as length and integral value.
 	"""
 
+	__slots__ = ("length", "value")
+
 	length: int
 	value: int
 
@@ -374,6 +463,8 @@ class BitField(Named):
 	into multiple parts, if the operand is split over two or more bit ranges.
 	"""
 
+	__slots__ = ("range", "data_type")
+
 	range: RangeSpec
 	data_type: DataType
 
@@ -385,6 +476,11 @@ class BitField(Named):
 
 		super().__init__(name)
 
+	def freeze(self):
+		"""Resolve the range to plain ints."""
+
+		self.range.freeze()
+
 	def __str__(self) -> str:
 		return f'{super().__repr__()}, range={self.range}, data_type={self.data_type}'
 
@@ -396,6 +492,8 @@ class BitFieldDescr(SizedRefOrConst):
 	the actual bits it is composed of, for that use BitField.
 	"""
 
+	__slots__ = ("data_type",)
+
 	def __init__(self, name, size: ValOrConst, data_type: DataType):
 		self.data_type = data_type
 
@@ -453,6 +551,18 @@ class Instruction(SizedRefOrConst):
 
 				self._size += e.length
 
+	def freeze(self):
+		"""Resolve the sizes of the instruction, its encoding, fields and scalars to plain ints."""
+
+		super().freeze()
+
+		for enc in self.encoding:
+			if isinstance(enc, BitField):
+				enc.freeze()
+
+		for obj in itertools.chain(self.fields.values(), self.scalars.values()):
+			obj.freeze()
+
 	def __str__(self) -> str:
 		code_and_mask = f'code={self.code:#0{self.size+2}x}, mask={self.mask:#0{self.size+2}x}'
 		return f'{super().__str__()}, ext_name={self.ext_name}, {code_and_mask}'
@@ -498,6 +608,14 @@ class Function(SizedRefOrConst):
 
 		super().__init__(name, return_len)
 
+	def freeze(self):
+		"""Resolve the sizes of the function, its parameters and scalars to plain ints."""
+
+		super().freeze()
+
+		for obj in itertools.chain(self.args.values(), self.scalars.values()):
+			obj.freeze()
+
 	def __str__(self) -> str:
 		return f'{super().__str__()}, data_type={self.data_type}'
 
@@ -597,3 +715,15 @@ class CoreDef(Named):
 				self.irq_pending_memory = mem
 
 		super().__init__(name)
+
+	def freeze(self):
+		"""Resolve all sizes, values, ranges and widths of the architecture objects
+		of this core to plain ints, so that accessing them does not need to evaluate
+		anything anymore. Behavior nodes are evaluated by calling `generate(None)`,
+		a transformation module returning ints for static expressions must therefore
+		be patched in. Can be called again after adding objects to the core.
+		"""
+
+		for obj in itertools.chain(self.constants.values(), self.memories.values(), self.memory_aliases.values(),
+				self.intrinsics.values(), self.functions.values(), self.instructions.values()):
+			obj.freeze()
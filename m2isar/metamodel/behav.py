@@ -13,10 +13,15 @@ in this module. This object tree can then be traversed with transformation
 functions to generate code or transform the tree.
 
 All classes in this module should inherit from :class:`BaseNode`, but never implement
-the `generate` method here. This method is dynamically overwritten during runtime depending
-on which translation module is loaded using :func:`patch_model`.
+the `generate` method here. :meth:`BaseNode.generate` calls the transformation function
+for the node's class of the pass active in the current thread, see :mod:`.passes`.
+
+Behavior trees consist of very many small objects, all classes therefore use
+`__slots__` instead of a per-instance `__dict__`. A subclass has to list the
+attributes it adds in its own `__slots__`.
 """
 
+import threading
 from typing import TYPE_CHECKING, Union
 
 if TYPE_CHECKING:
@@ -25,15 +30,28 @@ if TYPE_CHECKING:
 
 # pylint: disable=abstract-method
 
+class _ActivePass(threading.local):
+	"""The dispatch table of the pass active in the current thread. The class
+	attribute holds the default table, which is set up by :mod:`.passes`.
+	"""
+
+	table: dict = {}
+
+_active = _ActivePass()
+
 class BaseNode:
-	"""The base class for all behavior model classes. Only implements an
-	empty generate function which raises a :exc:`NotImplementedError` if it is
-	not overridden."""
+	"""The base class for all behavior model classes. Only implements the
+	generate function, which dispatches to the active pass and raises a
+	:exc:`NotImplementedError` if the pass has no transformation for the node."""
+
+	__slots__ = ()
 
 	def generate(self, context):
-		raise NotImplementedError()
+		return _active.table[type(self)](self, context)
 
 class CodeLiteral(BaseNode):
+	__slots__ = ("val",)
+
 	def __init__(self, val) -> None:
 		self.val = val
 
@@ -41,22 +59,30 @@ class Operator(BaseNode):
 	"""Class representing an operator (of either a :class:`.UnaryOperation` or a
 	:class:`.BinaryOperation`)."""
 
+	__slots__ = ("value",)
+
 	def __init__(self, op: str):
 		self.value = op
 
 class Operation(BaseNode):
 	"""Top-level collection class containing a list of actual operations."""
 
+	__slots__ = ("statements",)
+
 	def __init__(self, statements: "list[BaseNode]") -> None:
 		self.statements = statements
 
 class Block(Operation):
 	"""A seperated code block"""
 
+	__slots__ = ()
+
 class BinaryOperation(BaseNode):
 	"""A binary operation with a left-hand and a right-hand operand as well
 	as an operator."""
 
+	__slots__ = ("left", "op", "right")
+
 	def __init__(self, left: BaseNode, op: Operator, right: BaseNode):
 		self.left = left
 		self.op = op
@@ -65,6 +91,8 @@ class BinaryOperation(BaseNode):
 class SliceOperation(BaseNode):
 	"""A slicing operation for extracting bit runs from scalar values."""
 
+	__slots__ = ("expr", "left", "right")
+
 	def __init__(self, expr: BaseNode, left: BaseNode, right: BaseNode):
 		self.expr = expr
 		self.left = left
@@ -73,6 +101,8 @@ class SliceOperation(BaseNode):
 class ConcatOperation(BaseNode):
 	"""A concatenating operation."""
 
+	__slots__ = ("left", "right")
+
 	def __init__(self, left: BaseNode, right: BaseNode) -> None:
 		self.left = left
 		self.right = right
@@ -80,30 +110,37 @@ class ConcatOperation(BaseNode):
 class NumberLiteral(BaseNode):
 	"""A class holding a generic number literal."""
 
+	__slots__ = ("value",)
+
 	def __init__(self, value):
 		self.value = value
 
 class IntLiteral(NumberLiteral):
 	"""A more precise class holding only integer literals."""
 
+	__slots__ = ("bit_size", "signed")
+
 	def __init__(self, value: int, bit_size: int=None, signed: bool=None):
 		super().__init__(value)
 
+		if signed is None:
+			self.signed = value < 0
+		else:
+			self.signed = signed
+
 		if bit_size is None:
-			self.bit_size = value.bit_length()
+			# signed values need an additional sign bit
+			self.bit_size = value.bit_length() + self.signed
 		else:
 			self.bit_size = bit_size
 
 		self.bit_size = max(1, self.bit_size)
 
-		if signed is None:
-			self.signed = value < 0
-		else:
-			self.signed = signed
-
 class Assignment(BaseNode):
 	"""An assignment statement."""
 
+	__slots__ = ("target", "expr")
+
 	def __init__(self, target: BaseNode, expr: BaseNode):
 		self.target = target
 		self.expr = expr
@@ -116,6 +153,8 @@ class Conditional(BaseNode):
 	condition is present is treated as an else statement.
 	"""
 
+	__slots__ = ("conds", "stmts")
+
 	def __init__(self, conds: "list[BaseNode]", stmts: "list[BaseNode]"):
 		self.conds = conds
 		self.stmts = stmts
@@ -125,6 +164,8 @@ class Loop(BaseNode):
 	differentiates between normal while (post_test = False) and do .. while
 	(post_test=True) loops."""
 
+	__slots__ = ("cond", "stmts", "post_test")
+
 	def __init__(self, cond: BaseNode, stmts: "list[BaseNode]", post_test: bool):
 		self.cond = cond
 		self.stmts = stmts if stmts is not None else []
@@ -133,6 +174,8 @@ class Loop(BaseNode):
 class Ternary(BaseNode):
 	"""A ternary expression."""
 
+	__slots__ = ("cond", "then_expr", "else_expr")
+
 	def __init__(self, cond: BaseNode, then_expr: BaseNode, else_expr: BaseNode):
 		self.cond = cond
 		self.then_expr = then_expr
@@ -143,21 +186,29 @@ class ScalarDefinition(BaseNode):
 	declaring it, use the scalar definition as LHS of an assignment statement.
 	"""
 
+	__slots__ = ("scalar",)
+
 	def __init__(self, scalar: "Scalar"):
 		self.scalar = scalar
 
 class Return(BaseNode):
 	"""A return expression."""
 
+	__slots__ = ("expr",)
+
 	def __init__(self, expr: BaseNode):
 		self.expr = expr
 
 class Break(BaseNode):
 	"""A break statement."""
 
+	__slots__ = ()
+
 class UnaryOperation(BaseNode):
 	"""An unary operation, whith an operator and a right hand operand."""
 
+	__slots__ = ("op", "right")
+
 	def __init__(self, op: Operator, right: BaseNode):
 		self.op = op
 		self.right = right
@@ -165,6 +216,8 @@ class UnaryOperation(BaseNode):
 class NamedReference(BaseNode):
 	"""A named reference to a :class:`arch.Memory`, BitFieldDescr, Scalar, Constant or FnParam."""
 
+	__slots__ = ("reference",)
+
 	def __init__(self, reference: Union["Memory", "BitFieldDescr", "Scalar", "Constant", "FnParam", "Intrinsic"]):
 		self.reference = reference
 
@@ -172,6 +225,8 @@ class IndexedReference(BaseNode):
 	"""An indexed reference to a :class:`..arch.Memory`. Can optionally specify a range of indices
 	using the `right` parameter."""
 
+	__slots__ = ("reference", "index", "right")
+
 	def __init__(self, reference: "Memory", index: BaseNode, right: BaseNode=None):
 		self.reference = reference
 		self.index = index
@@ -179,6 +234,9 @@ class IndexedReference(BaseNode):
 
 class TypeConv(BaseNode):
 	"""A type conversion. Size can be None, in this case only the signedness is affected."""
+
+	__slots__ = ("data_type", "size", "expr", "actual_size")
+
 	def __init__(self, data_type, size, expr: BaseNode):
 		self.data_type = data_type
 		self.size = size
@@ -194,6 +252,8 @@ class TypeConv(BaseNode):
 class Callable(BaseNode):
 	"""A generic invocation of a callable."""
 
+	__slots__ = ("ref_or_name", "args")
+
 	def __init__(self, ref_or_name: Union[str, "Function"], args: "list[BaseNode]") -> None:
 		self.ref_or_name = ref_or_name
 		self.args = args if args is not None else []
@@ -201,10 +261,17 @@ class Callable(BaseNode):
 class FunctionCall(Callable):
 	"""A function (method with return value) call."""
 
+	__slots__ = ()
+
 class ProcedureCall(Callable):
 	"""A procedure (method without return value) call."""
 
+	__slots__ = ()
+
 class Group(BaseNode):
 	"""A group of expressions, used e.g. for parenthesized expressions."""
+
+	__slots__ = ("expr",)
+
 	def __init__(self, expr: BaseNode):
 		self.expr = expr
@@ -0,0 +1,504 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Random-access file format for M2-ISA-R models.
+
+A model file starts with a fixed header, followed by an index and the encoded
+model objects::
+
+	magic (8 bytes) | format version (u32) | index length (u64) | index | objects
+
+The index maps each core to the location of its core definition and of each of
+its functions and instructions, grouped by instruction set. Every object is an
+individual pickle, references to other named objects of the same core are stored
+by name and resolved on loading. Behavior statements shared by multiple
+instructions of a core, like those of always blocks, are stored once per core
+and stay shared after loading. The file is memory-mapped and decoded lazily:
+a core is only decoded when it is accessed in the returned models dict, its
+functions and instructions only when they are accessed in the core's dicts.
+
+A model can also be split into shards, one file per core or additionally one
+file per instruction set of each core, listed in a JSON manifest. Consumers then
+only read the shards of the cores they need.
+
+Files without the header are plain pickles of the models dict, as written by
+older versions. Their objects can not be restored into the current metamodel
+classes, loading them raises an error asking to rebuild the model.
+"""
+
+import io
+import json
+import mmap
+import pathlib
+import pickle
+import struct
+from collections.abc import MutableMapping
+
+from .. import M2NameError, M2ValueError
+from . import arch
+
+MAGIC = b"M2ISARMD"
+FORMAT_VERSION = 4
+"""Increment this when the layout of model files or of the stored objects changes."""
+
+_HEADER = struct.Struct("<8sIQ")
+
+SHARD_MODES = ("core", "extension")
+"""Possible ways to split a model into multiple files."""
+
+_LAZY_CORE_ATTRS = ("functions", "instructions", "functions_by_ext", "instructions_by_ext", "instructions_by_class")
+"""CoreDef attributes which are not stored in the core object, but rebuilt from the index."""
+
+_UNLOADED = object()
+
+class LazyMapping(MutableMapping):
+	"""A dict-like mapping with a fixed key order, whose values are only
+	loaded from a model file on first access.
+	"""
+
+	def __init__(self, keys, loader):
+		self._data = dict.fromkeys(keys, _UNLOADED)
+		self._loader = loader
+
+	def __getitem__(self, key):
+		val = self._data[key]
+		if val is _UNLOADED:
+			val = self._loader(key)
+			self._data[key] = val
+		return val
+
+	def __setitem__(self, key, val):
+		self._data[key] = val
+
+	def __delitem__(self, key):
+		del self._data[key]
+
+	def __iter__(self):
+		return iter(self._data)
+
+	def __len__(self):
+		return len(self._data)
+
+	def __contains__(self, key):
+		return key in self._data
+
+	def __repr__(self):
+		return f"<LazyMapping object>: {len(self._data)} items"
+
+	def __reduce__(self):
+		# load everything and pickle as plain dict
+		return (dict, (list(self.items()),))
+
+def _get_state(obj):
+	"""Return the class and pickle state of an object."""
+
+	rv = obj.__reduce_ex__(pickle.HIGHEST_PROTOCOL)
+	return type(obj), rv[2]
+
+def _set_state(obj, state):
+	"""Apply a pickle state to a newly created object, like pickle does."""
+
+	setstate = getattr(obj, "__setstate__", None)
+	if setstate is not None:
+		setstate(state)
+		return
+
+	slotstate = None
+	if isinstance(state, tuple) and len(state) == 2:
+		state, slotstate = state
+
+	if state:
+		obj.__dict__.update(state)
+	if slotstate:
+		for key, val in slotstate.items():
+			setattr(obj, key, val)
+
+class _ObjectPickler(pickle.Pickler):
+	"""Pickler storing references to named objects of a core as persistent IDs."""
+
+	def __init__(self, file, ids: "dict[int, tuple]"):
+		super().__init__(file, pickle.HIGHEST_PROTOCOL)
+		self.ids = ids
+
+	def persistent_id(self, obj):
+		return self.ids.get(id(obj))
+
+def _encode(obj, ids, exclude=()) -> bytes:
+	"""Encode an object as two consecutive pickles, its class and its state.
+	Attributes in `exclude` are left out.
+	"""
+
+	cls, state = _get_state(obj)
+
+	if exclude:
+		if isinstance(state, tuple):
+			state = tuple({key: val for key, val in part.items() if key not in exclude} if part else part for part in state)
+		else:
+			state = {key: val for key, val in state.items() if key not in exclude}
+
+	# the memo is shared by both pickles, use the same pickler for both
+	f = io.BytesIO()
+	pickler = _ObjectPickler(f, ids)
+	pickler.dump(cls)
+	pickler.dump(state)
+	return f.getvalue()
+
+def _shared_statements(instructions: "list[arch.Instruction]") -> list:
+	"""Return the top-level behavior statements which are part of multiple instructions."""
+
+	seen = set()
+	ret = {}
+
+	for instr_def in instructions:
+		for stmt in getattr(instr_def.operation, "statements", ()):
+			if id(stmt) in seen:
+				ret[id(stmt)] = stmt
+			else:
+				seen.add(id(stmt))
+
+	return list(ret.values())
+
+def _encode_core(core: arch.CoreDef) -> dict:
+	"""Encode a core definition and all its functions and instructions."""
+
+	# objects stored individually, always referenced by name
+	fn_ids = {id(fn_def): ("fn", fn_name) for fn_name, fn_def in core.functions.items()}
+	fn_ids.update({id(instr_def): ("instr", key) for key, instr_def in core.instructions.items()})
+
+	# objects stored in the core definition
+	ids = dict(fn_ids)
+	for kind, items in (("const", core.constants), ("mem", core.memories), ("alias", core.memory_aliases), ("intrinsic", core.intrinsics)):
+		ids.update({id(obj): (kind, name) for name, obj in items.items()})
+
+	# statements stored once for all instructions
+	shared = _shared_statements(core.instructions.values())
+	shared_data = None
+	if shared:
+		f = io.BytesIO()
+		_ObjectPickler(f, ids).dump(shared)
+		shared_data = f.getvalue()
+
+	instr_ids = dict(ids)
+	instr_ids.update({id(stmt): ("shared", idx) for idx, stmt in enumerate(shared)})
+
+	return {
+		"core": _encode(core, fn_ids, _LAZY_CORE_ATTRS),
+		"shared": shared_data,
+		"functions": {fn_name: (fn_def.ext_name, _encode(fn_def, ids)) for fn_name, fn_def in core.functions.items()},
+		"instructions": {key: (instr_def.ext_name, instr_def.size, _encode(instr_def, instr_ids)) for key, instr_def in core.instructions.items()}
+	}
+
+def _write_file(path, entries: "dict[str, dict]"):
+	"""Write encoded cores to a model file. Cores without core definition, and
+	instructions without data, are only listed in the index.
+	"""
+
+	index = {}
+	blobs = []
+	offset = 0
+
+	def add_blob(data):
+		nonlocal offset
+		if data is None:
+			return ()
+		blobs.append(data)
+		ret = (offset, len(data))
+		offset += len(data)
+		return ret
+
+	for core_name, entry in entries.items():
+		index[core_name] = {
+			"core": add_blob(entry["core"]) or None,
+			"shared": add_blob(entry.get("shared")) or None,
+			"functions": {fn_name: (ext_name,) + add_blob(data) for fn_name, (ext_name, data) in entry["functions"].items()},
+			"instructions": {key: (ext_name, size) + add_blob(data) for key, (ext_name, size, data) in entry["instructions"].items()}
+		}
+
+	index_data = pickle.dumps(index, pickle.HIGHEST_PROTOCOL)
+
+	with open(path, "wb") as f:
+		f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(index_data)))
+		f.write(index_data)
+		for blob in blobs:
+			f.write(blob)
+
+def write_model(path, models: "dict[str, arch.CoreDef]", shard: str=None) -> "list[pathlib.Path]":
+	"""Write a models dict to `path` in the random-access model format. Returns
+	the paths of all written files.
+
+	With `shard` set to "core", each core is written to its own file in a directory
+	next to `path`, named like `path` without suffix. With "extension", the
+	instructions of each instruction set of a core are additionally split into
+	separate files. `path` then holds a JSON manifest listing the shards of all cores.
+	"""
+
+	path = pathlib.Path(path)
+	shard_dir = path.with_suffix("")
+
+	# remove shards of previous runs
+	if shard_dir != path and shard_dir.is_dir():
+		for stale in shard_dir.glob("*.m2isarmodel"):
+			stale.unlink()
+
+	if shard is None:
+		_write_file(path, {core_name: _encode_core(core) for core_name, core in models.items()})
+		return [path]
+
+	if shard not in SHARD_MODES:
+		raise ValueError(f"unknown shard mode {shard}")
+	if shard_dir == path:
+		raise ValueError(f"sharded model path {path} needs a file suffix")
+
+	shard_dir.mkdir(parents=True, exist_ok=True)
+	written = []
+	manifest = {"format": FORMAT_VERSION, "shard": shard, "cores": {}}
+
+	for core_name, core in models.items():
+		entry = _encode_core(core)
+		extensions = {}
+
+		if shard == "extension":
+			by_ext = {}
+			for key, (ext_name, size, data) in entry["instructions"].items():
+				by_ext.setdefault(ext_name, {})[key] = (ext_name, size, data)
+				# keep instruction order and metadata in the core shard
+				entry["instructions"][key] = (ext_name, size, None)
+
+			for ext_name, instructions in by_ext.items():
+				ext_file = shard_dir / f"{core_name}.{ext_name}.m2isarmodel"
+				_write_file(ext_file, {core_name: {"core": None, "functions": {}, "instructions": instructions}})
+				extensions[ext_name] = str(ext_file.relative_to(path.parent))
+				written.append(ext_file)
+
+		core_file = shard_dir / f"{core_name}.m2isarmodel"
+		_write_file(core_file, {core_name: entry})
+		written.append(core_file)
+
+		manifest["cores"][core_name] = {"file": str(core_file.relative_to(path.parent)), "extensions": extensions}
+
+	with open(path, "w", encoding="utf-8") as f:
+		json.dump(manifest, f, indent=1)
+
+	return [path] + written
+
+class _CoreLoader:
+	"""Decodes the objects of one core on demand. Instructions can be stored in
+	separate per-extension shard files, which are only opened when needed.
+	"""
+
+	def __init__(self, core_name: str, model_file: "ModelFile", ext_files: "dict[str, pathlib.Path]"=None):
+		self.core_name = core_name
+		self.model_file = model_file
+		self.entry = model_file.index[core_name]
+		self.ext_files = ext_files or {}
+		self.ext_model_files = {}
+		self.core = None
+		self.shared = None
+		self.objects = {}
+
+	def _load_blob(self, model_file: "ModelFile", location, pid=None):
+		"""Decode the object stored at `location`. The new object is registered
+		as `pid` before its contents are decoded, to allow cyclic references.
+		"""
+
+		unpickler = pickle.Unpickler(io.BytesIO(model_file.read(*location[-2:])))
+		unpickler.persistent_load = self._persistent_load
+
+		cls = unpickler.load()
+		obj = cls.__new__(cls)
+		if pid is not None:
+			self.objects[pid] = obj
+
+		_set_state(obj, unpickler.load())
+		return obj
+
+	def _persistent_load(self, pid):
+		kind, name = pid
+
+		if kind == "fn":
+			return self.load_function(name)
+		if kind == "instr":
+			return self.load_instruction(name)
+		if kind == "const":
+			return self.core.constants[name]
+		if kind == "mem":
+			return self.core.memories[name]
+		if kind == "alias":
+			return self.core.memory_aliases[name]
+		if kind == "intrinsic":
+			return self.core.intrinsics[name]
+		if kind == "shared":
+			return self.load_shared()[name]
+
+		raise pickle.UnpicklingError(f"unknown object reference {pid}")
+
+	def load_shared(self) -> list:
+		"""Decode the behavior statements shared by multiple instructions."""
+
+		if self.shared is None:
+			unpickler = pickle.Unpickler(io.BytesIO(self.model_file.read(*self.entry["shared"])))
+			unpickler.persistent_load = self._persistent_load
+			self.shared = unpickler.load()
+		return self.shared
+
+	def load_function(self, name):
+		obj = self.objects.get(("fn", name))
+		if obj is None:
+			obj = self._load_blob(self.model_file, self.entry["functions"][name], ("fn", name))
+		return obj
+
+	def load_instruction(self, key):
+		obj = self.objects.get(("instr", key))
+		if obj is not None:
+			return obj
+
+		model_file = self.model_file
+		location = self.entry["instructions"][key]
+
+		# instruction data is stored in an extension shard
+		if len(location) == 2:
+			ext_name = location[0]
+			model_file = self.ext_model_files.get(ext_name)
+			if model_file is None:
+				model_file = self.ext_model_files[ext_name] = ModelFile(self.ext_files[ext_name])
+			location = model_file.index[self.core_name]["instructions"][key]
+
+		return self._load_blob(model_file, location, ("instr", key))
+
+	def load_core(self) -> arch.CoreDef:
+		# the core definition itself references its functions and instructions
+		# only through the lazy dicts set up below
+		core = self._load_blob(self.model_file, self.entry["core"])
+		self.core = core
+
+		functions = self.entry["functions"]
+		instructions = self.entry["instructions"]
+
+		core.functions = LazyMapping(functions, self.load_function)
+		core.instructions = LazyMapping(instructions, self.load_instruction)
+
+		core.functions_by_ext = {}
+		for fn_name, (ext_name, *_) in functions.items():
+			core.functions_by_ext.setdefault(ext_name, []).append(fn_name)
+		core.functions_by_ext = _grouped(core.functions_by_ext, core.functions)
+
+		core.instructions_by_ext = {}
+		core.instructions_by_class = {}
+		for key, (ext_name, size, *_) in instructions.items():
+			core.instructions_by_ext.setdefault(ext_name, []).append(key)
+			core.instructions_by_class.setdefault(size, []).append(key)
+		core.instructions_by_ext = _grouped(core.instructions_by_ext, core.instructions)
+		core.instructions_by_class = _grouped(core.instructions_by_class, core.instructions)
+
+		return core
+
+def _grouped(groups: "dict[object, list]", source: LazyMapping):
+	"""Build a defaultdict-like dict of lazy views into `source`, with the given keys per group."""
+
+	ret = _GroupDict(lambda: LazyMapping([], source.__getitem__))
+	for group, keys in groups.items():
+		ret[group] = LazyMapping(keys, source.__getitem__)
+	return ret
+
+class _GroupDict(dict):
+	"""Like a :class:`collections.defaultdict`, but picklable with a local default factory."""
+
+	def __init__(self, default_factory):
+		super().__init__()
+		self.default_factory = default_factory
+
+	def __missing__(self, key):
+		ret = self[key] = self.default_factory()
+		return ret
+
+	def __reduce__(self):
+		return (dict, (list(self.items()),))
+
+class ModelFile:
+	"""An opened model file. Gives access to the index and to individual cores."""
+
+	def __init__(self, path):
+		with open(path, "rb") as f:
+			header = f.read(_HEADER.size)
+			magic, version, index_len = _HEADER.unpack(header) if len(header) == _HEADER.size else (None, None, None)
+
+			if magic != MAGIC:
+				raise pickle.UnpicklingError(f"{path} is not a random-access model file")
+			if version != FORMAT_VERSION:
+				raise pickle.UnpicklingError(f"{path} has unsupported model format version {version}, expected {FORMAT_VERSION}")
+
+			self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		self.index: "dict[str, dict]" = pickle.loads(self.buf[_HEADER.size:_HEADER.size+index_len])
+		self.data_start = _HEADER.size + index_len
+
+	@property
+	def core_names(self) -> "list[str]":
+		return list(self.index)
+
+	def read(self, offset: int, length: int) -> bytes:
+		start = self.data_start + offset
+		return self.buf[start:start+length]
+
+	def load_core(self, core_name: str, ext_files: "dict[str, pathlib.Path]"=None) -> arch.CoreDef:
+		"""Decode the core definition of `core_name`. Its functions and instructions
+		are decoded on first access. `ext_files` locates the extension shards of the core.
+		"""
+
+		return _CoreLoader(core_name, self, ext_files).load_core()
+
+	def models(self, cores: "list[str]"=None) -> "dict[str, arch.CoreDef]":
+		"""Return a lazily decoded models dict of all cores in this file, or only of `cores`."""
+
+		return LazyMapping(_select(self.index, cores), self.load_core)
+
+def _select(available, cores):
+	if cores is None:
+		return list(available)
+
+	missing = [core_name for core_name in cores if core_name not in available]
+	if missing:
+		raise M2NameError(f"core(s) {', '.join(missing)} not found in model, available cores: {', '.join(available)}")
+
+	return [core_name for core_name in available if core_name in cores]
+
+def _load_manifest(path: pathlib.Path, cores: "list[str]"=None) -> "dict[str, arch.CoreDef]":
+	with open(path, "r", encoding="utf-8") as f:
+		manifest = json.load(f)
+
+	if manifest.get("format") != FORMAT_VERSION:
+		raise ValueError(f"{path} has unsupported model format version {manifest.get('format')}, expected {FORMAT_VERSION}")
+
+	shards = manifest["cores"]
+
+	def load_core(core_name):
+		shard = shards[core_name]
+		ext_files = {ext_name: path.parent / ext_file for ext_name, ext_file in shard["extensions"].items()}
+		return ModelFile(path.parent / shard["file"]).load_core(core_name, ext_files)
+
+	return LazyMapping(_select(shards, cores), load_core)
+
+def load_model(path, cores: "list[str]"=None) -> "dict[str, arch.CoreDef]":
+	"""Load the models dict from a model file of any format, or from a shard manifest.
+	If `cores` is given, only these cores are loaded, from a sharded model only
+	their shards are read.
+	"""
+
+	path = pathlib.Path(path)
+
+	with open(path, "rb") as f:
+		start = f.read(len(MAGIC))
+
+	if start == MAGIC:
+		return ModelFile(path).models(cores)
+
+	if start.startswith(b"{"):
+		return _load_manifest(path, cores)
+
+	raise M2ValueError(f"{path} is a model file of an older M2-ISA-R version, which can not be loaded anymore, "
+		"rebuild it from the CoreDSL sources with the current parser")
@@ -0,0 +1,163 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Passes over behavior models.
+
+A :class:`Pass` is created once from a module of transformation functions,
+see :func:`m2isar.metamodel.patch_model` for their signature. It precomputes a
+dispatch table from each behavior class to the transformation function
+handling it. :meth:`BaseNode.generate <m2isar.metamodel.behav.BaseNode.generate>`
+looks the function up in the table of the pass active in the calling thread,
+so that no class is modified and different passes can run concurrently in
+different threads.
+
+Threads without an active pass use the default table, which
+:func:`m2isar.metamodel.patch_model` fills for compatibility.
+
+Passes are registered once per module by :func:`get_pass`:
+
+	simplifier = get_pass(expr_simplifier)
+	simplifier.run(instr_def.operation, None)
+
+or, to run multiple traversals with the same pass:
+
+	with simplifier.active():
+		instr_def.operation.generate(None)
+"""
+
+import contextlib
+import inspect
+import logging
+import threading
+import types
+
+from . import behav
+
+# pylint: disable=protected-access
+
+logger = logging.getLogger("passes")
+
+def _not_implemented(self, context):
+	raise NotImplementedError(f"no transformation for {type(self).__name__}")
+
+def find_handlers(module: types.ModuleType) -> "dict[type, callable]":
+	"""Find the transformation functions inside `module`, return a dict of the
+	behavior class each function is associated with to the function.
+	"""
+
+	ret = {}
+
+	for _, fn in inspect.getmembers(module, inspect.isfunction):
+		sig = inspect.signature(fn)
+		param = sig.parameters.get("self")
+		if not param:
+			continue
+		if not param.annotation:
+			raise ValueError(f"self parameter not annotated correctly for {fn}")
+		if not issubclass(param.annotation, behav.BaseNode):
+			raise TypeError(f"self parameter for {fn} has wrong subclass")
+
+		ret[param.annotation] = fn
+
+	return ret
+
+class DispatchTable(dict):
+	"""Maps behavior classes to transformation functions. Classes without a
+	function of their own use the function of their nearest base class,
+	looked up on first use.
+	"""
+
+	def __init__(self, handlers: "dict[type, callable]"):
+		super().__init__()
+		self.handlers = dict(handlers)
+		self.resolve_all()
+
+	def resolve_all(self):
+		"""(Re-)calculate the entries for all classes in :mod:`m2isar.metamodel.behav`."""
+
+		self.clear()
+		for cls in vars(behav).values():
+			if isinstance(cls, type) and issubclass(cls, behav.BaseNode):
+				self[cls] # pylint: disable=pointless-statement
+
+	def __missing__(self, cls):
+		fn = _not_implemented
+		for base in cls.__mro__:
+			if base in self.handlers:
+				fn = self.handlers[base]
+				break
+
+		self[cls] = fn
+		return fn
+
+_default = behav._ActivePass.table = DispatchTable({})
+"""The dispatch table of threads without an active pass."""
+
+class Pass:
+	"""A behavior model transformation, consisting of the transformation
+	functions inside `module`.
+	"""
+
+	def __init__(self, module: types.ModuleType):
+		self.name = module.__name__
+		self.table = DispatchTable(find_handlers(module))
+
+	@contextlib.contextmanager
+	def active(self):
+		"""Make this pass active in the current thread, restoring the previously
+		active pass on exit.
+		"""
+
+		prev = behav._active.table
+		behav._active.table = self.table
+		try:
+			yield self
+		finally:
+			behav._active.table = prev
+
+	def run(self, node: behav.BaseNode, context):
+		"""Apply this pass to the behavior tree `node`, return the result of the
+		transformation function for `node`.
+		"""
+
+		prev = behav._active.table
+		behav._active.table = self.table
+		try:
+			return self.table[type(node)](node, context)
+		finally:
+			behav._active.table = prev
+
+	def __repr__(self):
+		return f"<Pass {self.name}>"
+
+_passes: "dict[str, Pass]" = {}
+_passes_lock = threading.Lock()
+
+def get_pass(module: types.ModuleType) -> Pass:
+	"""Return the :class:`Pass` of the transformation functions inside `module`,
+	creating it on first use.
+	"""
+
+	ret = _passes.get(module.__name__)
+	if ret is None:
+		with _passes_lock:
+			ret = _passes.get(module.__name__)
+			if ret is None:
+				logger.debug("registering pass %s", module.__name__)
+				ret = _passes[module.__name__] = Pass(module)
+	return ret
+
+def set_default(module: types.ModuleType):
+	"""Add the transformation functions inside `module` to the default dispatch
+	table, replacing existing functions for the same classes.
+	"""
+
+	for cls, fn in get_pass(module).table.handlers.items():
+		logger.debug("patching %s with fn %s", cls, fn)
+		_default.handlers[cls] = fn
+	_default.resolve_all()
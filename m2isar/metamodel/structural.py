@@ -0,0 +1,176 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Structural identity of behavior trees.
+
+:class:`StructuralHasher` calculates a hash for each behavior node, which only
+depends on the node's type, its attributes and its children, and on the
+architecture objects it references. The hash is stable across processes and
+can be used to memoize per-node results of passes and backends.
+
+:class:`Interner` makes identical nodes share one object. Behavior trees are
+transformed in place by most passes, only nodes of :data:`SHAREABLE_NODES`
+are therefore ever shared.
+"""
+
+import hashlib
+from enum import Enum
+
+from . import arch, behav
+
+SHAREABLE_NODES = (behav.Operator, behav.NamedReference, behav.CodeLiteral, behav.Break)
+"""Node classes whose instances are never modified by any pass, identical
+instances can therefore be shared between trees.
+"""
+
+_EXCLUDED_FIELDS = frozenset(("children", "parent"))
+"""Fields of architecture objects which only link them to other objects of the model."""
+
+_ARCH_FIELDS = {
+	arch.Function: ("name", "_size", "data_type", "extern"),
+}
+"""Fields describing architecture objects without `__slots__`."""
+
+_fields_cache = {}
+
+def node_fields(cls) -> "tuple[str]":
+	"""Return the names of all slots of `cls` and its base classes, base classes first."""
+
+	ret = _fields_cache.get(cls)
+	if ret is None:
+		ret = []
+		for base in reversed(cls.__mro__):
+			slots = base.__dict__.get("__slots__", ())
+			if isinstance(slots, str):
+				slots = (slots,)
+			ret.extend(slots)
+		ret = _fields_cache[cls] = tuple(ret)
+	return ret
+
+def _digest(*parts: bytes) -> bytes:
+	h = hashlib.blake2b(digest_size=16)
+	for part in parts:
+		h.update(part)
+	return h.digest()
+
+class StructuralHasher:
+	"""Calculates structural hashes of behavior trees. Hashes are memoized per
+	object, a hasher must not be used any more after the trees it has seen were
+	modified.
+
+	Architecture objects are hashed by their type, name and description, i.e.
+	size, data type and value, so that references to equally named objects with
+	different properties, like the `X` registers of a 32 and a 64 bit core,
+	have different hashes.
+	"""
+
+	def __init__(self):
+		self._memo: "dict[int, tuple[object, bytes]]" = {}
+		self._values: "dict[tuple, bytes]" = {}
+
+	def hash(self, obj) -> bytes:
+		"""Return the 16 byte structural hash of `obj`."""
+
+		if obj is None or isinstance(obj, (bool, int, float, str)):
+			key = (type(obj), obj)
+			ret = self._values.get(key)
+			if ret is None:
+				ret = self._values[key] = _digest(type(obj).__name__.encode(), b":", repr(obj).encode())
+			return ret
+
+		if isinstance(obj, Enum):
+			return self.hash(f"{type(obj).__name__}.{obj.name}")
+
+		entry = self._memo.get(id(obj))
+		if entry is not None:
+			return entry[1]
+
+		if isinstance(obj, (list, tuple)):
+			ret = _digest(b"list", *(self.hash(item) for item in obj))
+		elif isinstance(obj, dict):
+			ret = _digest(b"dict", *(self.hash(key) + self.hash(val) for key, val in obj.items()))
+		else:
+			ret = _digest(type(obj).__name__.encode(), *(self.hash(getattr(obj, field, None)) for field in self._fields(obj)))
+
+		# keep the object alive, its id must not be reused while memoized
+		self._memo[id(obj)] = (obj, ret)
+		return ret
+
+	def hexdigest(self, obj) -> str:
+		"""Return the structural hash of `obj` as hex string."""
+
+		return self.hash(obj).hex()
+
+	@staticmethod
+	def _fields(obj):
+		cls = type(obj)
+
+		if isinstance(obj, behav.BaseNode):
+			return node_fields(cls)
+
+		fields = _ARCH_FIELDS.get(cls)
+		if fields is not None:
+			return fields
+
+		if hasattr(obj, "__dict__"):
+			if isinstance(obj, arch.Named):
+				return ("name",)
+			raise TypeError(f"can not hash object of type {cls.__name__}")
+
+		return tuple(field for field in node_fields(cls) if field not in _EXCLUDED_FIELDS)
+
+def structural_hash(node: behav.BaseNode) -> str:
+	"""Return the structural hash of a single behavior tree as hex string. Use a
+	:class:`StructuralHasher` to hash multiple trees with shared memoization.
+	"""
+
+	return StructuralHasher().hexdigest(node)
+
+class Interner:
+	"""Replaces nodes in behavior trees by a canonical instance for all
+	structurally identical nodes, if their class is in :data:`SHAREABLE_NODES`.
+	Referenced architecture objects are compared by identity.
+	"""
+
+	def __init__(self):
+		self._canonical: "dict[tuple, behav.BaseNode]" = {}
+		self.shared = 0
+
+	def intern(self, node):
+		"""Intern all shareable nodes of the tree `node` in place. Returns the
+		canonical instance of `node` itself, which is `node` if it is not shareable.
+		"""
+
+		if isinstance(node, list):
+			for idx, item in enumerate(node):
+				node[idx] = self.intern(item)
+			return node
+
+		if not isinstance(node, behav.BaseNode):
+			return node
+
+		if isinstance(node, SHAREABLE_NODES):
+			key = (type(node),) + tuple(self._key(getattr(node, field, None)) for field in node_fields(type(node)))
+			canonical = self._canonical.setdefault(key, node)
+			if canonical is not node:
+				self.shared += 1
+			return canonical
+
+		for field in node_fields(type(node)):
+			val = getattr(node, field, None)
+			if isinstance(val, (list, behav.BaseNode)):
+				setattr(node, field, self.intern(val))
+
+		return node
+
+	@staticmethod
+	def _key(val):
+		if val is None or isinstance(val, (bool, int, str, Enum)):
+			return (type(val), val)
+		# the canonical node keeps the referenced object alive
+		return id(val)
@@ -0,0 +1,218 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Non-recursive traversal of behavior trees.
+
+Passes built from transformation functions, see :mod:`.passes`, recurse
+through Python calls, each level of a behavior tree costs two Python frames.
+Deeply nested expressions can therefore exceed the recursion limit.
+:class:`Traversal` walks a tree with an explicit stack instead and calls hook
+functions for each node:
+
+* visit hooks `visit(node, context)` are generator functions, which visit the
+  children of their node themselves, in any order and with any context. They
+  yield a `(child, context)` tuple for each child to visit, receive the result
+  for the child and return the result for their node. Exceptions raised while
+  visiting a child are raised at the yield.
+* post-order hooks `post(node, results, context)` are used for nodes without
+  visit hook. They are called after all children were visited with the same
+  context, with the list of the results of the children. Their return value is
+  the result for the node.
+
+Hooks are looked up by the class of the node, a class without hooks of its own
+uses those of its nearest base class. Children of nodes without visit hook are
+visited in the order of :data:`CHILDREN`, which is the order the transformation
+functions in :mod:`m2isar.metamodel.utils` visit them in.
+
+The generator driving a traversal is passed to :meth:`Traversal.run_steps`.
+Traversals are registered once per module of hook functions by :func:`get_traversal`:
+
+	def _root(node, context):
+		return (yield node, context)
+
+	result = get_traversal(fused_traversal).run_steps(_root(stmt, context))
+
+Walking a tree this way costs more per node than recursion. Passes therefore
+stay recursive and use a traversal only for trees too deep for recursion, see
+:mod:`.utils.fused_preprocessor`.
+"""
+
+import inspect
+import logging
+import threading
+import types
+from operator import attrgetter
+from types import GeneratorType
+
+from . import behav
+
+logger = logging.getLogger("traversal")
+
+CHILDREN = {
+	behav.Operation: attrgetter("statements"),
+	behav.BinaryOperation: attrgetter("left", "right"),
+	behav.SliceOperation: attrgetter("expr", "left", "right"),
+	behav.ConcatOperation: attrgetter("left", "right"),
+	behav.Assignment: attrgetter("target", "expr"),
+	behav.Conditional: lambda node: node.conds + node.stmts,
+	behav.Loop: lambda node: [node.cond] + node.stmts,
+	behav.Ternary: attrgetter("cond", "then_expr", "else_expr"),
+	behav.Return: lambda node: () if node.expr is None else (node.expr,),
+	behav.UnaryOperation: lambda node: (node.right,),
+	behav.IndexedReference: lambda node: (node.index,),
+	behav.TypeConv: lambda node: (node.expr,),
+	behav.Callable: attrgetter("args"),
+	behav.Group: lambda node: (node.expr,),
+}
+"""Functions returning the child nodes of each behavior class, in traversal
+order. Classes not listed here and without listed base class have no children.
+"""
+
+def _resolve(hooks: dict, cls: type, default):
+	for base in cls.__mro__:
+		if base in hooks:
+			return hooks[base]
+	return default
+
+def _missing_hook(node, results, context):
+	raise NotImplementedError(f"no post-order hook for {type(node).__name__}")
+
+class Traversal:
+	"""A behavior tree traversal with the given post-order and visit hooks, both
+	dicts of behavior class to hook function. A node without visit or post-order
+	hook raises a :exc:`NotImplementedError`.
+	"""
+
+	def __init__(self, post: dict, visit: dict=None):
+		self.post_hooks = dict(post)
+		self.visit_hooks = dict(visit or {})
+		self._dispatch = {}
+
+	def _dispatch_entry(self, cls: type) -> tuple:
+		"""Return the visit and post-order hooks and the children function for
+		`cls`, as used by :meth:`run_steps`.
+		"""
+
+		ret = self._dispatch[cls] = (
+			_resolve(self.visit_hooks, cls, None),
+			_resolve(self.post_hooks, cls, _missing_hook),
+			_resolve(CHILDREN, cls, None)
+		)
+		return ret
+
+	def run_steps(self, steps: GeneratorType):
+		"""Run the generator `steps` like a visit hook, visiting the `(node, context)`
+		tuples it yields with this traversal. Returns the return value of `steps`.
+		"""
+
+		dispatch = self._dispatch
+
+		# generators of the ancestors of the node currently being visited
+		stack = []
+		push = stack.append
+		pop = stack.pop
+		gen = steps
+		value = error = None
+
+		while True:
+			try:
+				if error is None:
+					node, ctx = gen.send(value)
+				else:
+					exc, error = error, None
+					node, ctx = gen.throw(exc)
+			except StopIteration as stop:
+				if not stack:
+					return stop.value
+				gen = pop()
+				value = stop.value
+				continue
+			except Exception as e: # pylint: disable=broad-except
+				if not stack:
+					raise
+				# passed on to the generator of the parent node
+				gen = pop()
+				error, value = e, None
+				continue
+
+			try:
+				try:
+					visit, post, children_fn = dispatch[type(node)]
+				except KeyError:
+					visit, post, children_fn = self._dispatch_entry(type(node))
+
+				if visit is not None:
+					push(gen)
+					gen = visit(node, ctx)
+					value = None
+					continue
+
+				nodes = () if children_fn is None else children_fn(node)
+
+				if nodes:
+					push(gen)
+					gen = _post_steps(post, node, nodes, ctx)
+					value = None
+				else:
+					value = post(node, [], ctx)
+
+			except Exception as e: # pylint: disable=broad-except
+				error, value = e, None
+
+def _post_steps(hook, node, nodes, context):
+	"""Visit `nodes` as the children of `node` without visit hook."""
+
+	results = []
+	for child in nodes:
+		results.append((yield child, context))
+	return hook(node, results, context)
+
+def find_hooks(module: types.ModuleType) -> "tuple[dict[type, callable], dict[type, callable]]":
+	"""Find the hook functions inside `module`, return dicts of the behavior class
+	each function is associated with to the function, for post-order and visit
+	hooks. Hook functions have a `node` parameter annotated with their behavior
+	class. Post-order hooks additionally have a `results` parameter, visit hooks are
+	generator functions.
+	"""
+
+	post = {}
+	visit = {}
+
+	for _, fn in inspect.getmembers(module, inspect.isfunction):
+		params = inspect.signature(fn).parameters
+		param = params.get("node")
+		if not param:
+			continue
+		if not isinstance(param.annotation, type) or not issubclass(param.annotation, behav.BaseNode):
+			continue
+
+		if "results" in params:
+			post[param.annotation] = fn
+		elif inspect.isgeneratorfunction(fn):
+			visit[param.annotation] = fn
+		else:
+			raise TypeError(f"hook {fn.__name__} is neither a generator function nor has a results parameter")
+
+	return post, visit
+
+_traversals: "dict[str, Traversal]" = {}
+_traversals_lock = threading.Lock()
+
+def get_traversal(module: types.ModuleType) -> Traversal:
+	"""Return the :class:`Traversal` of the hook functions inside `module`,
+	creating it on first use.
+	"""
+
+	ret = _traversals.get(module.__name__)
+	if ret is None:
+		with _traversals_lock:
+			ret = _traversals.get(module.__name__)
+			if ret is None:
+				logger.debug("registering traversal %s", module.__name__)
+				ret = _traversals[module.__name__] = Traversal(*find_hooks(module))
+	return ret
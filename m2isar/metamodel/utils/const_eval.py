@@ -0,0 +1,168 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Evaluation of constant CoreDSL expressions.
+
+Operands and results are described by their value, bit width and signedness.
+A width of None describes a value of unknown, unbounded width. The operators
+follow CoreDSL semantics:
+
+* Operands are first brought into the value range of their type, wrapping
+  around if necessary. An unsigned operand therefore never is negative.
+* The results of `+`, `-`, `*`, `<<` and unary `-` are widened so that they
+  never overflow, `-` always returns a signed result.
+* `/` and `%` truncate towards zero, like in C.
+* `>>` is an arithmetic shift for signed and a logical shift for unsigned operands.
+* `~` complements all bits within the operand width.
+* Comparisons and logical operators return an unsigned 1 bit result.
+
+Evaluations are memoized per operator and operands.
+"""
+
+import functools
+import operator
+from typing import Callable, Union
+
+from ... import M2ValueError
+
+Width = Union[int, None]
+
+def min_width(value: int, signed: bool) -> int:
+	"""Return the minimal width of a type holding `value`."""
+
+	return max(1, value.bit_length() + (1 if signed else 0))
+
+def wrap(value: int, width: Width, signed: bool) -> int:
+	"""Bring `value` into the value range of the given type by wrapping around."""
+
+	if width is None:
+		return value
+
+	value &= (1 << width) - 1
+	if signed and value >> (width - 1):
+		value -= 1 << width
+	return value
+
+def _common_width(lwidth: Width, lsigned: bool, rwidth: Width, rsigned: bool, signed: bool) -> Width:
+	"""Width of the common type of both operands, an unsigned operand in a signed
+	context needs an additional bit.
+	"""
+
+	if lwidth is None or rwidth is None:
+		return None
+	return max(lwidth + (signed and not lsigned), rwidth + (signed and not rsigned))
+
+def _plus_one(width: Width) -> Width:
+	return None if width is None else width + 1
+
+def _add(l, lw, ls, r, rw, rs):
+	signed = ls or rs
+	return l + r, _plus_one(_common_width(lw, ls, rw, rs, signed)), signed
+
+def _sub(l, lw, ls, r, rw, rs):
+	return l - r, _plus_one(_common_width(lw, ls, rw, rs, True)), True
+
+def _mul(l, lw, ls, r, rw, rs):
+	signed = ls or rs
+	width = None if lw is None or rw is None else lw + (signed and not ls) + rw + (signed and not rs)
+	return l * r, width, signed
+
+def _div(l, lw, ls, r, rw, rs):
+	if r == 0:
+		raise M2ValueError("division by zero in constant expression")
+	res = abs(l) // abs(r)
+	if (l < 0) != (r < 0):
+		res = -res
+	return res, _plus_one(lw) if rs else lw, ls or rs
+
+def _mod(l, lw, ls, r, rw, rs):
+	if r == 0:
+		raise M2ValueError("division by zero in constant expression")
+	res = abs(l) % abs(r)
+	if l < 0:
+		res = -res
+	# the result is never larger than the dividend
+	return res, lw, ls
+
+def _shl(l, lw, ls, r, rw, rs):
+	if r < 0:
+		raise M2ValueError("negative shift amount in constant expression")
+	return l << r, None if lw is None else lw + r, ls
+
+def _shr(l, lw, ls, r, rw, rs):
+	if r < 0:
+		raise M2ValueError("negative shift amount in constant expression")
+	# operands are in range of their type, python's >> then shifts arithmetically
+	# for negative, i.e. signed, and logically for non-negative values
+	return l >> r, lw, ls
+
+def _bitwise(fn: Callable[[int, int], int]):
+	def evaluate(l, lw, ls, r, rw, rs):
+		signed = ls or rs
+		width = _common_width(lw, ls, rw, rs, signed)
+		return wrap(fn(l, r), width, signed), width, signed
+	return evaluate
+
+def _boolean(fn: Callable[[int, int], bool]):
+	def evaluate(l, lw, ls, r, rw, rs):
+		return int(fn(l, r)), 1, False
+	return evaluate
+
+BINARY_OPERATORS = {
+	"+": _add,
+	"-": _sub,
+	"*": _mul,
+	"/": _div,
+	"%": _mod,
+	"<<": _shl,
+	">>": _shr,
+	"&": _bitwise(operator.and_),
+	"|": _bitwise(operator.or_),
+	"^": _bitwise(operator.xor),
+	"==": _boolean(operator.eq),
+	"!=": _boolean(operator.ne),
+	"<": _boolean(operator.lt),
+	">": _boolean(operator.gt),
+	"<=": _boolean(operator.le),
+	">=": _boolean(operator.ge),
+	"&&": _boolean(lambda l, r: bool(l) and bool(r)),
+	"||": _boolean(lambda l, r: bool(l) or bool(r)),
+}
+"""Evaluation functions of binary operators, taking value, width and signedness
+of both operands and returning value, width and signedness of the result.
+"""
+
+UNARY_OPERATORS = {
+	"-": lambda v, w, s: (-v, _plus_one(w), True),
+	"+": lambda v, w, s: (v, w, s),
+	"~": lambda v, w, s: (wrap(~v, w, s), w, s),
+	"!": lambda v, w, s: (int(not v), 1, False),
+}
+"""Evaluation functions of unary operators, taking value, width and signedness
+of the operand and returning value, width and signedness of the result.
+"""
+
+@functools.lru_cache(maxsize=None)
+def binary(op: str, left: int, lwidth: Width, lsigned: bool, right: int, rwidth: Width, rsigned: bool) -> "tuple[int, Width, bool]":
+	"""Evaluate the binary operation `op`, return value, width and signedness of the result."""
+
+	fn = BINARY_OPERATORS.get(op)
+	if fn is None:
+		raise M2ValueError(f"operator {op} can not be evaluated")
+
+	return fn(wrap(left, lwidth, lsigned), lwidth, lsigned, wrap(right, rwidth, rsigned), rwidth, rsigned)
+
+@functools.lru_cache(maxsize=None)
+def unary(op: str, value: int, width: Width, signed: bool) -> "tuple[int, Width, bool]":
+	"""Evaluate the unary operation `op`, return value, width and signedness of the result."""
+
+	fn = UNARY_OPERATORS.get(op)
+	if fn is None:
+		raise M2ValueError(f"operator {op} can not be evaluated")
+
+	return fn(wrap(value, width, signed), width, signed)
@@ -14,43 +14,69 @@ import logging
 from itertools import chain
 
 from ... import M2ValueError
-from .. import arch, patch_model
+from .. import arch
+from ..passes import get_pass
 from . import (ScalarStaticnessContext, expr_simplifier, function_staticness,
-               function_throws, scalar_staticness)
+               function_throws, fused_preprocessor, scalar_staticness)
 
 logger = logging.getLogger("preprocessor")
 
 def process_attributes(core: arch.CoreDef):
 	"""Apply all preprocessing to memory, function and instruction attributes in `core`."""
 
-	patch_model(expr_simplifier)
+	simplifier = get_pass(expr_simplifier)
 
 	for _, obj_def in chain(core.functions.items(), core.instructions.items(), core.memories.items(), core.memory_aliases.items()):
 		for attr_name, attr_defs in obj_def.attributes.items():
 			logger.debug("simplifying expressions for attr %s of %s", attr_name, obj_def.name)
 			for attr_def in attr_defs:
-				attr_def.generate(None)
+				simplifier.run(attr_def, None)
 
-def process_functions(core: arch.CoreDef):
-	"""Apply all preprocessing to all functions in `core`."""
+def _analyze_sequential(operation, name: str, function_static: bool):
+	"""Simplify `operation` and determine whether it throws, the staticness of
+	its scalars and, if `function_static` is set, its function staticness. Applies
+	each transformation in its own traversal.
+	"""
 
-	for fn_name, fn_def in core.functions.items():
-		patch_model(expr_simplifier)
-		logger.debug("simplifying expressions for fn %s", fn_name)
-		fn_def.operation.generate(None)
+	logger.debug("simplifying expressions for %s", name)
+	get_pass(expr_simplifier).run(operation, None)
 
-		patch_model(function_throws)
-		logger.debug("checking throws for fn %s", fn_name)
-		throws = fn_def.operation.generate(None)
-		fn_def.throws = throws or arch.FunctionAttribute.ETISS_TRAP_ENTRY_FN in fn_def.attributes
+	logger.debug("checking throws for %s", name)
+	throws = get_pass(function_throws).run(operation, None)
+
+	logger.debug("examining scalar staticness for %s", name)
+	get_pass(scalar_staticness).run(operation, ScalarStaticnessContext())
+
+	static = None
+	if function_static:
+		logger.debug("examining function staticness for %s", name)
+		static = get_pass(function_staticness).run(operation, None)
+
+	return throws, static
+
+def _analyze_fused(operation, name: str, function_static: bool, shared: dict=None):
+	"""Like :func:`_analyze_sequential`, but in a single traversal. `shared`
+	memoizes the results for statements shared between trees, see
+	:func:`.fused_preprocessor.preprocess`.
+	"""
+
+	logger.debug("preprocessing %s", name)
+	_, throws, _, static = fused_preprocessor.preprocess(operation, shared)
 
-		context = ScalarStaticnessContext()
-		patch_model(scalar_staticness)
-		logger.debug("examining scalar staticness for fn %s", fn_name)
-		fn_def.operation.generate(context)
+	return throws, fused_preprocessor.is_static(static) if function_static else None
 
-		patch_model(function_staticness)
-		logger.debug("examining function staticness for fn %s", fn_name)
+def process_functions(core: arch.CoreDef, fused: bool=True):
+	"""Apply all preprocessing to all functions in `core`. With `fused` set, all
+	transformations are applied in a single traversal of each function.
+	"""
+
+	analyze = _analyze_fused if fused else _analyze_sequential
+
+	for fn_name, fn_def in core.functions.items():
+		fixed_static = fn_def.extern or arch.FunctionAttribute.ETISS_TRAP_ENTRY_FN in fn_def.attributes
+
+		throws, static = analyze(fn_def.operation, f"fn {fn_name}", not fixed_static)
+		fn_def.throws = throws or arch.FunctionAttribute.ETISS_TRAP_ENTRY_FN in fn_def.attributes
 
 		if arch.FunctionAttribute.ETISS_NEEDS_ARCH in fn_def.attributes and arch.FunctionAttribute.ETISS_STATICFN in fn_def.attributes:
 			raise M2ValueError("etiss_needs_arch and etiss_staticfn not allowed together, in function %s", fn_name)
@@ -58,28 +84,25 @@ def process_functions(core: arch.CoreDef):
 		#if not fn_def.extern and (arch.FunctionAttribute.ETISS_NEEDS_ARCH in fn_def.attributes or arch.FunctionAttribute.ETISS_STATICFN in fn_def.attributes):
 		#	raise M2ValueError("etiss_needs_arch and etiss_staticfn only allowed for extern functions, in function %s", fn_name)
 
-		if fn_def.extern or arch.FunctionAttribute.ETISS_TRAP_ENTRY_FN in fn_def.attributes:
+		if fixed_static:
 			if arch.FunctionAttribute.ETISS_STATICFN in fn_def.attributes:
 				fn_def.static = True
 
 		else:
-			ret = fn_def.operation.generate(None)
-			fn_def.static = ret
+			fn_def.static = static
+
+def process_instructions(core: arch.CoreDef, fused: bool=True):
+	"""Apply all preprocessing to all instructions in `core`. With `fused` set,
+	all transformations are applied in a single traversal of each instruction,
+	and the always block statements shared by all instructions are only processed
+	once.
+	"""
 
-def process_instructions(core: arch.CoreDef):
-	"""Apply all preprocessing to all instructions in `core`."""
+	if not fused:
+		for _, instr_def in core.instructions.items():
+			instr_def.throws, _ = _analyze_sequential(instr_def.operation, f"instr {instr_def.name}", False)
+		return
 
+	shared = {}
 	for _, instr_def in core.instructions.items():
-		patch_model(expr_simplifier)
-		logger.debug("simplifying expressions for instr %s", instr_def.name)
-		instr_def.operation.generate(None)
-
-		patch_model(function_throws)
-		logger.debug("checking throws for instr %s", instr_def.name)
-		throws = instr_def.operation.generate(None)
-		instr_def.throws = throws
-
-		context = ScalarStaticnessContext()
-		patch_model(scalar_staticness)
-		logger.debug("examining staticness for instr %s", instr_def.name)
-		instr_def.operation.generate(context)
+		instr_def.throws, _ = _analyze_fused(instr_def.operation, f"instr {instr_def.name}", False, shared)
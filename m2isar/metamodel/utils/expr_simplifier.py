@@ -20,7 +20,13 @@ simplifications are done:
   type directly to the :class:`IntLiteral` and discard the type conversion
 """
 
+import logging
+
+from ... import M2ValueError
 from ...metamodel import arch, behav
+from . import const_eval
+
+logger = logging.getLogger("expr_simplifier")
 
 # pylint: disable=unused-argument
 
@@ -34,7 +40,7 @@ def operation(self: behav.Operation, context):
 			else:
 				statements.append(temp)
 		except (NotImplementedError, ValueError):
-			print(f"cant simplify {stmt}")
+			logger.debug("can't simplify %s", stmt)
 
 	self.statements = statements
 	return self
@@ -43,46 +49,58 @@ def binary_operation(self: behav.BinaryOperation, context):
 	self.left = self.left.generate(context)
 	self.right = self.right.generate(context)
 
-	if isinstance(self.left, behav.IntLiteral) and isinstance(self.right, (behav.NamedReference, behav.IndexedReference)):
-		if self.left.bit_size < self.right.reference.size:
-			self.left.bit_size = self.right.reference.size
+	return fold_binary_operation(self)
 
-	if isinstance(self.right, behav.IntLiteral) and isinstance(self.left, (behav.NamedReference, behav.IndexedReference)):
-		if self.right.bit_size < self.left.reference.size:
-			self.right.bit_size = self.left.reference.size
+def fold_binary_operation(node: behav.BinaryOperation):
+	"""Simplify a binary operation with already simplified operands. Returns
+	either `node`, one of its operands or a new :class:`IntLiteral`.
+	"""
 
-	if isinstance(self.left, behav.IntLiteral) and isinstance(self.right, behav.IntLiteral):
-		# pylint: disable=eval-used
-		res: int = int(eval(f"{self.left.value}{self.op.value}{self.right.value}"))
-		return behav.IntLiteral(res, max(self.left.bit_size, self.right.bit_size, res.bit_length()))
+	if isinstance(node.left, behav.IntLiteral) and isinstance(node.right, (behav.NamedReference, behav.IndexedReference)):
+		if node.left.bit_size < node.right.reference.size:
+			node.left.bit_size = node.right.reference.size
 
-	if self.op.value == "&&":
-		if isinstance(self.left, behav.IntLiteral):
-			if self.left.value:
-				return self.right
+	if isinstance(node.right, behav.IntLiteral) and isinstance(node.left, (behav.NamedReference, behav.IndexedReference)):
+		if node.right.bit_size < node.left.reference.size:
+			node.right.bit_size = node.left.reference.size
+
+	if isinstance(node.left, behav.IntLiteral) and isinstance(node.right, behav.IntLiteral):
+		try:
+			res, width, signed = const_eval.binary(node.op.value, node.left.value, node.left.bit_size, node.left.signed,
+				node.right.value, node.right.bit_size, node.right.signed)
+		except M2ValueError:
+			# e.g. a division by zero, leave it to the generated code
+			return node
+
+		return behav.IntLiteral(res, width, signed)
+
+	if node.op.value == "&&":
+		if isinstance(node.left, behav.IntLiteral):
+			if node.left.value:
+				return node.right
 			else:
-				return self.left
+				return node.left
 
-		if isinstance(self.right, behav.IntLiteral):
-			if self.right.value:
-				return self.left
+		if isinstance(node.right, behav.IntLiteral):
+			if node.right.value:
+				return node.left
 			else:
-				return self.right
+				return node.right
 
-	if self.op.value == "||":
-		if isinstance(self.left, behav.IntLiteral):
-			if self.left.value:
-				return self.left
+	if node.op.value == "||":
+		if isinstance(node.left, behav.IntLiteral):
+			if node.left.value:
+				return node.left
 			else:
-				return self.right
+				return node.right
 
-		if isinstance(self.right, behav.IntLiteral):
-			if self.right.value:
-				return self.right
+		if isinstance(node.right, behav.IntLiteral):
+			if node.right.value:
+				return node.right
 			else:
-				return self.left
+				return node.left
 
-	return self
+	return node
 
 def slice_operation(self: behav.SliceOperation, context):
 	self.expr = self.expr.generate(context)
@@ -113,43 +131,60 @@ def assignment(self: behav.Assignment, context):
 	self.target = self.target.generate(context)
 	self.expr = self.expr.generate(context)
 
-	if isinstance(self.expr, behav.IntLiteral) and isinstance(self.target, (behav.NamedReference, behav.IndexedReference)):
-		if self.expr.bit_size < self.target.reference.size:
-			self.expr.bit_size = self.target.reference.size
+	adjust_assignment(self)
 
 	#if isinstance(self.expr, behav.IntLiteral) and isinstance(self.target, behav.ScalarDefinition):
 #		self.target.scalar.value = self.expr.value
 
 	return self
 
+def adjust_assignment(node: behav.Assignment):
+	"""Widen a literal assigned to a reference to the size of the reference."""
+
+	if isinstance(node.expr, behav.IntLiteral) and isinstance(node.target, (behav.NamedReference, behav.IndexedReference)):
+		if node.expr.bit_size < node.target.reference.size:
+			node.expr.bit_size = node.target.reference.size
+
 def conditional(self: behav.Conditional, context):
 	self.conds = [x.generate(context) for x in self.conds]
 	self.stmts = [x.generate(context) for x in self.stmts]
 
+	keep, result = select_branches(self.conds, len(self.stmts))
+
+	if result is not None:
+		return self.stmts[result]
+
+	self.conds = [self.conds[idx] for idx in keep if idx < len(self.conds)]
+	self.stmts = [self.stmts[idx] for idx in keep]
+
+	return self
+
+def select_branches(conds: "list[behav.BaseNode]", stmt_count: int):
+	"""Determine the branches of a conditional which remain after its simplified
+	conditions `conds` were evaluated. Returns a list of the indices of all
+	remaining branches and None, or None and the index of the only branch which
+	is always taken.
+	"""
+
 	eval_false = True
 
-	conds = []
-	stmts = []
+	keep = []
 
-	for cond, stmt in zip(self.conds, self.stmts):
+	for idx, cond in enumerate(conds[:stmt_count]):
 		if isinstance(cond, behav.IntLiteral):
 			if cond.value:
-				return stmt
+				return None, idx
 		else:
-			conds.append(cond)
-			stmts.append(stmt)
+			keep.append(idx)
 			eval_false = False
 
-	if len(self.conds) < len(self.stmts):
-		if eval_false and isinstance(self.conds[-1], behav.IntLiteral):
+	if len(conds) < stmt_count:
+		if eval_false and isinstance(conds[-1], behav.IntLiteral):
 			if not cond.value: # pylint: disable=undefined-loop-variable
-				return self.stmts[-1]
-		stmts.append(self.stmts[-1])
+				return None, stmt_count - 1
+		keep.append(stmt_count - 1)
 
-	self.conds = conds
-	self.stmts = stmts
-
-	return self
+	return keep, None
 
 def loop(self: behav.Loop, context):
 	self.cond = self.cond.generate(context)
@@ -178,12 +213,23 @@ def return_(self: behav.Return, context):
 
 def unary_operation(self: behav.UnaryOperation, context):
 	self.right = self.right.generate(context)
-	if isinstance(self.right, behav.IntLiteral):
-		# pylint: disable=eval-used
-		res: int = eval(f"{self.op.value}{self.right.value}")
-		return behav.IntLiteral(res, max(self.right.bit_size, res.bit_length()))
 
-	return self
+	return fold_unary_operation(self)
+
+def fold_unary_operation(node: behav.UnaryOperation):
+	"""Simplify a unary operation with an already simplified operand. Returns
+	either `node` or a new :class:`IntLiteral`.
+	"""
+
+	if isinstance(node.right, behav.IntLiteral):
+		try:
+			res, width, signed = const_eval.unary(node.op.value, node.right.value, node.right.bit_size, node.right.signed)
+		except M2ValueError:
+			return node
+
+		return behav.IntLiteral(res, width, signed)
+
+	return node
 
 def named_reference(self: behav.NamedReference, context):
 	if isinstance(self.reference, arch.Constant):
@@ -201,12 +247,20 @@ def indexed_reference(self: behav.IndexedReference, context):
 
 def type_conv(self: behav.TypeConv, context):
 	self.expr = self.expr.generate(context)
-	if isinstance(self.expr, behav.IntLiteral):
-		self.expr.bit_size = self.size
-		self.expr.signed = self.data_type == arch.DataType.S
-		return self.expr
 
-	return self
+	return fold_type_conv(self)
+
+def fold_type_conv(node: behav.TypeConv):
+	"""Apply a type conversion of an already simplified literal directly to the
+	literal. Returns either `node` or the literal.
+	"""
+
+	if isinstance(node.expr, behav.IntLiteral):
+		node.expr.bit_size = node.size
+		node.expr.signed = node.data_type == arch.DataType.S
+		return node.expr
+
+	return node
 
 def callable_(self: behav.Callable, context):
 	self.args = [stmt.generate(context) for stmt in self.args]
@@ -0,0 +1,371 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Transformation functions applying :mod:`.expr_simplifier`, :mod:`.function_throws`,
+:mod:`.scalar_staticness` and :mod:`.function_staticness` in a single traversal,
+with the same results as applying them one after another.
+
+Each function simplifies its node like :mod:`.expr_simplifier` and returns a tuple of
+
+* the simplified node,
+* the :class:`~m2isar.metamodel.arch.FunctionThrows` value of :mod:`.function_throws`,
+* the :class:`~m2isar.metamodel.utils.StaticType` value of :mod:`.scalar_staticness`,
+* the function staticness of :mod:`.function_staticness`, as False or as a tuple of
+  scalars which all have to be static. Scalar staticness is only final after the
+  whole tree was traversed, :func:`is_static` evaluates this value afterwards.
+
+All values are calculated for the simplified node. Branches of conditionals which
+are removed by the simplification are only simplified, not analyzed.
+
+The functions recurse through the tree. Top-level statements nested too deeply
+for the recursion limit are processed by the hooks of :mod:`.fused_traversal`
+instead, which give the same results without recursion, but are slower.
+"""
+
+import dataclasses
+import logging
+import sys
+from functools import reduce
+from operator import or_
+
+from ... import M2TypeError
+from ...metamodel import arch, behav
+from ..passes import get_pass
+from . import StaticType, expr_simplifier
+
+logger = logging.getLogger("fused_preprocessor")
+
+# pylint: disable=unused-argument
+
+@dataclasses.dataclass
+class FusedContext:
+	"""A datakeeping class for the fused preprocessing transformations."""
+
+	context_is_static: StaticType = StaticType.RW
+	removed: bool = False
+	"""Set by :mod:`.fused_traversal` for branches removed from a conditional,
+	which are only simplified. Their analysis results are discarded.
+	"""
+	journal: list = dataclasses.field(default_factory=list)
+	"""Previous staticness of all modified scalars, to undo the modifications of
+	statements which can not be simplified and are removed.
+	"""
+
+	def set_static(self, scalar: arch.Scalar, static: StaticType):
+		self.journal.append((scalar, scalar.static))
+		scalar.static = static
+
+	def rollback(self, mark: int):
+		while len(self.journal) > mark:
+			scalar, static = self.journal.pop()
+			scalar.static = static
+
+def is_static(fn_static) -> bool:
+	"""Evaluate the function staticness returned for a tree."""
+
+	return fn_static is not False and all(scalar.static for scalar in fn_static)
+
+def _all(*values):
+	ret = ()
+	for val in values:
+		if val is False:
+			return False
+		ret += val
+	return ret
+
+def _static(val):
+	return () if val else False
+
+def _literal(node):
+	return node, arch.FunctionThrows.NO, StaticType.READ, ()
+
+_FAILED = object()
+
+def _generate(stmt: behav.BaseNode, context: FusedContext):
+	return stmt.generate(context)
+
+def _generate_top_level(stmt: behav.BaseNode, context: FusedContext):
+	mark = len(context.journal)
+	try:
+		return stmt.generate(context)
+	except RecursionError:
+		logger.debug("statement nested too deeply for recursion, using the traversal hooks")
+		# subtrees finished before the error are already simplified, which
+		# processing them again does not change
+		context.rollback(mark)
+		return fused_traversal.process(stmt, context)
+
+def _statements(node: behav.Operation, context: FusedContext, shared: dict, generate=_generate):
+	statements = []
+	throws = []
+	fn_static = ()
+
+	for stmt in node.statements:
+		entry = shared.get(id(stmt)) if shared is not None else None
+
+		if entry is None:
+			mark = len(context.journal)
+			try:
+				result = generate(stmt, context)
+			except (NotImplementedError, ValueError):
+				logger.debug("can't simplify %s", stmt)
+				context.rollback(mark)
+				result = _FAILED
+
+			# the entry keeps the statement alive, its id must not be reused
+			entry = (stmt, result)
+			if shared is not None:
+				shared[id(stmt)] = entry
+
+		result = entry[1]
+		if result is _FAILED:
+			continue
+
+		new_stmt, stmt_throws, _, stmt_static = result
+
+		statements.append(new_stmt)
+		throws.append(stmt_throws)
+		fn_static = _all(fn_static, stmt_static)
+
+	node.statements = statements
+	return node, reduce(or_, throws, arch.FunctionThrows.NO), node, fn_static
+
+def preprocess(operation: behav.Operation, shared: dict=None):
+	"""Apply all transformations of this module to the behavior tree `operation`
+	of a function or instruction, return the tuple described above.
+
+	`shared` memoizes the results for the top-level statements of `operation`
+	across calls. Statements contained in multiple trees, like the statements of
+	always blocks prepended to each instruction, are then only processed once.
+	Such statements must not depend on the statements preceding them.
+	"""
+
+	with get_pass(sys.modules[__name__]).active():
+		return _statements(operation, FusedContext(), shared, _generate_top_level)
+
+def operation(self: behav.Operation, context: FusedContext):
+	return _statements(self, context, None)
+
+def binary_operation(self: behav.BinaryOperation, context: FusedContext):
+	left = self.left.generate(context)
+	right = self.right.generate(context)
+
+	self.left, self.right = left[0], right[0]
+	ret = expr_simplifier.fold_binary_operation(self)
+
+	if ret is self:
+		return self, left[1] | right[1], min(left[2], right[2]), _all(left[3], right[3])
+	if ret is left[0]:
+		return left
+	if ret is right[0]:
+		return right
+	return _literal(ret)
+
+def slice_operation(self: behav.SliceOperation, context: FusedContext):
+	expr = self.expr.generate(context)
+	left = self.left.generate(context)
+	right = self.right.generate(context)
+
+	self.expr, self.left, self.right = expr[0], left[0], right[0]
+
+	return self, expr[1] | left[1] | right[1], min(expr[2], left[2], right[2]), _all(expr[3], left[3], right[3])
+
+def concat_operation(self: behav.ConcatOperation, context: FusedContext):
+	left = self.left.generate(context)
+	right = self.right.generate(context)
+
+	self.left, self.right = left[0], right[0]
+
+	return self, left[1] | right[1], min(left[2], right[2]), _all(left[3], right[3])
+
+def number_literal(self: behav.IntLiteral, context: FusedContext):
+	return _literal(self)
+
+def int_literal(self: behav.IntLiteral, context: FusedContext):
+	return _literal(self)
+
+def scalar_definition(self: behav.ScalarDefinition, context: FusedContext):
+	context.set_static(self.scalar, StaticType.RW)
+	return self, arch.FunctionThrows.NO, StaticType.RW, ()
+
+def break_(self: behav.Break, context: FusedContext):
+	return self, arch.FunctionThrows.NO, StaticType.READ, ()
+
+def assignment(self: behav.Assignment, context: FusedContext):
+	target = self.target.generate(context)
+	expr = self.expr.generate(context)
+
+	self.target, self.expr = target[0], expr[0]
+	expr_simplifier.adjust_assignment(self)
+
+	if context.context_is_static != StaticType.NONE or isinstance(self.target, behav.ScalarDefinition):
+		static = StaticType.NONE if expr[2] == StaticType.NONE else StaticType.RW
+	else:
+		static = StaticType.NONE
+
+	if isinstance(self.target, behav.NamedReference) and isinstance(self.target.reference, arch.Scalar):
+		context.set_static(self.target.reference, self.target.reference.static & static)
+
+	if isinstance(self.target, behav.ScalarDefinition):
+		context.set_static(self.target.scalar, self.target.scalar.static & static)
+
+	return self, target[1] | expr[1], None, _all(target[3], expr[3])
+
+def conditional(self: behav.Conditional, context: FusedContext):
+	conds = [x.generate(context) for x in self.conds]
+	self.conds = [x[0] for x in conds]
+
+	# the branches remaining after simplification, see expr_simplifier.conditional
+	keep, result = expr_simplifier.select_branches(self.conds, len(self.stmts))
+
+	if result is not None:
+		keep = [result]
+		stmts_context = context
+	else:
+		conds = [conds[idx] for idx in keep if idx < len(conds)]
+		if not conds:
+			raise M2TypeError("can not analyze conditional without any remaining branch")
+		stmts_context = dataclasses.replace(context, context_is_static=min(x[2] for x in conds))
+
+	stmts = []
+	for idx, stmt in enumerate(self.stmts):
+		if idx in keep:
+			stmts.append(stmt.generate(stmts_context))
+		else:
+			# removed branches are still simplified, like by expr_simplifier.conditional
+			get_pass(expr_simplifier).run(stmt, None)
+
+	if result is not None:
+		return stmts[0]
+
+	self.conds = [x[0] for x in conds]
+	self.stmts = [x[0] for x in stmts]
+
+	values = conds + stmts
+	throws = arch.FunctionThrows.MAYBE if reduce(or_, [x[1] for x in values]) else arch.FunctionThrows.NO
+
+	return self, throws, None, _all(*(x[3] for x in values))
+
+def loop(self: behav.Loop, context: FusedContext):
+	cond = self.cond.generate(context)
+	stmt_context = dataclasses.replace(context, context_is_static=cond[2])
+	stmts = [x.generate(stmt_context) for x in self.stmts]
+
+	self.cond = cond[0]
+	self.stmts = [x[0] for x in stmts]
+
+	return self, reduce(or_, [x[1] for x in stmts] + [cond[1]]), None, _all(*(x[3] for x in stmts), cond[3])
+
+def ternary(self: behav.Ternary, context: FusedContext):
+	cond = self.cond.generate(context)
+	then_expr = self.then_expr.generate(context)
+	else_expr = self.else_expr.generate(context)
+
+	self.cond, self.then_expr, self.else_expr = cond[0], then_expr[0], else_expr[0]
+
+	if isinstance(self.cond, behav.IntLiteral):
+		if self.cond.value:
+			return then_expr
+
+		return else_expr
+
+	return (self, cond[1] | then_expr[1] | else_expr[1], min(cond[2], then_expr[2], else_expr[2]),
+		_all(cond[3], then_expr[3], else_expr[3]))
+
+def return_(self: behav.Return, context: FusedContext):
+	if self.expr is not None:
+		expr = self.expr.generate(context)
+		self.expr = expr[0]
+		return self, expr[1], expr[2], expr[3]
+
+	return self, arch.FunctionThrows.NO, StaticType.RW, ()
+
+def unary_operation(self: behav.UnaryOperation, context: FusedContext):
+	right = self.right.generate(context)
+
+	self.right = right[0]
+	ret = expr_simplifier.fold_unary_operation(self)
+
+	if ret is self:
+		return (self,) + right[1:]
+	return _literal(ret)
+
+_SCALAR_STATIC_MAP = {
+	arch.Memory: StaticType.NONE,
+	arch.BitFieldDescr: StaticType.READ,
+	arch.Constant: StaticType.READ,
+	arch.FnParam: StaticType.READ
+}
+
+_FUNCTION_STATIC_MAP = {
+	arch.Memory: False,
+	arch.BitFieldDescr: (),
+	arch.Constant: (),
+	arch.FnParam: (),
+	arch.Scalar: (),
+	arch.Intrinsic: False
+}
+
+def named_reference(self: behav.NamedReference, context: FusedContext):
+	ret = expr_simplifier.named_reference(self, None)
+	if ret is not self:
+		return _literal(ret)
+
+	reference = self.reference
+
+	throws = arch.FunctionThrows.NO
+	if isinstance(reference, arch.Memory) and arch.MemoryAttribute.ETISS_CAN_FAIL in reference.attributes:
+		throws = arch.FunctionThrows.YES
+
+	if isinstance(reference, arch.Scalar):
+		return self, throws, reference.static, (reference,)
+
+	return self, throws, _SCALAR_STATIC_MAP.get(type(reference), StaticType.NONE), _FUNCTION_STATIC_MAP.get(type(reference), False)
+
+def indexed_reference(self: behav.IndexedReference, context: FusedContext):
+	index = self.index.generate(context)
+	self.index = index[0]
+
+	if isinstance(self.reference, arch.Memory) and arch.MemoryAttribute.ETISS_CAN_FAIL in self.reference.attributes:
+		throws = arch.FunctionThrows.YES
+	else:
+		throws = index[1]
+
+	return self, throws, StaticType.NONE, False
+
+def type_conv(self: behav.TypeConv, context: FusedContext):
+	expr = self.expr.generate(context)
+	self.expr = expr[0]
+
+	if isinstance(self.expr, behav.IntLiteral):
+		return _literal(expr_simplifier.fold_type_conv(self))
+
+	return (self,) + expr[1:]
+
+def callable_(self: behav.Callable, context: FusedContext):
+	args = [arg.generate(context) for arg in self.args]
+	self.args = [x[0] for x in args]
+
+	ref = self.ref_or_name
+
+	throws = reduce(or_, [x[1] for x in args] + [ref.throws])
+	static = min([x[2] for x in args] + [StaticType.READ if ref.static else StaticType.NONE])
+
+	return self, throws, static, _all(*(x[3] for x in args), _static(ref.static))
+
+def group(self: behav.Group, context: FusedContext):
+	expr = self.expr.generate(context)
+	self.expr = expr[0]
+
+	if isinstance(self.expr, behav.IntLiteral):
+		return expr
+
+	return (self,) + expr[1:]
+
+# imported last, the traversal hooks use the definitions of this module
+from . import fused_traversal # pylint: disable=wrong-import-position
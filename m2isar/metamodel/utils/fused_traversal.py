@@ -0,0 +1,275 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# This file is part of the M2-ISA-R project: https://github.com/tum-ei-eda/M2-ISA-R
+#
+# Copyright (C) 2022
+# Chair of Electrical Design Automation
+# Technical University of Munich
+
+"""Traversal hooks applying the transformations of :mod:`.fused_preprocessor`
+without recursion, with the same results. They are run by
+:class:`~m2isar.metamodel.traversal.Traversal`, so statements of any depth can
+be processed. The recursive functions of :mod:`.fused_preprocessor` are faster
+and fall back to these hooks for statements too deep for them.
+
+Each hook returns the tuple described in :mod:`.fused_preprocessor`.
+"""
+
+import dataclasses
+import logging
+import sys
+from functools import reduce
+from operator import or_
+
+from ... import M2TypeError
+from ...metamodel import arch, behav
+from ..traversal import get_traversal
+from . import StaticType, expr_simplifier
+from .fused_preprocessor import (_FUNCTION_STATIC_MAP, _SCALAR_STATIC_MAP,
+                                 FusedContext, _all, _literal, _static)
+
+logger = logging.getLogger("fused_preprocessor")
+
+# pylint: disable=unused-argument
+
+def _root(root: behav.BaseNode, context: FusedContext):
+	return (yield root, context)
+
+def process(stmt: behav.BaseNode, context: FusedContext):
+	"""Process the statement `stmt` like :meth:`~m2isar.metamodel.behav.BaseNode.generate`
+	with the :mod:`.fused_preprocessor` pass, return the tuple for it.
+	"""
+
+	return get_traversal(sys.modules[__name__]).run_steps(_root(stmt, context))
+
+def operation(node: behav.Operation, context: FusedContext):
+	statements = []
+	throws = []
+	fn_static = ()
+
+	for stmt in node.statements:
+		mark = len(context.journal)
+		try:
+			result = yield stmt, context
+		except (NotImplementedError, ValueError):
+			logger.debug("can't simplify %s", stmt)
+			context.rollback(mark)
+			continue
+
+		new_stmt, stmt_throws, _, stmt_static = result
+
+		statements.append(new_stmt)
+		throws.append(stmt_throws)
+		fn_static = _all(fn_static, stmt_static)
+
+	node.statements = statements
+	return node, reduce(or_, throws, arch.FunctionThrows.NO), node, fn_static
+
+def binary_operation(node: behav.BinaryOperation, context: FusedContext):
+	left = yield node.left, context
+	right = yield node.right, context
+
+	node.left, node.right = left[0], right[0]
+	ret = expr_simplifier.fold_binary_operation(node)
+
+	if ret is node:
+		return node, left[1] | right[1], min(left[2], right[2]), _all(left[3], right[3])
+	if ret is left[0]:
+		return left
+	if ret is right[0]:
+		return right
+	return _literal(ret)
+
+def slice_operation(node: behav.SliceOperation, context: FusedContext):
+	expr = yield node.expr, context
+	left = yield node.left, context
+	right = yield node.right, context
+
+	node.expr, node.left, node.right = expr[0], left[0], right[0]
+
+	return node, expr[1] | left[1] | right[1], min(expr[2], left[2], right[2]), _all(expr[3], left[3], right[3])
+
+def concat_operation(node: behav.ConcatOperation, context: FusedContext):
+	left = yield node.left, context
+	right = yield node.right, context
+
+	node.left, node.right = left[0], right[0]
+
+	return node, left[1] | right[1], min(left[2], right[2]), _all(left[3], right[3])
+
+def number_literal(node: behav.IntLiteral, results, context: FusedContext):
+	return _literal(node)
+
+def int_literal(node: behav.IntLiteral, results, context: FusedContext):
+	return _literal(node)
+
+def scalar_definition(node: behav.ScalarDefinition, results, context: FusedContext):
+	context.set_static(node.scalar, StaticType.RW)
+	return node, arch.FunctionThrows.NO, StaticType.RW, ()
+
+def break_(node: behav.Break, results, context: FusedContext):
+	return node, arch.FunctionThrows.NO, StaticType.READ, ()
+
+def assignment(node: behav.Assignment, context: FusedContext):
+	target = yield node.target, context
+	expr = yield node.expr, context
+
+	node.target, node.expr = target[0], expr[0]
+	expr_simplifier.adjust_assignment(node)
+
+	if context.context_is_static != StaticType.NONE or isinstance(node.target, behav.ScalarDefinition):
+		static = StaticType.NONE if expr[2] == StaticType.NONE else StaticType.RW
+	else:
+		static = StaticType.NONE
+
+	if isinstance(node.target, behav.NamedReference) and isinstance(node.target.reference, arch.Scalar):
+		context.set_static(node.target.reference, node.target.reference.static & static)
+
+	if isinstance(node.target, behav.ScalarDefinition):
+		context.set_static(node.target.scalar, node.target.scalar.static & static)
+
+	return node, target[1] | expr[1], None, _all(target[3], expr[3])
+
+def conditional(node: behav.Conditional, context: FusedContext):
+	conds = []
+	for cond in node.conds:
+		conds.append((yield cond, context))
+	node.conds = [x[0] for x in conds]
+
+	# the branches remaining after simplification, see expr_simplifier.conditional
+	keep, result = expr_simplifier.select_branches(node.conds, len(node.stmts))
+
+	if result is not None:
+		keep = [result]
+		stmts_context = context
+	else:
+		conds = [conds[idx] for idx in keep if idx < len(conds)]
+		if conds:
+			stmts_context = dataclasses.replace(context, context_is_static=min(x[2] for x in conds))
+		elif not context.removed:
+			raise M2TypeError("can not analyze conditional without any remaining branch")
+
+	stmts = []
+	for idx, stmt in enumerate(node.stmts):
+		if idx in keep:
+			stmts.append((yield stmt, stmts_context))
+		else:
+			# removed branches are still simplified, like by expr_simplifier.conditional
+			mark = len(context.journal)
+			yield stmt, dataclasses.replace(context, removed=True)
+			context.rollback(mark)
+
+	if result is not None:
+		return stmts[0]
+
+	node.conds = [x[0] for x in conds]
+	node.stmts = [x[0] for x in stmts]
+
+	values = conds + stmts
+	throws = arch.FunctionThrows.MAYBE if reduce(or_, [x[1] for x in values], arch.FunctionThrows.NO) else arch.FunctionThrows.NO
+
+	return node, throws, None, _all(*(x[3] for x in values))
+
+def loop(node: behav.Loop, context: FusedContext):
+	cond = yield node.cond, context
+	stmt_context = dataclasses.replace(context, context_is_static=cond[2])
+	stmts = []
+	for stmt in node.stmts:
+		stmts.append((yield stmt, stmt_context))
+
+	node.cond = cond[0]
+	node.stmts = [x[0] for x in stmts]
+
+	return node, reduce(or_, [x[1] for x in stmts] + [cond[1]]), None, _all(*(x[3] for x in stmts), cond[3])
+
+def ternary(node: behav.Ternary, context: FusedContext):
+	cond = yield node.cond, context
+	then_expr = yield node.then_expr, context
+	else_expr = yield node.else_expr, context
+
+	node.cond, node.then_expr, node.else_expr = cond[0], then_expr[0], else_expr[0]
+
+	if isinstance(node.cond, behav.IntLiteral):
+		if node.cond.value:
+			return then_expr
+
+		return else_expr
+
+	return (node, cond[1] | then_expr[1] | else_expr[1], min(cond[2], then_expr[2], else_expr[2]),
+		_all(cond[3], then_expr[3], else_expr[3]))
+
+def return_(node: behav.Return, context: FusedContext):
+	if node.expr is not None:
+		expr = yield node.expr, context
+		node.expr = expr[0]
+		return node, expr[1], expr[2], expr[3]
+
+	return node, arch.FunctionThrows.NO, StaticType.RW, ()
+
+def unary_operation(node: behav.UnaryOperation, context: FusedContext):
+	right = yield node.right, context
+
+	node.right = right[0]
+	ret = expr_simplifier.fold_unary_operation(node)
+
+	if ret is node:
+		return (node,) + right[1:]
+	return _literal(ret)
+
+def named_reference(node: behav.NamedReference, results, context: FusedContext):
+	ret = expr_simplifier.named_reference(node, None)
+	if ret is not node:
+		return _literal(ret)
+
+	reference = node.reference
+
+	throws = arch.FunctionThrows.NO
+	if isinstance(reference, arch.Memory) and arch.MemoryAttribute.ETISS_CAN_FAIL in reference.attributes:
+		throws = arch.FunctionThrows.YES
+
+	if isinstance(reference, arch.Scalar):
+		return node, throws, reference.static, (reference,)
+
+	return node, throws, _SCALAR_STATIC_MAP.get(type(reference), StaticType.NONE), _FUNCTION_STATIC_MAP.get(type(reference), False)
+
+def indexed_reference(node: behav.IndexedReference, context: FusedContext):
+	index = yield node.index, context
+	node.index = index[0]
+
+	if isinstance(node.reference, arch.Memory) and arch.MemoryAttribute.ETISS_CAN_FAIL in node.reference.attributes:
+		throws = arch.FunctionThrows.YES
+	else:
+		throws = index[1]
+
+	return node, throws, StaticType.NONE, False
+
+def type_conv(node: behav.TypeConv, context: FusedContext):
+	expr = yield node.expr, context
+	node.expr = expr[0]
+
+	if isinstance(node.expr, behav.IntLiteral):
+		return _literal(expr_simplifier.fold_type_conv(node))
+
+	return (node,) + expr[1:]
+
+def callable_(node: behav.Callable, context: FusedContext):
+	args = []
+	for arg in node.args:
+		args.append((yield arg, context))
+	node.args = [x[0] for x in args]
+
+	ref = node.ref_or_name
+
+	throws = reduce(or_, [x[1] for x in args] + [ref.throws])
+	static = min([x[2] for x in args] + [StaticType.READ if ref.static else StaticType.NONE])
+
+	return node, throws, static, _all(*(x[3] for x in args), _static(ref.static))
+
+def group(node: behav.Group, context: FusedContext):
+	expr = yield node.expr, context
+	node.expr = expr[0]
+
+	if isinstance(node.expr, behav.IntLiteral):
+		return expr
+
+	return (node,) + expr[1:]